@@ -1,10 +1,31 @@
 import os
-import json
-import shutil
+import re
+import asyncio
+import hashlib
+from collections import OrderedDict
 import server
-import time
 from aiohttp import web
 import folder_paths
+from .thumbnails import ThumbnailCache, THUMB_SIZES, THUMB_FORMATS, THUMB_QUALITY, FULL_SIZE
+from .zipstream import ZipStream, Member, unique_names
+from .file_index import FileIndex, SORT_KEYS
+from .file_watcher import DirectoryWatcher
+from .event_hub import EventHub
+from .prompts import PromptEvents, PromptError, queue_prompt, compile_prompt, randomize_seeds, build_pnginfo, add_queue_listener, set_dispatcher
+from .runner import AutomationRunner
+from .batch import BatchManager, build_axes, expand
+from .storage import Storage
+from .session import Session, SessionConflict
+from .backups import BackupStore
+from .object_info import ObjectInfoCache
+from .bridge import ImageBridge, MAX_BATCH as MAX_BRIDGE_BATCH
+from .metadata_index import MetadataIndex
+from .ledger import JobLedger
+from .relay import PreviewRelay
+from .backends import BackendPool
+from .catalog import LibraryCatalog
+from .assets import AssetManifest, respond_variants, cached_json, not_modified
+from .metrics import REGISTRY, TEXT_CONTENT_TYPE, metrics_middleware, mark_prepared, watch_loop_lag, scrape_reset
 
 # 1. Setup Directories
 current_dir = os.path.dirname(os.path.realpath(__file__))
@@ -13,138 +34,115 @@ WORKFLOWS_DIR = os.path.join(WEBROOT, "workflows")
 META_DIR = os.path.join(WORKFLOWS_DIR, "meta") 
 BACKUPS_DIR = os.path.join(WEBROOT, "backups")
 AUTOMATIONS_DIR = os.path.join(WEBROOT, "automations") 
+CACHE_DIR = os.path.join(current_dir, "cache")
 OUTPUT_DIR = folder_paths.get_output_directory()
 
-for d in [WORKFLOWS_DIR, META_DIR, BACKUPS_DIR, AUTOMATIONS_DIR]:
+for d in [WORKFLOWS_DIR, META_DIR, BACKUPS_DIR, AUTOMATIONS_DIR, CACHE_DIR]:
     if not os.path.exists(d): os.makedirs(d)
 
 print(f"### ComfyMini: Initializing...")
 
-# --- UTILS ---
-def split_workflow_data(full_data):
-    """Separates Logic (Nodes/Links) from Layout (Pos/Groups)"""
-    if not isinstance(full_data, dict):
-        return full_data, {}
-
-    logic_data = {}
-    meta_data = {}
-
-    for node_id, node in full_data.items():
-        if not isinstance(node, dict): 
-            # Keep top-level keys like 'version' or 'extra' in logic
-            logic_data[node_id] = node
-            continue 
-
-        logic_node = {
-            "inputs": node.get("inputs", {}),
-            "class_type": node.get("class_type", ""),
-        }
-        
-        if node.get("class_type") == "MiniGroup":
-            meta_data[node_id] = node
-        else:
-            logic_data[node_id] = logic_node
-            if "_meta" in node:
-                meta_data[node_id] = { "_meta": node["_meta"] }
+# All workflow/meta/groups/layout/automation/favorites I/O goes through here, off the event loop
+storage = Storage(WEBROOT, WORKFLOWS_DIR, META_DIR, AUTOMATIONS_DIR)
+# The active workflow lives in memory; saves are versioned and flushed to disk debounced
+session = Session(storage)
+backup_store = BackupStore(BACKUPS_DIR)
+# Per-workflow summaries for the home page, re-parsed only for files that changed
+library_catalog = LibraryCatalog(WORKFLOWS_DIR, META_DIR, os.path.join(CACHE_DIR, "library_catalog.json"))
 
-    return logic_data, meta_data
-
-def merge_workflow_data(logic_data, meta_data):
-    if not isinstance(logic_data, dict):
-        return logic_data
-        
-    merged = {}
-    for node_id, node in logic_data.items():
-        merged[node_id] = node
-        if node_id in meta_data and isinstance(node, dict):
-            if "_meta" in meta_data[node_id]:
-                merged[node_id] = node.copy() 
-                merged[node_id]["_meta"] = meta_data[node_id]["_meta"]
-
-    for node_id, node in meta_data.items():
-        if node_id not in merged:
-            merged[node_id] = node
-            
-    return merged
+# --- UTILS ---
+def get_media_dir(folder_type):
+    if folder_type == "input": return folder_paths.get_input_directory()
+    if folder_type == "temp": return folder_paths.get_temp_directory()
+    return OUTPUT_DIR
+
+def resolve_media_path(folder_type, *parts):
+    """Joins parts under the output/input/temp base dir. Returns None if the result escapes it."""
+    base = os.path.abspath(get_media_dir(folder_type))
+    target = os.path.abspath(os.path.join(base, *parts))
+    if os.path.commonpath([base, target]) != base: return None
+    return target
+
+# Pages and static files are served from memory with asset references rewritten to hashed URLs
+PAGES = ("home.html", "index.html", "gallery.html", "editor.html", "automation.html")
+asset_manifest = AssetManifest(WEBROOT, ("js", "shared"), ("fooocus_styles.json",), PAGES)
 
 # --- Page Routes ---
 @server.PromptServer.instance.routes.get("/mini")
-async def serve_home(request): return web.FileResponse(os.path.join(WEBROOT, "home.html"))
+async def serve_home(request): return await asset_manifest.respond(request, "home.html")
 @server.PromptServer.instance.routes.get("/mini/run")
-async def serve_runner(request): return web.FileResponse(os.path.join(WEBROOT, "index.html"))
+async def serve_runner(request): return await asset_manifest.respond(request, "index.html")
 @server.PromptServer.instance.routes.get("/mini/gallery")
-async def serve_gallery(request): return web.FileResponse(os.path.join(WEBROOT, "gallery.html"))
+async def serve_gallery(request): return await asset_manifest.respond(request, "gallery.html")
 @server.PromptServer.instance.routes.get("/mini/editor")
-async def serve_editor(request): return web.FileResponse(os.path.join(WEBROOT, "editor.html"))
+async def serve_editor(request): return await asset_manifest.respond(request, "editor.html")
 @server.PromptServer.instance.routes.get("/mini/automation")
-async def serve_automation(request): return web.FileResponse(os.path.join(WEBROOT, "automation.html"))
+async def serve_automation(request): return await asset_manifest.respond(request, "automation.html")
 
 # --- Static & Data ---
-server.PromptServer.instance.routes.static("/mini/js", path=os.path.join(WEBROOT, "js"))
-server.PromptServer.instance.routes.static("/mini/shared", path=os.path.join(WEBROOT, "shared"))
+@server.PromptServer.instance.routes.get("/mini/assets/{path:.+}")
+async def serve_hashed_asset(request): return await asset_manifest.respond_hashed(request, request.match_info["path"])
+@server.PromptServer.instance.routes.get("/mini/js/{path:.+}")
+async def serve_js(request): return await asset_manifest.respond(request, "js/" + request.match_info["path"])
+@server.PromptServer.instance.routes.get("/mini/shared/{path:.+}")
+async def serve_shared(request): return await asset_manifest.respond(request, "shared/" + request.match_info["path"])
 
 @server.PromptServer.instance.routes.get("/mini/workflow.json")
 async def serve_workflow(request):
     try:
-        wf_path = os.path.join(WEBROOT, "workflow.json")
-        meta_path = os.path.join(WEBROOT, "workflow.meta.json")
-        logic = {}; meta = {}
-        
-        if os.path.exists(wf_path):
-            with open(wf_path, 'r', encoding='utf-8') as f: logic = json.load(f)
-            
-        if os.path.exists(meta_path):
-            try:
-                with open(meta_path, 'r', encoding='utf-8') as f: meta = json.load(f)
-            except: 
-                print("[ComfyMini] Warning: workflow.meta.json corrupted, ignoring.")
-                meta = {}
-            
-        return web.json_response(merge_workflow_data(logic, meta))
+        version, workflow = await session.snapshot(copy=False)
+        return cached_json(request, workflow, f'"wf-{version}"', {"X-Mini-Version": str(version)})
     except Exception as e:
         return web.json_response({})
 
 @server.PromptServer.instance.routes.get("/mini/layout.json")
 async def serve_layout(request):
-    path = os.path.join(WEBROOT, "layout.json")
-    if os.path.exists(path): return web.FileResponse(path)
-    return web.json_response([])
+    try: return cached_json(request, await storage.run(storage.read_layout, False))
+    except Exception: return web.json_response([])
 
 @server.PromptServer.instance.routes.get("/mini/fooocus_styles.json")
-async def serve_styles(request): return web.FileResponse(os.path.join(WEBROOT, "fooocus_styles.json"))
+async def serve_styles(request): return await asset_manifest.respond(request, "fooocus_styles.json")
 
 # --- API ---
 @server.PromptServer.instance.routes.get("/mini/list_workflows")
 async def list_workflows(request):
     try:
-        if not os.path.exists(WORKFLOWS_DIR):
-            return web.json_response({"workflows": []})
-        files = [f for f in os.listdir(WORKFLOWS_DIR) if f.endswith('.json') and os.path.isfile(os.path.join(WORKFLOWS_DIR, f))]
-        files.sort(key=lambda x: os.path.getmtime(os.path.join(WORKFLOWS_DIR, x)), reverse=True)
-        return web.json_response({"workflows": files})
+        return cached_json(request, {"workflows": await storage.run(storage.list_library)})
+    except FileNotFoundError: return web.json_response({"workflows": []})
     except Exception as e: return web.json_response({"error": str(e)}, status=500)
 
+# Last runs / latest outputs per workflow, re-queried only after the ledger or metadata index wrote something
+library_runs = {"key": None, "runs": {}, "latest": {}}
+
+@server.PromptServer.instance.routes.get("/mini/library")
+async def get_library(request):
+    """The whole library with summaries, last run and latest output, filtered by `q` and sorted, in one response."""
+    loop = asyncio.get_running_loop()
+    q, sort, order = request.query.get("q", ""), request.query.get("sort", "mtime"), request.query.get("order", "desc")
+    try:
+        await storage.run(library_catalog.refresh)
+        key = (job_ledger.recorded, metadata_index.generation)
+        if key != library_runs["key"]:
+            runs, latest = await asyncio.gather(
+                loop.run_in_executor(None, job_ledger.last_runs), loop.run_in_executor(None, metadata_index.latest_by_origin))
+            library_runs.update(key=key, runs=runs, latest=latest)
+        etag = f'"lib-{library_catalog.version}-{key[0]}-{key[1]}-{hashlib.sha1(f"{q}|{sort}|{order}".encode("utf-8")).hexdigest()[:8]}"'
+        if not_modified(request, etag): return cached_json(request, None, etag)
+        workflows = library_catalog.listing(q, sort, order != "asc", library_runs["runs"], library_runs["latest"])
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    return cached_json(request, {"workflows": workflows, "total": len(workflows), "version": library_catalog.version}, etag)
+
 @server.PromptServer.instance.routes.get("/mini/get_workflow")
 async def get_workflow(request):
     filename = request.query.get("filename")
     if not filename: return web.json_response({"error": "No filename"}, status=400)
     try:
-        file_path = os.path.join(WORKFLOWS_DIR, filename)
-        if not os.path.exists(file_path):
-             return web.json_response({"error": "File not found"}, status=404)
-             
-        with open(file_path, 'r', encoding='utf-8') as f: 
-            logic = json.load(f)
-        
-        meta_filename = filename.replace('.json', '.meta.json')
-        meta_path = os.path.join(META_DIR, meta_filename)
-        meta = {}
-        if os.path.exists(meta_path):
-            try:
-                with open(meta_path, 'r', encoding='utf-8') as f: meta = json.load(f)
-            except Exception as e: pass
-        
-        return web.json_response(merge_workflow_data(logic, meta))
+        return cached_json(request, await storage.run(storage.read_library, filename, False))
+    except FileNotFoundError:
+        return web.json_response({"error": "File not found"}, status=404)
     except Exception as e: 
         return web.json_response({"error": f"Server Error: {str(e)}"}, status=500)
 
@@ -154,43 +152,12 @@ async def select_workflow(request):
         data = await request.json()
         filename = data.get("filename")
         if not filename: return web.json_response({"error": "No filename"}, status=400)
-        
-        src_path = os.path.join(WORKFLOWS_DIR, filename)
-        if not os.path.exists(src_path):
+        await session.flush()  # pending edits still belong to the previous origin
+        try:
+            await storage.run(storage.select, filename)
+        except FileNotFoundError:
             return web.json_response({"error": f"File {filename} not found"}, status=404)
-
-        with open(src_path, 'r', encoding='utf-8') as f:
-            full_data = json.load(f)
-
-        logic, meta = split_workflow_data(full_data)
-        
-        meta_filename = filename.replace('.json', '.meta.json')
-        src_meta = os.path.join(META_DIR, meta_filename)
-        if os.path.exists(src_meta):
-            try:
-                with open(src_meta, 'r', encoding='utf-8') as f:
-                    existing_meta = json.load(f)
-                    meta.update(existing_meta)
-            except: pass
-
-        meta["_mini_origin"] = filename
-
-        wf_target = os.path.join(WEBROOT, "workflow.json")
-        meta_target = os.path.join(WEBROOT, "workflow.meta.json")
-
-        if os.path.exists(wf_target): os.remove(wf_target)
-        if os.path.exists(meta_target): os.remove(meta_target)
-        time.sleep(0.1)
-
-        with open(wf_target, 'w', encoding='utf-8') as f:
-            json.dump(logic, f, indent=2)
-            os.fsync(f.fileno())
-            
-        with open(meta_target, 'w', encoding='utf-8') as f:
-            json.dump(meta, f, indent=2)
-            os.fsync(f.fileno())
-
-        return web.json_response({"status": "success"})
+        return web.json_response({"status": "success", "version": await session.reload()})
     except Exception as e: 
         return web.json_response({"error": str(e)}, status=500)
 
@@ -202,12 +169,13 @@ async def upload_workflow(request):
         filename = os.path.basename(field.filename)
         if not filename.endswith('.json'): filename += '.json'
         filename = os.path.basename(filename) 
-        
-        with open(os.path.join(WORKFLOWS_DIR, filename), 'wb') as f:
-            while True:
-                chunk = await field.read_chunk()
-                if not chunk: break
-                f.write(chunk)
+
+        chunks = []
+        while True:
+            chunk = await field.read_chunk()
+            if not chunk: break
+            chunks.append(chunk)
+        await storage.run(storage.write_library_raw, filename, b"".join(chunks))
         return web.json_response({"status": "success", "filename": filename})
     return web.json_response({"error": "No file"}, status=400)
 
@@ -218,108 +186,319 @@ async def delete_workflow(request):
         filename = data.get("filename", "")
         if not filename or not filename.endswith('.json'):
             return web.json_response({"error": "Invalid filename"}, status=400)
-
-        base = filename.replace('.json', '')
-        wf_path = os.path.join(WORKFLOWS_DIR, filename)
-        meta_path = os.path.join(META_DIR, f"{base}.meta.json")
-        groups_path = os.path.join(META_DIR, f"{base}.groups.json")
-
-        deleted = []
-        for p in [wf_path, meta_path, groups_path]:
-            if os.path.exists(p):
-                try: os.remove(p); deleted.append(os.path.basename(p))
-                except OSError as e: pass
-                continue
-            elif not os.path.exists(WORKFLOWS_DIR) and not os.path.exists(META_DIR):
-                return web.json_response({"error": f"Directory missing"}, status=500)
-
-        if filename not in deleted and not any(os.path.basename(p) in deleted for p in [wf_path, meta_path, groups_path]):
-            if os.path.exists(wf_path) or os.path.exists(meta_path) or os.path.exists(groups_path):
-                return web.json_response({"error": "Delete failed"}, status=500)
-
+        deleted = await storage.run(storage.delete_library, os.path.basename(filename))
         return web.json_response({"status": "deleted", "files": deleted})
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+file_index = FileIndex()
+# output/temp -> input for LoadImage: dedups against the input folder, links instead of copying
+image_bridge = ImageBridge(resolve_media_path, folder_paths.get_input_directory, file_index)
+# Prompt/seed/model metadata of every output PNG, kept current from the watcher's deltas
+metadata_index = MetadataIndex(os.path.join(CACHE_DIR, "metadata.sqlite3"), OUTPUT_DIR)
+metadata_index.start()
+event_hub = EventHub()
+
+def publish_file_changes(folder_type, subfolder, added, removed):
+    event_hub.publish("files", {
+        "type": folder_type, "subfolder": subfolder,
+        "added": [{ "filename": e.name, "subfolder": subfolder, "type": folder_type, "mtime": e.mtime_ns / 1e9, "size": e.size } for e in added],
+        "removed": removed,
+    })
+    if folder_type == "output": metadata_index.notify(subfolder, [e.name for e in added], removed)
+
+file_watcher = DirectoryWatcher(file_index, {"output": OUTPUT_DIR, "input": folder_paths.get_input_directory()}, publish_file_changes)
+file_watcher.start(server.PromptServer.instance.loop)
+
+@server.PromptServer.instance.routes.get("/mini/events")
+async def serve_events(request):
+    """Server-Sent Events stream. ?topics=files,... limits what the client receives."""
+    return await event_hub.handle(request)
+
 @server.PromptServer.instance.routes.get("/mini/files")
 async def list_files(request):
     folder_type = request.query.get("type", "output")  # "output" or "input"
     subfolder = request.query.get("path", "")
+    sort = request.query.get("sort", "name")  # "name", "mtime" or "size"
+    reverse = request.query.get("order", "desc") != "asc"
+    prefix = request.query.get("prefix", "")
+    cursor = request.query.get("cursor") or None
+    limit = request.query.get("limit")  # omitted -> whole folder in one response
+
+    if sort not in SORT_KEYS: return web.json_response({"error": f"Invalid sort '{sort}'"}, status=400)
+    try:
+        limit = max(1, min(int(limit), 1000)) if limit else None
+    except ValueError: return web.json_response({"error": "Invalid limit"}, status=400)
+
+    target_path = resolve_media_path(folder_type, subfolder)
+    if target_path is None: return web.json_response({"error": "Invalid"}, status=403)
     
-    if folder_type == "input":
-        src_dir = folder_paths.get_input_directory()
-    else:
-        src_dir = OUTPUT_DIR
-    
-    target_path = os.path.abspath(os.path.join(src_dir, subfolder))
-    allowed_base = os.path.abspath(src_dir)
-    if not target_path.startswith(allowed_base): return web.json_response({"error": "Invalid"}, status=403)
-    if not os.path.exists(target_path): return web.json_response({"path": subfolder, "folders": [], "images": []})
-    
-    folders = []; images = []
-    try:
-        for item in os.listdir(target_path):
-            if item.startswith('.'): continue
-            full_path = os.path.join(target_path, item)
-            if os.path.isdir(full_path): folders.append(item)
-            elif item.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.gif')):
-                images.append({ "filename": item, "subfolder": subfolder, "type": folder_type })
-        folders.sort(); images.sort(key=lambda x: x['filename'], reverse=True)
-        return web.json_response({"path": subfolder, "folders": folders, "images": images})
+    try:
+        idx = await file_index.get(target_path)
+        try:
+            entries, next_cursor, total = idx.page(sort, reverse, prefix, cursor, limit)
+        except (ValueError, TypeError): return web.json_response({"error": "Invalid cursor"}, status=400)
+        images = [{ "filename": e.name, "subfolder": subfolder, "type": folder_type, "mtime": e.mtime_ns / 1e9, "size": e.size } for e in entries]
+        return web.json_response({"path": subfolder, "folders": idx.folders, "images": images, "next_cursor": next_cursor, "total": total})
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+
+# --- METADATA SEARCH ---
+SEARCH_FILTERS = ("seed", "checkpoint", "lora", "sampler", "origin", "subfolder", "after", "before")
+
+@server.PromptServer.instance.routes.get("/mini/search")
+async def search_images(request):
+    """Output images by generation metadata, newest first. `q` also accepts seed:/model:/lora:/sampler:/workflow:/folder: tokens."""
+    filters = {key: request.query.get(key) for key in SEARCH_FILTERS if request.query.get(key)}
+    try:
+        images, next_cursor, total = await asyncio.get_running_loop().run_in_executor(
+            None, metadata_index.search, request.query.get("q", ""), filters,
+            request.query.get("cursor") or None, int(request.query.get("limit", 60)))
+    except (ValueError, TypeError) as e:
+        return web.json_response({"error": f"Invalid query: {e}"}, status=400)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response({"images": images, "next_cursor": next_cursor, "total": total, "index": metadata_index.status()})
+
+@server.PromptServer.instance.routes.get("/mini/search/status")
+async def search_status(request):
+    return web.json_response(metadata_index.status())
+
+@server.PromptServer.instance.routes.post("/mini/search/reindex")
+async def search_reindex(request):
+    metadata_index.reindex()
+    return web.json_response({"status": "queued"})
+
+# --- THUMBNAILS ---
+thumb_cache = ThumbnailCache(os.path.join(CACHE_DIR, "thumbs"))
+
+@server.PromptServer.instance.routes.get("/mini/thumb")
+async def serve_thumb(request):
+    filename = request.query.get("filename")
+    folder_type = request.query.get("type", "output")
+    size = request.query.get("size", "sm")
+    fmt = request.query.get("format", "webp")
+    if not filename: return web.json_response({"error": "No filename"}, status=400)
+    if size not in THUMB_SIZES or fmt not in THUMB_FORMATS:
+        return web.json_response({"error": "Invalid size or format"}, status=400)
+
+    src_path = resolve_media_path(folder_type, request.query.get("subfolder", ""), filename)
+    if src_path is None: return web.json_response({"error": "Invalid"}, status=403)
+
+    # A "v" param (source mtime) pins the URL to one version of the file
+    cache_control = "public, max-age=31536000, immutable" if request.query.get("v") else "public, max-age=3600"
+    try:
+        key = await thumb_cache.key_for(src_path, size, fmt)
+        etag = f'"{key}"'
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+
+        data = await thumb_cache.get(src_path, key, size, fmt)
+        return web.Response(body=data, content_type=THUMB_FORMATS[fmt][1], headers=headers)
+    except FileNotFoundError:
+        return web.json_response({"error": "Not found"}, status=404)
+    except Exception as e:
+        print(f"[ComfyMini] Thumbnail failed for {filename}: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+# --- ZIP DOWNLOAD (streamed, resumable; see zipstream.py) ---
+ZIP_MAX_FILES = 5000
+ZIP_EXTS = {"webp": ".webp", "jpeg": ".jpg"}
+ZIP_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Full-size conversions get their own LRU: a few archives would otherwise flush every gallery thumbnail
+zip_cache = ThumbnailCache(os.path.join(CACHE_DIR, "zip"), max_bytes=ZIP_CACHE_MAX_BYTES)
+# POSTed file lists, by content hash; in memory only, so their URLs stop working on restart
+zip_selections = OrderedDict()
+ZIP_SELECTIONS_MAX = 100
+
+def _zip_members(files):
+    """[(archive name, path)] -> Members for the files that still exist."""
+    members = []
+    for name, path in files:
+        if not os.path.isfile(path): continue
+        st = os.stat(path)
+        members.append(Member(name, path, st.st_mtime_ns, st.st_size))
+    return members
+
+def _favorite_files(names):
+    # Favorites are bare filenames from the output (or input) root
+    files = []
+    for name in names:
+        path = next((p for p in (resolve_media_path(t, name) for t in ("output", "input")) if p and os.path.isfile(p)), None)
+        if path: files.append((os.path.basename(name), path))
+    return files
+
+def _zip_file_list(items):
+    """Validated [(archive name, path)] from [{filename, subfolder, type}]. Raises PermissionError for paths outside the base dirs."""
+    if not isinstance(items, list) or not items: raise ValueError("No files")
+    if len(items) > ZIP_MAX_FILES: raise ValueError(f"At most {ZIP_MAX_FILES} files per archive")
+    files = []
+    for item in items:
+        filename, subfolder = str(item.get("filename") or ""), str(item.get("subfolder") or "")
+        path = resolve_media_path(item.get("type", "output"), subfolder, filename) if filename else None
+        if path is None: raise PermissionError(f"Invalid path: {subfolder}/{filename}")
+        files.append((f"{subfolder}/{filename}" if subfolder else filename, path))
+    return files
+
+async def _zip_folder(query):
+    folder_type, subfolder = query.get("type", "output"), query.get("path", "")
+    target = resolve_media_path(folder_type, subfolder)
+    if target is None: raise PermissionError("Invalid path")
+    after, before = float(query.get("after") or 0), float(query.get("before") or "inf")
+    idx = await file_index.get(target)
+    entries = sorted((e for e in idx.files.values() if after <= e.mtime_ns / 1e9 <= before), key=lambda e: (e.mtime_ns, e.name))
+    if len(entries) > ZIP_MAX_FILES: raise ValueError(f"{len(entries)} files; at most {ZIP_MAX_FILES} per archive")
+    return [Member(e.name, os.path.join(target, e.name), e.mtime_ns, e.size) for e in entries]
+
+def _zip_range(request, etag, total):
+    """(start, stop) for a satisfiable Range, None to send everything, or False when unsatisfiable."""
+    if "Range" not in request.headers: return None
+    if request.headers.get("If-Range", etag) != etag: return None  # changed since the first part: start over
+    try: rng = request.http_range
+    except ValueError: return None
+    start, stop = rng.start, rng.stop
+    if start is None: return None
+    if start < 0: start, stop = max(total + start, 0), total
+    stop = total if stop is None else min(stop, total)
+    return (start, stop) if start < stop else False
+
+@server.PromptServer.instance.routes.post("/mini/download_zip")
+async def register_zip(request):
+    """{files: [{filename, subfolder, type}]} -> {id, url} for GET /mini/download_zip; the list is checked here."""
+    try:
+        data = await request.json()
+        files = _zip_file_list(data.get("files"))
+    except PermissionError as e: return web.json_response({"error": str(e)}, status=403)
+    except (ValueError, TypeError, AttributeError) as e: return web.json_response({"error": str(e)}, status=400)
+    selection_id = hashlib.sha1(repr(files).encode("utf-8")).hexdigest()[:16]
+    zip_selections[selection_id] = files
+    zip_selections.move_to_end(selection_id)
+    while len(zip_selections) > ZIP_SELECTIONS_MAX: zip_selections.popitem(last=False)
+    return web.json_response({"id": selection_id, "url": f"/mini/download_zip?id={selection_id}", "count": len(files)})
+
+@server.PromptServer.instance.routes.get("/mini/download_zip")
+async def download_zip(request):
+    """?id= (from POST) | favorites=1 | type=&path=&after=&before= ; format=original|webp|jpeg, quality=, name="""
+    q = request.query
+    fmt = q.get("format", "original")
+    if fmt != "original" and fmt not in THUMB_FORMATS: return web.json_response({"error": f"Invalid format '{fmt}'"}, status=400)
+    try:
+        quality = max(10, min(int(q.get("quality") or THUMB_QUALITY), 100))
+        loop = asyncio.get_running_loop()
+        if q.get("id"):
+            files = zip_selections.get(q["id"])
+            if files is None: return web.json_response({"error": "Unknown or expired id"}, status=404)
+            members = await loop.run_in_executor(None, _zip_members, files)
+        elif q.get("favorites"):
+            names = await storage.run(storage.read_favorites, False)
+            members = await loop.run_in_executor(None, lambda: _zip_members(_favorite_files(names[:ZIP_MAX_FILES])))
+        else:
+            members = await _zip_folder(q)
+    except PermissionError as e: return web.json_response({"error": str(e)}, status=403)
+    except ValueError as e: return web.json_response({"error": str(e)}, status=400)
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+    if not members: return web.json_response({"error": "No files"}, status=404)
+
+    convert = None
+    if fmt != "original":
+        for m in members: m.name = os.path.splitext(m.name)[0] + ZIP_EXTS[fmt]
+        async def convert(m):
+            key = await zip_cache.key_for(m.src, FULL_SIZE, fmt, quality)
+            return await zip_cache.render_path(m.src, key, FULL_SIZE, fmt, quality)
+    for m, name in zip(members, unique_names([m.name for m in members])): m.name = name
+
+    stream = ZipStream(members, convert)
+    etag = f'"{stream.etag(fmt, quality)}"'
+    name = re.sub(r'[^\w.-]+', "_", q.get("name") or ("favorites" if q.get("favorites") else "ComfyMini")).strip("._") or "ComfyMini"
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "no-cache",
+               "Content-Type": "application/zip", "Content-Disposition": f'attachment; filename="{name}.zip"'}
+    window, total = None, None
+    try:
+        # Converted sizes are only known after encoding, so a plain download streams chunked as it converts;
+        # a resume converts (or finds in the cache) everything first to place the range.
+        if "Range" in request.headers and request.headers.get("If-Range", etag) == etag: await stream.prepare()
+        if stream.sized:
+            total = stream.total_size()
+            window = _zip_range(request, etag, total)
+            if window is False:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{total}", "ETag": etag})
+    except Exception as e:
+        print(f"[ComfyMini] ZIP download failed: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+    resp = web.StreamResponse(status=206 if window else 200, headers=headers)
+    start, stop = window or (0, total)
+    if window: resp.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{total}"
+    if total is not None: resp.content_length = stop - start
+    await resp.prepare(request)
+    if request.method == "HEAD": return resp
+    try:
+        async for chunk in stream.chunks(start, stop): await resp.write(chunk)
+    except ConnectionResetError: return resp
+    except Exception as e:
+        # Headers are out; dropping the connection is the only way to tell the client the archive is incomplete
+        print(f"[ComfyMini] ZIP download aborted: {e}")
+        raise
+    await resp.write_eof()
+    return resp
+
+# --- OBJECT INFO ---
+object_info_cache = ObjectInfoCache(server.PromptServer.instance)
+
+@server.PromptServer.instance.routes.get("/mini/object_info")
+async def serve_object_info(request):
+    """Cached /object_info. ?classes=A,B returns only those node types; ?refresh=1 forces a rebuild."""
+    classes = [c for c in request.query.get("classes", "").split(",") if c]
+    try:
+        etag, variants = await object_info_cache.body(request, classes, request.query.get("refresh") == "1")
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    return respond_variants(request, etag, variants, "application/json")
+
+@server.PromptServer.instance.routes.get("/mini/input_images")
+async def list_input_images(request):
+    """LoadImage choices from the input-folder index, without building the whole object_info."""
+    try:
+        idx = await file_index.get(folder_paths.get_input_directory())
+        entries, _, _ = idx.page("name", False, "", None, None)
+        # versions let the client build stable /view URLs that still change when a file is overwritten
+        return cached_json(request, {"images": [e.name for e in entries], "versions": {e.name: e.mtime_ns // 1000000 for e in entries}})
     except Exception as e: return web.json_response({"error": str(e)}, status=500)
 
 @server.PromptServer.instance.routes.post("/mini/save_workflow")
 async def save_active_workflow(request):
     try:
         full_data = await request.json()
-        
-        # Check payload first for origin, fallback to disk
-        origin_file = full_data.get("_mini_origin")
-        
-        logic, meta = split_workflow_data(full_data)
-        
         suffix = request.query.get("suffix", "")
-        target_filename = f"workflow{suffix}.json"
-        target_meta_filename = f"workflow{suffix}.meta.json"
-
-        current_meta_path = os.path.join(WEBROOT, "workflow.meta.json")
-        
-        # If payload didn't have origin, try loading from existing meta
-        if not origin_file and os.path.exists(current_meta_path):
-            try:
-                with open(current_meta_path, 'r', encoding='utf-8') as f:
-                    old_meta = json.load(f)
-                    if "_mini_origin" in old_meta: 
-                        origin_file = old_meta["_mini_origin"]
-            except: pass
-            
-        # Ensure meta has the origin tag
-        if origin_file:
-            meta["_mini_origin"] = origin_file
-
-        with open(os.path.join(WEBROOT, target_filename), 'w', encoding='utf-8') as f: 
-            json.dump(logic, f, indent=2)
-            
-        with open(os.path.join(WEBROOT, target_meta_filename), 'w', encoding='utf-8') as f: 
-            json.dump(meta, f, indent=2)
-
-        # SYNC TO LIBRARY
-        if suffix == "" and origin_file:
-            print(f"[ComfyMini] Syncing save to library: {origin_file}")
-            with open(os.path.join(WORKFLOWS_DIR, origin_file), 'w', encoding='utf-8') as f:
-                json.dump(logic, f, indent=2)
-            
-            meta_name = origin_file.replace('.json', '.meta.json')
-            lib_meta = meta.copy()
-            if "_mini_origin" in lib_meta: del lib_meta["_mini_origin"]
-            
-            with open(os.path.join(META_DIR, meta_name), 'w', encoding='utf-8') as f:
-                json.dump(lib_meta, f, indent=2)
-
-        return web.json_response({"status": "success"})
+        if suffix:
+            await storage.run(storage.write_active, full_data, suffix)
+            return web.json_response({"status": "success"})
+        if not full_data.get("_mini_origin"):
+            # Keep the library origin when the client didn't send it
+            _, current = await session.snapshot(copy=False)
+            if current.get("_mini_origin"): full_data["_mini_origin"] = current["_mini_origin"]
+        version = await session.replace(full_data, request.query.get("version"))
+        return web.json_response({"status": "success", "version": version})
+    except SessionConflict as e:
+        return web.json_response({"status": "conflict", "version": e.version}, status=409)
     except Exception as e: 
         return web.json_response({"status": "error", "message": str(e)}, status=500)
 
+@server.PromptServer.instance.routes.post("/mini/session/patch")
+async def patch_session(request):
+    """JSON-patch delta against a session version: {base_version, ops: [{op, path, value}]}."""
+    try:
+        data = await request.json()
+        if "base_version" not in data: return web.json_response({"error": "No base_version"}, status=400)
+        version = await session.patch(data["base_version"], data.get("ops") or [])
+        return web.json_response({"status": "success", "version": version})
+    except SessionConflict as e:
+        return web.json_response({"status": "conflict", "version": e.version}, status=409)
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        return web.json_response({"error": f"Bad patch: {e}"}, status=400)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
 @server.PromptServer.instance.routes.post("/mini/save_library")
 async def save_library(request):
     try:
@@ -328,57 +507,73 @@ async def save_library(request):
         if not filename: return web.json_response({"status": "error", "message": "No filename"}, status=400)
         if not filename.endswith('.json'): filename += '.json'
 
-        logic, meta = split_workflow_data(full_data)
-        if "_mini_origin" in meta: del meta["_mini_origin"]
-
-        with open(os.path.join(WORKFLOWS_DIR, filename), 'w', encoding='utf-8') as f: json.dump(logic, f, indent=2)
-        meta_filename = filename.replace('.json', '.meta.json')
-        with open(os.path.join(META_DIR, meta_filename), 'w', encoding='utf-8') as f: json.dump(meta, f, indent=2)
+        await storage.run(storage.write_library, filename, full_data)
         return web.json_response({"status": "success", "file": filename})
     except Exception as e: return web.json_response({"status": "error", "message": str(e)}, status=500)
 
+# --- BACKUPS (content-addressed, see backups.py) ---
 @server.PromptServer.instance.routes.post("/mini/save_backup")
 async def save_backup(request):
     try:
-        full_data = await request.json()
-        logic, meta = split_workflow_data(full_data)
-        ts = int(time.time())
-        with open(os.path.join(BACKUPS_DIR, f"backup_{ts}.json"), 'w', encoding='utf-8') as f: json.dump(logic, f, indent=2)
-        with open(os.path.join(BACKUPS_DIR, f"backup_{ts}.meta.json"), 'w', encoding='utf-8') as f: json.dump(meta, f, indent=2)
-        return web.json_response({"status": "success", "file": f"backup_{ts}.json"})
+        full_data = await request.json() if request.can_read_body else None
+        if not full_data: _, full_data = await session.snapshot()  # no body: back up the active session
+        entry, created = await storage.run(backup_store.save, full_data, request.query.get("label"))
+        return web.json_response({"status": "success" if created else "unchanged", "id": entry["id"], "file": entry["id"]})
     except Exception as e: return web.json_response({"status": "error", "message": str(e)}, status=500)
 
+@server.PromptServer.instance.routes.get("/mini/backups")
+async def list_backups(request):
+    try:
+        return web.json_response({"backups": await storage.run(backup_store.list), "policy": await storage.run(backup_store.get_policy)})
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+
+@server.PromptServer.instance.routes.get("/mini/backups/get")
+async def get_backup(request):
+    try:
+        return web.json_response(await storage.run(backup_store.load, request.query.get("id", "")))
+    except KeyError: return web.json_response({"error": "Not found"}, status=404)
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+
+@server.PromptServer.instance.routes.post("/mini/backups/restore")
+async def restore_backup(request):
+    """Makes a backup the active session (saved through the normal debounced flush)."""
+    try:
+        data = await request.json()
+        workflow = await storage.run(backup_store.load, data.get("id", ""))
+        return web.json_response({"status": "success", "version": await session.replace(workflow)})
+    except KeyError: return web.json_response({"error": "Not found"}, status=404)
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+
+@server.PromptServer.instance.routes.get("/mini/backups/diff")
+async def diff_backup(request):
+    """Changes from backup `a` to backup `b`, or to the active session when `b` is omitted."""
+    try:
+        other = request.query.get("b")
+        if not other: _, other = await session.snapshot(copy=False)
+        return web.json_response(await storage.run(backup_store.diff, request.query.get("a", ""), other))
+    except KeyError: return web.json_response({"error": "Not found"}, status=404)
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+
+@server.PromptServer.instance.routes.post("/mini/backups/policy")
+async def set_backup_policy(request):
+    try:
+        data = await request.json()
+        return web.json_response({"policy": await storage.run(backup_store.set_policy, data)})
+    except (ValueError, TypeError) as e: return web.json_response({"error": str(e)}, status=400)
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+
 @server.PromptServer.instance.routes.post("/mini/save_layout")
 async def save_layout(request):
     data = await request.json()
-    with open(os.path.join(WEBROOT, "layout.json"), 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
+    await storage.run(storage.write_layout, data)
     return web.json_response({"status": "success"})
 
 @server.PromptServer.instance.routes.get("/mini/load_groups")
 async def load_groups(request):
     try:
-        target_filename = request.query.get("filename")
-        if not target_filename:
-            meta_path = os.path.join(WEBROOT, "workflow.meta.json")
-            if os.path.exists(meta_path):
-                with open(meta_path, 'r', encoding='utf-8') as f:
-                    meta = json.load(f)
-                    if "_mini_origin" in meta:
-                        target_filename = meta["_mini_origin"]
-        
+        target_filename = request.query.get("filename") or await storage.run(storage.active_origin)
         if not target_filename: return web.json_response([])
-
-        if target_filename.endswith('.json'):
-            target_filename = target_filename[:-5]
-        
-        group_file = target_filename + ".groups.json"
-        groups_path = os.path.join(META_DIR, group_file)
-        
-        if os.path.exists(groups_path):
-            with open(groups_path, 'r', encoding='utf-8') as f:
-                return web.json_response(json.load(f))
-        
-        return web.json_response([])
+        return cached_json(request, await storage.run(storage.read_groups, target_filename, False))
     except Exception as e:
         print(f"Error loading groups: {e}")
         return web.json_response([])
@@ -391,15 +586,7 @@ async def save_groups(request):
         groups = data.get("groups")
         
         if not filename: return web.json_response({"error": "No filename provided"}, status=400)
-
-        if filename.endswith('.json'): filename = filename[:-5]
-        target_filename = filename + ".groups.json"
-        
-        save_path = os.path.join(META_DIR, target_filename)
-        
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(groups, f, indent=2)
-            
+        await storage.run(storage.write_groups, filename, groups)
         return web.json_response({"status": "success"})
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
@@ -418,9 +605,7 @@ async def save_automation(request):
         filename = f"{safe_name}.json"
         
         save_data = [{ "filename": step["filename"], "connectedOutput": step.get("connectedOutput"), "connectedInput": step.get("connectedInput") } for step in queue]
-        
-        with open(os.path.join(AUTOMATIONS_DIR, filename), 'w', encoding='utf-8') as f:
-            json.dump(save_data, f, indent=2)
+        await storage.run(storage.write_automation, filename, save_data)
             
         return web.json_response({"status": "success", "file": filename})
     except Exception as e:
@@ -429,10 +614,7 @@ async def save_automation(request):
 @server.PromptServer.instance.routes.get("/mini/list_automations")
 async def list_automations(request):
     try:
-        if not os.path.exists(AUTOMATIONS_DIR):
-            return web.json_response({"automations": []})
-        files = [f for f in os.listdir(AUTOMATIONS_DIR) if f.endswith('.json')]
-        return web.json_response({"automations": files})
+        return cached_json(request, {"automations": await storage.run(storage.list_automations)})
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
@@ -441,12 +623,9 @@ async def load_automation(request):
     filename = request.query.get("filename")
     if not filename: return web.json_response({"error": "No filename"}, status=400)
     try:
-        path = os.path.join(AUTOMATIONS_DIR, filename)
-        if not os.path.exists(path): return web.json_response({"error": "Not found"}, status=404)
-        
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return web.json_response(data)
+        return cached_json(request, await storage.run(storage.read_automation, filename, False))
+    except FileNotFoundError:
+        return web.json_response({"error": "Not found"}, status=404)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
@@ -460,41 +639,233 @@ async def bridge_image(request):
         
         if not filename: return web.json_response({"error": "No filename"}, status=400)
 
-        # Resolve Source
-        if folder_type == "output":
-            src_dir = folder_paths.get_output_directory()
-        else:
-            src_dir = folder_paths.get_temp_directory()
-            
-        src_path = os.path.join(src_dir, subfolder, filename)
-        
-        # Resolve Dest (Input)
-        input_dir = folder_paths.get_input_directory()
-        dest_path = os.path.join(input_dir, filename) 
-        
-        # Handle collision with timestamp
-        if os.path.exists(dest_path):
-            base, ext = os.path.splitext(filename)
-            dest_path = os.path.join(input_dir, f"{base}_{int(time.time())}{ext}")
-            
-        if os.path.exists(src_path):
-            shutil.copy(src_path, dest_path)
-            print(f"[ComfyMini] Bridged image {filename} to Input folder.")
-            return web.json_response({"filename": os.path.basename(dest_path)})
-            
-        return web.json_response({"error": "Source file not found"}, status=404)
+        bridged = await image_bridge.bridge_one(filename, subfolder, folder_type)
+        return web.json_response({"filename": bridged})
+    except FileNotFoundError as e:
+        return web.json_response({"error": str(e)}, status=404)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+@server.PromptServer.instance.routes.post("/mini/bridge_images")
+async def bridge_images(request):
+    """Batch form: {images: [{filename, subfolder, type}]} -> {results: [{filename, method} | {error}]} in order."""
+    try:
+        images = (await request.json()).get("images") or []
+        if not isinstance(images, list) or len(images) > MAX_BRIDGE_BATCH:
+            return web.json_response({"error": f"images must be a list of at most {MAX_BRIDGE_BATCH}"}, status=400)
+        return web.json_response({"results": await image_bridge.bridge(images)})
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
 
-# --- FAVORITES (server-side, shared across devices via workflow library) ---
-FAVORITES_FILE = os.path.join(WEBROOT, "favorites.json")
+# Server-side runner: chains keep going when the browser tab is closed
+prompt_events = PromptEvents(server.PromptServer.instance)
+# Every prompt queued through /mini, with per-node timings, for /mini/stats
+job_ledger = JobLedger(os.path.join(CACHE_DIR, "jobs.sqlite3"))
+job_ledger.start(prompt_events)
+add_queue_listener(job_ledger.on_queued)
+# Prompts queued through /mini go to the least-loaded of this and the configured ComfyUI instances
+backend_pool = BackendPool(server.PromptServer.instance, prompt_events, os.path.join(WEBROOT, "backends.json"), resolve_media_path)
+set_dispatcher(backend_pool)
+automation_runner = AutomationRunner(
+    server.PromptServer.instance, prompt_events,
+    lambda filename: storage.run(storage.read_library, filename),
+    lambda filename, workflow: storage.run(storage.write_library, filename, workflow),
+    image_bridge.bridge_one, event_hub.publish)
+
+@server.PromptServer.instance.routes.post("/mini/automation/start")
+async def start_automation(request):
+    try:
+        data = await request.json()
+        name = data.get("name") or data.get("filename") or "Ad-hoc"
+        steps = data.get("queue")
+        if steps is None and data.get("filename"):
+            try: steps = await storage.run(storage.read_automation, data["filename"])
+            except FileNotFoundError: return web.json_response({"error": "Not found"}, status=404)
+        if not steps: return web.json_response({"error": "No steps"}, status=400)
+        if any(not s.get("filename") for s in steps):
+            return web.json_response({"error": "Every step needs a filename"}, status=400)
+
+        run = automation_runner.start(name, steps, data.get("client_id"))
+        return web.json_response({"run_id": run.run_id, "run": run.to_dict()})
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+@server.PromptServer.instance.routes.get("/mini/automation/status")
+async def automation_status(request):
+    run = automation_runner.get(request.query.get("run_id"))
+    if not run: return web.json_response({"error": "Not found"}, status=404)
+    return web.json_response(run.to_dict())
+
+@server.PromptServer.instance.routes.get("/mini/automation/runs")
+async def automation_runs(request):
+    runs = [{k: v for k, v in r.to_dict().items() if k != "steps"} for r in reversed(automation_runner.runs.values())]
+    return web.json_response({"runs": runs})
 
+@server.PromptServer.instance.routes.post("/mini/automation/cancel")
+async def cancel_automation(request):
+    try:
+        data = await request.json()
+        run = automation_runner.get(data.get("run_id"))
+        if not run: return web.json_response({"error": "Not found"}, status=404)
+        return web.json_response({"cancelled": automation_runner.cancel(run)})
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+# --- BACKENDS ---
+@server.PromptServer.instance.routes.get("/mini/backends")
+async def get_backends(request):
+    return web.json_response(backend_pool.to_dict())
+
+@server.PromptServer.instance.routes.post("/mini/backends")
+async def set_backends(request):
+    try:
+        config = backend_pool.set_config(await request.json())
+        await storage.run(backend_pool.save, config)
+        return web.json_response(backend_pool.to_dict())
+    except (ValueError, TypeError, AttributeError) as e: return web.json_response({"error": str(e)}, status=400)
+    except Exception as e: return web.json_response({"error": str(e)}, status=500)
+
+
+# --- PREVIEW RELAY ---
+# /mini pages connect here instead of /ws: same messages, throttled previews and progress per client
+preview_relay = PreviewRelay(server.PromptServer.instance, prompt_events)
+
+@server.PromptServer.instance.routes.get("/mini/ws")
+async def relay_ws(request):
+    return await preview_relay.handle(request)
+
+
+# --- ONE-SHOT RUN ---
+@server.PromptServer.instance.routes.post("/mini/run")
+async def run_workflow(request):
+    """Randomize seeds, compile and queue in one request; the session is saved after the prompt is queued."""
+    try:
+        data = await request.json()
+        workflow = data.get("workflow")
+        # A posted workflow, or JSON-patch ops and/or plain {node_id: {key: value}} changes against the session.
+        # base_version is checked now and again (compare-and-swap) when committing after the prompt is queued,
+        # so a rejected run leaves the client's version valid and another device's edit is never overwritten.
+        try: base, patched = await session.patched(data.get("base_version"), [] if workflow is not None else data.get("ops") or [])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            return web.json_response({"error": f"Bad patch: {e}", "version": session.version}, status=400)
+        if workflow is None:
+            workflow = patched
+            for node_id, inputs in (data.get("changes") or {}).items():
+                node = workflow.get(str(node_id))
+                if not isinstance(node, dict): return web.json_response({"error": f"Unknown node {node_id}", "version": session.version}, status=400)
+                node.setdefault("inputs", {}).update(inputs)
+        if not isinstance(workflow, dict) or not workflow:
+            return web.json_response({"error": "No workflow", "version": session.version}, status=400)
+
+        if data.get("randomize", True): randomize_seeds(workflow)
+        try:
+            prompt_id, number = await queue_prompt(
+                server.PromptServer.instance, compile_prompt(workflow),
+                extra_data={"extra_pnginfo": build_pnginfo(workflow)},
+                client_id=data.get("client_id"), front=bool(data.get("front")))
+        except PromptError as e:
+            return web.json_response({"error": str(e), "node_errors": e.node_errors, "version": session.version}, status=400)
+
+        seeds = {nid: n["inputs"]["seed"] for nid, n in workflow.items()
+                 if isinstance(n, dict) and n.get("class_type") == "KSampler" and "seed" in n.get("inputs", {})}
+        try:
+            version = await session.replace(workflow, base)
+        except SessionConflict as e:
+            # Another device saved while the prompt was being queued: the run stands, the session keeps their edit
+            return web.json_response({"error": "conflict", "version": e.version, "prompt_id": prompt_id,
+                                      "number": number, "seeds": seeds}, status=409)
+        if data.get("groups") is not None:
+            storage.write_behind(storage.write_groups, workflow.get("_mini_origin") or "workflow", data["groups"])
+        return web.json_response({"prompt_id": prompt_id, "number": number, "seeds": seeds, "version": version})
+    except SessionConflict as e:
+        return web.json_response({"error": "conflict", "version": e.version}, status=409)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+# --- BATCH (parameter sweeps) ---
+batch_manager = BatchManager(server.PromptServer.instance, prompt_events, event_hub.publish)
+
+def load_style_names():
+    return [s["name"] for s in storage.files.read(os.path.join(WEBROOT, "fooocus_styles.json"), copy=False)]
+
+@server.PromptServer.instance.routes.post("/mini/batch")
+async def submit_batch(request):
+    try:
+        data = await request.json()
+        if not isinstance(data, dict): return web.json_response({"error": "Bad sweep: request must be an object"}, status=400)
+        filename = data.get("filename")
+        try:
+            if filename: workflow = await storage.run(storage.read_library, filename)
+            else: _, workflow = await session.snapshot()
+        except FileNotFoundError:
+            return web.json_response({"error": "Workflow not found"}, status=404)
+        if filename: workflow["_mini_origin"] = filename
+
+        mode = data.get("mode", "cartesian")
+        try:
+            style_names = await storage.run(load_style_names) if data.get("styles") else ()
+            assignments = expand(build_axes(workflow, data, style_names), mode)
+        except (ValueError, KeyError, TypeError) as e:
+            return web.json_response({"error": f"Bad sweep: {e}"}, status=400)
+
+        batch = await batch_manager.submit(workflow, assignments, filename or "workflow.json", mode,
+                                           data.get("client_id"), bool(data.get("front")))
+        return web.json_response({
+            "batch_id": batch.batch_id, "total": len(batch.items),
+            "items": [{"index": i["index"], "prompt_id": i["prompt_id"], "params": i["params"], "error": i["error"]} for i in batch.items],
+        })
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+@server.PromptServer.instance.routes.get("/mini/batch/status")
+async def batch_status(request):
+    batch = batch_manager.get(request.query.get("batch_id"))
+    if not batch: return web.json_response({"error": "Not found"}, status=404)
+    return web.json_response(batch.to_dict())
+
+@server.PromptServer.instance.routes.post("/mini/batch/cancel")
+async def cancel_batch(request):
+    try:
+        data = await request.json()
+        batch = batch_manager.get(data.get("batch_id"))
+        if not batch: return web.json_response({"error": "Not found"}, status=404)
+        return web.json_response({"cancelled": batch_manager.cancel(batch)})
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+# --- JOB LEDGER ---
+@server.PromptServer.instance.routes.get("/mini/stats")
+async def job_stats(request):
+    """Duration p50/p95 per workflow and node, queue wait and throughput over the last `days`."""
+    try:
+        stats = await asyncio.get_running_loop().run_in_executor(
+            None, job_ledger.stats, float(request.query.get("days", 7)), request.query.get("origin") or None,
+            request.query.get("bucket", "hour"), int(request.query.get("top", 30)))
+    except (ValueError, TypeError) as e:
+        return web.json_response({"error": f"Invalid query: {e}"}, status=400)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response(stats)
+
+@server.PromptServer.instance.routes.get("/mini/jobs")
+async def list_jobs(request):
+    try:
+        jobs = await asyncio.get_running_loop().run_in_executor(
+            None, job_ledger.jobs, request.query.get("origin") or None, int(request.query.get("limit", 50)))
+    except ValueError as e:
+        return web.json_response({"error": f"Invalid query: {e}"}, status=400)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response({"jobs": jobs})
+
+# --- FAVORITES (server-side, shared across devices via workflow library) ---
 @server.PromptServer.instance.routes.get("/mini/load_favorites")
 async def load_favorites(request):
     try:
-        if not os.path.exists(FAVORITES_FILE): return web.json_response([])
-        with open(FAVORITES_FILE, 'r', encoding='utf-8') as f: return web.json_response(json.load(f))
+        return cached_json(request, await storage.run(storage.read_favorites, False))
     except Exception as e:
         print(f"[ComfyMini] Error loading favorites: {e}")
         return web.json_response([])
@@ -503,13 +874,54 @@ async def load_favorites(request):
 async def save_favorites(request):
     try:
         data = await request.json()
-        list_data = data.get("list", [])
-        with open(FAVORITES_FILE, 'w', encoding='utf-8') as f: json.dump(list_data, f)
+        await storage.run(storage.write_favorites, data.get("list", []))
         return web.json_response({"status": "success"})
     except Exception as e:
         print(f"[ComfyMini] Error saving favorites: {e}")
         return web.json_response({"error": str(e)}, status=500)
 
 
+# --- METRICS ---
+try:
+    server.PromptServer.instance.app.middlewares.append(metrics_middleware)
+    server.PromptServer.instance.app.on_response_prepare.append(mark_prepared)
+except RuntimeError as e:  # app already frozen (loaded after startup): collectors still work, per-route timing doesn't
+    print(f"[ComfyMini] Request metrics disabled: {e}")
+server.PromptServer.instance.loop.create_task(watch_loop_lag())
+
+@REGISTRY.collector
+def collect_cache_stats():
+    caches = {"json": storage.files, "file_index": file_index, "thumbs": thumb_cache, "zip": zip_cache}
+    return [
+        ("mini_cache_hits_total", "counter", "Cache hits by cache.", [({"cache": k}, c.hits) for k, c in caches.items()]),
+        ("mini_cache_misses_total", "counter", "Cache misses by cache.", [({"cache": k}, c.misses) for k, c in caches.items()]),
+        ("mini_cache_builds_total", "counter", "Full rebuilds of derived caches.",
+         [({"cache": "object_info"}, object_info_cache.builds), ({"cache": "assets"}, asset_manifest.builds),
+          ({"cache": "library_catalog"}, library_catalog.builds)]),
+        ("mini_bridge_images_total", "counter", "Images bridged into the input folder by method.",
+         [({"method": k}, v) for k, v in image_bridge.stats.items()]),
+        ("mini_session_flushes_total", "counter", "Session state writes to disk.", [({}, session.flushes)]),
+        ("mini_jobs_recorded_total", "counter", "Finished prompts written to the job ledger since startup.", [({}, job_ledger.recorded)]),
+        ("mini_backend_healthy", "gauge", "1 when the ComfyUI backend is reachable.",
+         [({"backend": b.name}, int(b.healthy)) for b in [backend_pool.local, *backend_pool.remotes.values()]]),
+        ("mini_backend_dispatched_total", "counter", "Prompts dispatched by backend.",
+         [({"backend": b.name}, b.dispatched) for b in [backend_pool.local, *backend_pool.remotes.values()]]),
+        ("mini_backend_failovers_total", "counter", "Prompts re-dispatched after a backend refused them or dropped.", [({}, backend_pool.failovers)]),
+        ("mini_relay_clients", "gauge", "Open /mini/ws connections.", [({}, len(preview_relay.clients))]),
+        ("mini_relay_frames_total", "counter", "Previews relayed to /mini/ws clients by result.",
+         [({"result": "sent"}, preview_relay.stats["frames_sent"]), ({"result": "dropped"}, preview_relay.stats["frames_dropped"])]),
+        ("mini_relay_messages_total", "counter", "JSON events relayed to /mini/ws clients by result.",
+         [({"result": "sent"}, preview_relay.stats["messages_sent"]), ({"result": "coalesced"}, preview_relay.stats["messages_coalesced"])]),
+        ("mini_metadata_indexed_images", "gauge", "Output images in the metadata index.", [({}, metadata_index.indexed)]),
+    ]
+
+@server.PromptServer.instance.routes.get("/mini/metrics")
+async def get_metrics(request):
+    """Prometheus text format; `?format=json` gives per-route p50/p95/p99 for the terminal console."""
+    if request.query.get("format") == "json": return web.json_response(REGISTRY.to_json())
+    body = REGISTRY.render_text()
+    scrape_reset()
+    return web.Response(body=body.encode("utf-8"), headers={"Content-Type": TEXT_CONTENT_TYPE, "Cache-Control": "no-store"})
+
 NODE_CLASS_MAPPINGS = {}
 NODE_DISPLAY_NAME_MAPPINGS = {}
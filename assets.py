@@ -0,0 +1,175 @@
+import os
+import re
+import gzip
+import json
+import asyncio
+import hashlib
+import mimetypes
+import posixpath
+import threading
+from collections import namedtuple
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+CHECK_INTERVAL = 2.0  # seconds between stat sweeps of the asset tree
+TEXT_EXTS = (".js", ".html", ".json", ".css", ".svg")
+REWRITE_EXTS = (".js", ".html")
+HASH_LEN = 12
+HASHED_RE = re.compile(r"^(.+)\.([0-9a-f]{%d})(\.\w+)$" % HASH_LEN)
+RELATIVE_IMPORT_RE = re.compile(r"""(['"])\./([\w.-]+\.js)\1""")
+
+Asset = namedtuple("Asset", ["rel", "digest", "url", "variants", "content_type"])
+
+
+# --- compression / conditional responses ---
+def compress_variants(raw):
+    variants = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=6)}
+    if brotli is not None: variants["br"] = brotli.compress(raw, quality=5)
+    return variants
+
+def pick_encoding(accept_encoding, variants):
+    accept = accept_encoding.lower()
+    for enc in ("br", "gzip"):
+        if enc in variants and enc in accept: return enc
+    return "identity"
+
+def not_modified(request, etag):
+    return etag in request.headers.get("If-None-Match", "")
+
+def respond_variants(request, etag, variants, content_type, cache_control=REVALIDATE):
+    """Serves the best precompressed variant for the client, or 304 when its ETag still matches."""
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if not_modified(request, etag): return web.Response(status=304, headers=headers)
+    encoding = pick_encoding(request.headers.get("Accept-Encoding", ""), variants)
+    if encoding != "identity": headers["Content-Encoding"] = encoding
+    return web.Response(body=variants[encoding], content_type=content_type, headers=headers)
+
+def cached_json(request, data, etag=None, headers=None):
+    """JSON for mutable data routes: must revalidate, 304 on If-None-Match.
+
+    Without an explicit etag (e.g. a session version) the body hash is used.
+    """
+    headers = dict(headers or {}, **{"Cache-Control": REVALIDATE, "Vary": "Accept-Encoding"})
+    if etag and not_modified(request, etag):
+        return web.Response(status=304, headers=dict(headers, ETag=etag))
+    body = json.dumps(data).encode("utf-8")
+    if not etag:
+        etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        if not_modified(request, etag): return web.Response(status=304, headers=dict(headers, ETag=etag))
+    resp = web.Response(body=body, content_type="application/json", headers=dict(headers, ETag=etag))
+    if len(body) > 1024: resp.enable_compression()
+    return resp
+
+
+class AssetManifest:
+    """Build-free asset versioning for the mini pages.
+
+    Every file under the asset dirs (plus the listed data files) is hashed and precompressed
+    in memory. References to `/mini/<rel>` inside JS and HTML, and relative `./x.js` imports,
+    are rewritten to `/mini/assets/<name>.<hash>.<ext>`, which is served immutable; a file's
+    hash covers its rewritten text, so changing app.js also re-versions whatever imports it.
+    Pages keep their routes and are revalidated by ETag. The tree is re-stat'ed at most every
+    CHECK_INTERVAL seconds and rebuilt when anything changed.
+    """
+
+    def __init__(self, webroot, dirs, files=(), pages=(), prefix="/mini"):
+        self.webroot = webroot
+        self.dirs = tuple(dirs)
+        self.files = tuple(files)
+        self.pages = tuple(pages)
+        self.prefix = prefix
+        self.assets = {}  # rel -> Asset (pages included, keyed by their file name)
+        self.builds = 0
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._build(self._scan())
+
+    # --- scanning / building ---
+    def _scan(self):
+        found = {}
+        rels = list(self.files) + list(self.pages)
+        for d in self.dirs:
+            for dirpath, _, names in os.walk(os.path.join(self.webroot, d)):
+                for name in names:
+                    if name.startswith('.'): continue
+                    rels.append(os.path.relpath(os.path.join(dirpath, name), self.webroot).replace(os.sep, "/"))
+        for rel in rels:
+            try: st = os.stat(os.path.join(self.webroot, rel))
+            except OSError: continue
+            found[rel] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def _build(self, stamp):
+        sources = {}
+        for rel in stamp:
+            try:
+                with open(os.path.join(self.webroot, rel), "rb") as f: sources[rel] = f.read()
+            except OSError: continue  # removed since the scan; the next sweep sees it
+        public = {f"{self.prefix}/{rel}": rel for rel in sources if rel not in self.pages}
+        ref_re = re.compile("(" + "|".join(re.escape(u) for u in sorted(public, key=len, reverse=True)) + r")(?![\w./-])") if public else None
+        assets = {}
+
+        def build(rel, stack):
+            if rel in assets: return assets[rel]
+            raw = sources[rel]
+            if rel.endswith(REWRITE_EXTS):
+                stack = stack | {rel}
+                def hashed(dep):
+                    return build(dep, stack).url if dep in sources and dep not in stack else None
+                def absolute(m):
+                    return hashed(public[m.group(1)]) or m.group(1)
+                def relative(m):
+                    url = hashed(posixpath.normpath(posixpath.join(posixpath.dirname(rel), m.group(2))))
+                    return f"{m.group(1)}{url}{m.group(1)}" if url else m.group(0)
+                text = raw.decode("utf-8")
+                if ref_re: text = ref_re.sub(absolute, text)
+                if rel.endswith(".js"): text = RELATIVE_IMPORT_RE.sub(relative, text)
+                raw = text.encode("utf-8")
+            digest = hashlib.sha256(raw).hexdigest()[:HASH_LEN]
+            base, ext = posixpath.splitext(rel)
+            content_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+            if ext == ".js": content_type = "application/javascript"
+            variants = compress_variants(raw) if rel.endswith(TEXT_EXTS) else {"identity": raw}
+            assets[rel] = Asset(rel, digest, f"{self.prefix}/assets/{base}.{digest}{ext}", variants, content_type)
+            return assets[rel]
+
+        for rel in sources: build(rel, frozenset())
+        self.assets = assets
+        self._stamp = stamp
+        self.builds += 1
+        print(f"[ComfyMini] Asset manifest built: {len(assets)} files")
+
+    async def refresh(self):
+        """Rebuilds (off the event loop) when a file was added, removed or modified."""
+        loop = asyncio.get_running_loop()
+        if loop.time() - self._checked < CHECK_INTERVAL: return
+        self._checked = loop.time()
+        await loop.run_in_executor(None, self._refresh_sync)
+
+    def _refresh_sync(self):
+        with self._lock:
+            stamp = self._scan()
+            if stamp != self._stamp: self._build(stamp)
+
+    # --- handlers ---
+    async def respond(self, request, rel, digest=None):
+        """Serves an asset. Immutable when requested by its current hash, revalidated otherwise."""
+        await self.refresh()
+        asset = self.assets.get(rel)
+        if asset is None: raise web.HTTPNotFound()
+        cache_control = IMMUTABLE if digest == asset.digest else REVALIDATE
+        return respond_variants(request, f'"{asset.digest}"', asset.variants, asset.content_type, cache_control)
+
+    async def respond_hashed(self, request, path):
+        """/mini/assets/<name>.<hash>.<ext>. A stale hash still gets the current file, just not cached for good."""
+        m = HASHED_RE.match(path)
+        if not m: raise web.HTTPNotFound()
+        return await self.respond(request, m.group(1) + m.group(3), m.group(2))
@@ -0,0 +1,535 @@
+import os
+import copy
+import json
+import time
+import uuid
+import struct
+import asyncio
+
+import aiohttp
+
+from .prompts import FAIL_EVENTS, put_local
+from .storage import write_atomic
+
+LOCAL = "local"
+HEALTH_INTERVAL = 5.0
+RECONNECT_MAX = 30.0
+FAILOVER_GRACE = 30.0  # seconds a backend may stay unreachable before its prompts go elsewhere
+WATCH_MISSES = 2  # consecutive failed queue polls before a backend counts as down
+REQUEST_TIMEOUT = 30
+DEFAULT_DURATION = 30.0  # seconds per job until a backend has finished one
+DURATION_ALPHA = 0.3  # weight of the newest job in the moving average
+# Remote events replayed through the local PromptServer; status stays remote (it is that box's queue)
+FORWARD_EVENTS = ("execution_start", "execution_cached", "executing", "executed", "progress", "progress_state",
+                  "execution_success", "execution_error", "execution_interrupted")
+MEDIA_TYPES = ("output", "temp")
+
+
+class BackendError(Exception):
+    pass
+
+
+def _is_finish(event, data):
+    return event in FAIL_EVENTS or (event == "executing" and data.get("node") is None)
+
+def _input_name(value):
+    """LoadImage-style value -> relative input path, or None. Handles the "name.png [input]" annotation."""
+    if not isinstance(value, str) or not value or "\n" in value or len(value) > 255: return None
+    if value.endswith(" [input]"): value = value[:-8]
+    return value if os.path.splitext(value)[1] else None
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, data)
+
+def _unique_path(path, tag):
+    """`path` if free, else name_<tag>.ext, name_<tag>_2.ext, ..."""
+    if not os.path.exists(path): return path
+    stem, ext = os.path.splitext(path)
+    candidate, n = f"{stem}_{tag}{ext}", 2
+    while os.path.exists(candidate):
+        candidate, n = f"{stem}_{tag}_{n}{ext}", n + 1
+    return candidate
+
+
+class Backend:
+    def __init__(self, name, url=None, enabled=True):
+        self.name = name
+        self.url = url.rstrip("/") if url else None
+        self.enabled = enabled
+        self.healthy = url is None  # the local instance is always reachable
+        self.error = None
+        self.remaining = 0  # queue depth as last reported by the backend
+        self.inflight = {}  # prompt_id -> queue item dispatched here and not finished
+        self.remote_ids = {}  # remote prompt_id -> ours, for servers that assign their own
+        self.running = None  # prompt_id executing there (binary previews carry no id)
+        self.duration = None
+        self.dispatched = 0
+        self.finished = 0
+        self.uploads = {}  # input name -> (mtime_ns, size)
+        self.orphans = set()  # remote ids failed over or cancelled while unreachable; removed there on reconnect
+        self.submitting = set()  # prompt ids whose POST /prompt hasn't answered yet
+        self.cancelling = set()  # prompt ids interrupted by the user; never failed over
+        self.misses = 0
+        self.ws = None
+        self.task = None
+        self.grace = None  # timer that fails over inflight prompts if the backend stays down
+
+    def load(self):
+        return max(self.remaining, len(self.inflight))
+
+    def score(self):
+        """Estimated wait for one more prompt: queue depth times the recent job duration."""
+        return (self.load() + 1) * (self.duration or DEFAULT_DURATION)
+
+    def record(self, seconds):
+        self.finished += 1
+        self.duration = seconds if self.duration is None else (1 - DURATION_ALPHA) * self.duration + DURATION_ALPHA * seconds
+
+    def to_dict(self):
+        return {"name": self.name, "url": self.url, "enabled": self.enabled, "healthy": self.healthy, "error": self.error,
+                "queue": self.load(), "inflight": len(self.inflight), "duration": self.duration,
+                "dispatched": self.dispatched, "finished": self.finished}
+
+
+class BackendPool:
+    """Spreads prompts queued through /mini over several ComfyUI instances.
+
+    Installed as the prompts dispatcher: every item passed to enqueue() goes to the healthy
+    backend (this instance included) with the lowest queue depth x recent job duration.
+    Before a remote submit, input images the prompt names are uploaded once per file
+    version. Each remote instance is followed over one websocket; its execution events are
+    replayed through the local PromptServer.send_sync, with output images downloaded into the
+    local output/temp folders first, so trackers, the ledger, the gallery and browser pages
+    can't tell where a prompt ran. A backend that drops gets FAILOVER_GRACE seconds to come
+    back: on reconnect its /queue and /history are checked, so prompts it still holds keep
+    running there and ones that finished meanwhile are replayed from history. Only prompts it
+    lost, or all of them once the grace runs out, are queued again on the next best backend
+    (a prompt that was mid-run starts over) and deleted from the old queue when it is reachable.
+    """
+
+    def __init__(self, prompt_server, events, config_path, resolve_media_path):
+        self.prompt_server = prompt_server
+        self.loop = prompt_server.loop
+        self.config_path = config_path
+        self.resolve_media_path = resolve_media_path
+        self.client_id = f"comfymini-pool-{uuid.uuid4().hex[:8]}"
+        self.local = Backend(LOCAL)
+        self.remotes = {}  # name -> Backend
+        self.use_local = True
+        self.assigned = {}  # prompt_id -> Backend
+        self.failovers = 0
+        self.outputs = 0
+        self._excluded = {}  # prompt_id -> names that already refused it
+        self._started = {}  # prompt_id -> monotonic start
+        self._session = None
+        self._watcher = None
+        events.add_listener(self._on_event)
+        try: self._apply(self._read_config())
+        except (OSError, ValueError) as e: print(f"[ComfyMini] Ignoring backend config: {e}")
+
+    # --- config ---
+    def _read_config(self):
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f: return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def config(self):
+        return {"local": self.use_local,
+                "backends": [{"name": b.name, "url": b.url, "enabled": b.enabled} for b in self.remotes.values()]}
+
+    def _apply(self, config):
+        """Validates and applies {local, backends: [{name, url, enabled}]}; connections (re)start on the loop."""
+        wanted = {}
+        for entry in config.get("backends", []):
+            name, url = str(entry.get("name") or "").strip(), str(entry.get("url") or "").strip()
+            if not url.startswith(("http://", "https://")): raise ValueError(f"backend url must be http(s): '{url}'")
+            name = name or url.split("://", 1)[1].rstrip("/")
+            if name == LOCAL or name in wanted: raise ValueError(f"duplicate backend name '{name}'")
+            wanted[name] = (url.rstrip("/"), bool(entry.get("enabled", True)))
+        for name in list(self.remotes):
+            b = self.remotes[name]
+            if wanted.get(name) != (b.url, b.enabled): self._drop(self.remotes.pop(name))
+        for name, (url, enabled) in wanted.items():
+            if name not in self.remotes:
+                self.remotes[name] = Backend(name, url, enabled)
+                if enabled: self.remotes[name].task = self.loop.create_task(self._follow(self.remotes[name]))
+        self.use_local = bool(config.get("local", True))
+        if self.active and self._watcher is None: self._watcher = self.loop.create_task(self._watch())
+
+    def set_config(self, config):
+        """Applies {local, backends: [{name, url, enabled}]} on the loop. Returns the new config; persist with save()."""
+        self._apply(config)
+        return self.config()
+
+    def save(self, config):
+        """Blocking."""
+        _write_atomic(self.config_path, json.dumps(config, indent=2).encode("utf-8"))
+
+    def _drop(self, b):
+        b.enabled = False
+        if b.task: b.task.cancel()
+        self._failover(b, reachable=b.healthy)
+
+    @property
+    def active(self):
+        return any(b.enabled for b in self.remotes.values())
+
+    def to_dict(self):
+        self.local.remaining = self._local_remaining()
+        return {"local": dict(self.local.to_dict(), enabled=self.use_local), "client_id": self.client_id,
+                "backends": [b.to_dict() for b in self.remotes.values()], "failovers": self.failovers,
+                "outputs_collected": self.outputs}
+
+    # --- dispatch (called from prompts.enqueue / cancel_prompt on the loop) ---
+    def _local_remaining(self):
+        queue = self.prompt_server.prompt_queue
+        if hasattr(queue, "get_tasks_remaining"): return queue.get_tasks_remaining()
+        running, pending = queue.get_current_queue()
+        return len(running) + len(pending)
+
+    def _choose(self, exclude=(), refresh=True):
+        candidates = [b for b in self.remotes.values() if b.enabled and b.healthy and b.name not in exclude]
+        if self.use_local or not candidates:
+            if refresh: self.local.remaining = self._local_remaining()
+            candidates.append(self.local)
+        return min(candidates, key=lambda b: b.score())
+
+    def dispatch(self, items):
+        """Returns the items that stay on the local queue; the rest are submitted in the background."""
+        if not self.active: return items
+        self.local.remaining = self._local_remaining()
+        local = []
+        for item in items:
+            self._route(item, local)
+        return local
+
+    def _route(self, item, local=None):
+        """Sends one item to the best backend. With `local` (a batch in progress) local picks are appended to it."""
+        prompt_id = item[1]
+        b = self._choose(self._excluded.get(prompt_id, ()), refresh=local is None)
+        self.assigned[prompt_id] = b
+        b.dispatched += 1
+        if b is self.local:
+            # Local load is read from the PromptQueue; count picks that aren't on it yet
+            self.local.remaining += 1
+            if local is None: put_local(self.prompt_server, [item])
+            else: local.append(item)
+        else:
+            b.inflight[prompt_id] = item
+            self.loop.create_task(self._submit(b, item))
+
+    def _reroute(self, b, item):
+        self.failovers += 1
+        self._excluded.setdefault(item[1], set()).add(b.name)
+        print(f"[ComfyMini] Backend {b.name}: re-dispatching {item[1]}")
+        self._route(item)
+
+    def cancel(self, prompt_id):
+        b = self.assigned.get(prompt_id)
+        if b is self.local and prompt_id not in self._started: self.assigned.pop(prompt_id)  # removed before it ran
+        if b is None or b is self.local or prompt_id not in b.inflight: return None
+        remote_id = self._remote_id(b, prompt_id)
+        if b.running == prompt_id:
+            # execution_interrupted comes back over the websocket and finishes the tracker
+            b.cancelling.add(prompt_id)
+            self.loop.create_task(self._purge(b, (), remote_id))
+            return "interrupted"
+        b.inflight.pop(prompt_id)
+        self.assigned.pop(prompt_id, None)
+        self._excluded.pop(prompt_id, None)
+        self.loop.create_task(self._purge(b, {remote_id}))
+        return "removed"
+
+    # --- remote I/O ---
+    def _http(self):
+        if self._session is None or self._session.closed:
+            # No total timeout: it would also cut the long-lived websockets
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=REQUEST_TIMEOUT))
+        return self._session
+
+    @staticmethod
+    def _remote_id(b, prompt_id):
+        return next((r for r, p in b.remote_ids.items() if p == prompt_id), prompt_id)
+
+    async def _get(self, b, path):
+        try:
+            async with self._http().get(b.url + path) as resp:
+                if resp.status >= 400: raise BackendError(f"GET {path}: HTTP {resp.status}")
+                return await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+            self._mark_down(b, e)
+            raise BackendError(f"{b.name} unreachable: {e}") from e
+
+    async def _post(self, b, path, body):
+        try:
+            async with self._http().post(b.url + path, json=body) as resp:
+                text = await resp.text()
+                try: data = json.loads(text) if text else {}
+                except ValueError: data = {"error": text[:200]}
+                if resp.status >= 400:
+                    error = data.get("error") if isinstance(data, dict) else None
+                    raise BackendError((error.get("message") if isinstance(error, dict) else error) or f"HTTP {resp.status}")
+                return data
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            self._mark_down(b, e)
+            raise BackendError(f"{b.name} unreachable: {e}") from e
+
+    async def _upload_inputs(self, b, prompt):
+        """Uploads the input-folder files named by the prompt that the backend doesn't have in this version."""
+        loop = asyncio.get_running_loop()
+        names = {name for node in prompt.values() for name in map(_input_name, node.get("inputs", {}).values()) if name}
+        for name in names:
+            path = self.resolve_media_path("input", name)
+            if not path: continue
+            try: st = await loop.run_in_executor(None, os.stat, path)
+            except OSError: continue
+            if b.uploads.get(name) == (st.st_mtime_ns, st.st_size): continue
+            data = await loop.run_in_executor(None, lambda: open(path, "rb").read())
+            form = aiohttp.FormData()
+            form.add_field("image", data, filename=os.path.basename(name))
+            form.add_field("subfolder", os.path.dirname(name))
+            form.add_field("type", "input")
+            form.add_field("overwrite", "true")
+            try:
+                async with self._http().post(b.url + "/upload/image", data=form) as resp:
+                    if resp.status != 200: raise BackendError(f"upload of {name} failed: HTTP {resp.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                self._mark_down(b, e)
+                raise BackendError(f"{b.name} unreachable: {e}") from e
+            b.uploads[name] = (st.st_mtime_ns, st.st_size)
+
+    async def _submit(self, b, item):
+        number, prompt_id, prompt, extra_data = item[:4]
+        b.submitting.add(prompt_id)
+        try:
+            prompt = copy.deepcopy(prompt)
+            await self._upload_inputs(b, prompt)
+            extra = {k: v for k, v in extra_data.items() if k != "client_id"}
+            if len(item) > 5 and item[5]: extra.update(item[5])
+            body = {"prompt": prompt, "client_id": self.client_id, "extra_data": extra, "prompt_id": prompt_id}
+            if number < 0: body["front"] = True
+            data = await self._post(b, "/prompt", body)
+            remote_id = data.get("prompt_id") or prompt_id
+            if remote_id != prompt_id: b.remote_ids[remote_id] = prompt_id
+            print(f"[ComfyMini] Backend {b.name}: queued {prompt_id}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if b.inflight.pop(prompt_id, None) is None: return  # cancelled or failed over meanwhile
+            print(f"[ComfyMini] Backend {b.name} refused {prompt_id}: {e}")
+            self._reroute(b, item)
+        finally:
+            b.submitting.discard(prompt_id)
+
+    def _mark_down(self, b, error):
+        if not b.healthy: return
+        b.healthy = False
+        b.error = str(error)
+        print(f"[ComfyMini] Backend {b.name} is down: {error}")
+        if b.ws is not None and not b.ws.closed: self.loop.create_task(b.ws.close())
+
+    def _failover(self, b, reachable=False):
+        """Re-dispatches everything inflight on `b`. The copies left there are deleted (and a running
+        one interrupted) right away when it is `reachable`, else on reconnect."""
+        if b.grace: b.grace.cancel(); b.grace = None
+        items = [(item, self._remote_id(b, item[1])) for item in b.inflight.values()]
+        stale = {remote_id for _, remote_id in items}
+        running = self._remote_id(b, b.running) if b.running in b.inflight else None
+        b.inflight.clear(); b.remote_ids.clear(); b.running = None
+        for item, _ in items:
+            if item[1] in b.cancelling: self._abandon(b, item)
+            else: self._reroute(b, item)
+        if not stale: return
+        if reachable: self.loop.create_task(self._purge(b, stale, running))
+        else: b.orphans |= stale
+
+    async def _purge(self, b, remote_ids, running=None):
+        """Deletes `remote_ids` from the backend's queue and interrupts `running`; retried on reconnect if it is down."""
+        try:
+            if remote_ids: await self._post(b, "/queue", {"delete": sorted(remote_ids)})
+            if running: await self._post(b, "/interrupt", {"prompt_id": running})
+        except BackendError as e:
+            b.orphans |= set(remote_ids) | ({running} if running else set())
+            print(f"[ComfyMini] Backend {b.name}: removal deferred to reconnect: {e}")
+
+    def _abandon(self, b, item):
+        """Finishes a prompt the user interrupted on a backend that never confirmed it."""
+        b.cancelling.discard(item[1])
+        self.assigned.pop(item[1], None)
+        self.prompt_server.send_sync("execution_interrupted", {"prompt_id": item[1]}, item[3].get("client_id"))
+        self.prompt_server.queue_updated()
+
+    def _lost(self, b):
+        """Called on disconnect: prompts stay put for FAILOVER_GRACE seconds in case the backend comes back."""
+        if not b.inflight or b.grace: return
+        print(f"[ComfyMini] Backend {b.name}: holding {len(b.inflight)} prompt(s) for {FAILOVER_GRACE:.0f}s")
+        b.grace = self.loop.call_later(FAILOVER_GRACE, self._give_up, b)
+
+    def _give_up(self, b):
+        b.grace = None
+        if not b.healthy: self._failover(b)
+
+    async def _reconcile(self, b):
+        """After a reconnect: keeps prompts the backend still queues or runs, replays the ones
+        that finished while we were away from /history, fails over the ones it lost, and
+        deletes prompts that were already failed over elsewhere."""
+        if b.grace: b.grace.cancel(); b.grace = None
+        if not (b.inflight or b.orphans): return
+        queue = await self._get(b, "/queue")
+        running = {entry[1] for entry in queue.get("queue_running", [])}
+        queued = running | {entry[1] for entry in queue.get("queue_pending", [])}
+        orphans, b.orphans = b.orphans, set()
+        if orphans & queued: await self._purge(b, orphans & queued, next(iter(orphans & running), None))
+        for prompt_id, item in list(b.inflight.items()):
+            remote_id = self._remote_id(b, prompt_id)
+            if prompt_id in b.submitting: continue  # _submit settles it
+            if remote_id in queued:
+                if remote_id in running: b.running = prompt_id
+                continue
+            entry = (await self._get(b, f"/history/{remote_id}")).get(remote_id)
+            if entry is not None:
+                await self._replay(b, remote_id, entry)
+            elif b.inflight.pop(prompt_id, None) is not None:
+                b.remote_ids.pop(remote_id, None)
+                if prompt_id in b.cancelling: self._abandon(b, item)
+                else: self._reroute(b, item)
+
+    async def _replay(self, b, remote_id, entry):
+        """Feeds a history entry through _on_remote as the events the dropped socket missed."""
+        status = entry.get("status") or {}
+        messages = [m for m in status.get("messages") or [] if isinstance(m, (list, tuple)) and len(m) == 2]
+        for node_id, output in (entry.get("outputs") or {}).items():
+            await self._on_remote(b, {"type": "executed", "data": {"node": node_id, "display_node": node_id,
+                                                                    "output": output, "prompt_id": remote_id}})
+        if not b.healthy: raise BackendError(f"{b.name} dropped while replaying {remote_id}")  # keep it for the next try
+        end = next(((event, data) for event, data in reversed(messages)
+                    if event in ("execution_success",) + FAIL_EVENTS), None)
+        if end is None:
+            end = ("execution_success", {}) if status.get("status_str", "success") == "success" else \
+                  ("execution_error", {"exception_message": "failed while the backend was disconnected"})
+        await self._on_remote(b, {"type": end[0], "data": dict(end[1], prompt_id=remote_id)})
+        await self._on_remote(b, {"type": "executing", "data": {"node": None, "prompt_id": remote_id}})
+
+    async def _watch(self):
+        """Polls queue depth, which also notices backends that vanished without closing the socket."""
+        while True:
+            for b in list(self.remotes.values()):
+                if not (b.enabled and b.healthy): continue
+                try:
+                    async with self._http().get(b.url + "/prompt", timeout=aiohttp.ClientTimeout(total=HEALTH_INTERVAL)) as resp:
+                        data = await resp.json(content_type=None)
+                    b.remaining = int(data.get("exec_info", {}).get("queue_remaining", 0))
+                    b.misses = 0
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError, AttributeError) as e:
+                    b.misses += 1  # one slow poll on a busy box isn't an outage
+                    if b.misses >= WATCH_MISSES: self._mark_down(b, e)
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    async def _follow(self, b):
+        """Keeps one websocket to the backend open; reconnects with backoff and reconciles inflight prompts on return."""
+        delay = 1.0
+        while b.enabled:
+            try:
+                async with self._http().ws_connect(f"{b.url}/ws?clientId={self.client_id}", heartbeat=30) as ws:
+                    b.ws, b.healthy, b.error, b.misses, delay = ws, True, None, 0, 1.0
+                    print(f"[ComfyMini] Backend {b.name} connected")
+                    await self._reconcile(b)
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT: await self._on_remote(b, json.loads(msg.data))
+                        elif msg.type == aiohttp.WSMsgType.BINARY: self._on_remote_binary(b, msg.data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                b.error = str(e)
+            b.ws = None
+            if b.healthy:
+                b.healthy = False
+                print(f"[ComfyMini] Backend {b.name} disconnected{f': {b.error}' if b.error else ''}")
+            self._lost(b)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    async def _on_remote(self, b, msg):
+        event, data = msg.get("type"), msg.get("data")
+        if not isinstance(data, dict): return
+        if event == "status":
+            b.remaining = int((data.get("status") or {}).get("exec_info", {}).get("queue_remaining", b.remaining))
+            return
+        if event not in FORWARD_EVENTS: return
+        remote_id = data.get("prompt_id")
+        prompt_id = b.remote_ids.get(remote_id, remote_id)
+        item = b.inflight.get(prompt_id)
+        if item is None: return  # another client's prompt, or already failed over
+        data = dict(data, prompt_id=prompt_id)
+        if event == "execution_start": b.running = prompt_id
+        elif event == "executed" and isinstance(data.get("output"), dict):
+            try: data["output"] = await self._collect(b, data["output"])
+            except BackendError: return  # backend went away mid-download; reconnect replays it from /history
+        if _is_finish(event, data):
+            b.inflight.pop(prompt_id, None)
+            b.remote_ids.pop(remote_id, None)
+            b.cancelling.discard(prompt_id)
+            if b.running == prompt_id: b.running = None
+        self.prompt_server.send_sync(event, data, item[3].get("client_id"))
+        # Pages watch for the queue-empty status; local status only changes with the local queue
+        if _is_finish(event, data): self.prompt_server.queue_updated()
+
+    def _on_remote_binary(self, b, data):
+        item = b.inflight.get(b.running)
+        if item is None or len(data) < 4: return
+        self.prompt_server.send_sync(struct.unpack(">I", data[:4])[0], data[4:], item[3].get("client_id"))
+
+    async def _collect(self, b, output):
+        """Downloads output/temp files of an `executed` message into the local folders and points the message at them.
+
+        Raises BackendError when the backend can't be reached; a missing file is logged and left pointing at the remote name.
+        """
+        loop = asyncio.get_running_loop()
+        output = dict(output)
+        for key, files in output.items():
+            if not isinstance(files, list): continue
+            local_files = []
+            for f in files:
+                if not (isinstance(f, dict) and f.get("filename") and f.get("type", "output") in MEDIA_TYPES):
+                    local_files.append(f); continue
+                folder_type, subfolder = f.get("type", "output"), f.get("subfolder", "")
+                path = self.resolve_media_path(folder_type, subfolder, f["filename"])
+                if not path:
+                    local_files.append(f); continue
+                params = {"filename": f["filename"], "subfolder": subfolder, "type": folder_type}
+                try:
+                    async with self._http().get(b.url + "/view", params=params) as resp:
+                        status = resp.status
+                        content = await resp.read() if status == 200 else None
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                    self._mark_down(b, e)
+                    raise BackendError(f"{b.name} unreachable: {e}") from e
+                try:
+                    if content is None: raise BackendError(f"HTTP {status}")
+                    path = await loop.run_in_executor(None, self._store, path, b.name, content)
+                    local_files.append(dict(f, filename=os.path.basename(path)))
+                    self.outputs += 1
+                except (BackendError, OSError) as e:
+                    print(f"[ComfyMini] Backend {b.name}: could not fetch {f['filename']}: {e}")
+                    local_files.append(f)
+            output[key] = local_files
+        return output
+
+    @staticmethod
+    def _store(path, tag, content):
+        path = _unique_path(path, tag)
+        _write_atomic(path, content)
+        return path
+
+    # --- local bookkeeping (every event, local or replayed) ---
+    def _on_event(self, event, data, sid):
+        if not isinstance(data, dict): return
+        prompt_id = data.get("prompt_id")
+        if event == "execution_start":
+            self._started[prompt_id] = time.monotonic()
+        elif prompt_id in self._started and _is_finish(event, data):
+            b = self.assigned.pop(prompt_id, None) or self.local
+            b.record(time.monotonic() - self._started.pop(prompt_id))
+            self._excluded.pop(prompt_id, None)
@@ -0,0 +1,203 @@
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import threading
+
+from .storage import split_workflow_data, merge_workflow_data, write_atomic
+
+MANIFEST_VERSION = 1
+DEFAULT_POLICY = {"keep_last": 20, "hourly": 24, "daily": 30}
+LEGACY_RE = re.compile(r"^backup_(\d+)\.json$")
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class BackupStore:
+    """Content-addressed workflow backups.
+
+    Every node (and every top-level value) is stored once as a gzip blob named by its
+    sha256; a snapshot is a small "tree" blob mapping node ids to those hashes, so a
+    seed change only adds one node blob plus a tree. manifest.json lists the snapshots
+    and the retention policy, and is the only thing list/restore/diff read.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self._lock = threading.RLock()
+        self._manifest = None
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    # --- objects ---
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:] + ".json.gz")
+
+    def _put(self, value):
+        raw = _canonical(value)
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, gzip.compress(raw, compresslevel=6))
+        return digest
+
+    def _get(self, digest):
+        with open(self._object_path(digest), "rb") as f:
+            return json.loads(gzip.decompress(f.read()))
+
+    # --- manifest ---
+    def _load(self):
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f: self._manifest = json.load(f)
+            except FileNotFoundError:
+                self._manifest = {"version": MANIFEST_VERSION, "policy": dict(DEFAULT_POLICY), "backups": []}
+                self._import_legacy()
+                self._save_manifest()
+        return self._manifest
+
+    def _save_manifest(self):
+        write_atomic(self.manifest_path, json.dumps(self._manifest, indent=1).encode("utf-8"))
+
+    def _import_legacy(self):
+        """Pulls old backup_{ts}.json/.meta.json pairs into the store. The files are left in place."""
+        for name in sorted(os.listdir(self.root)):
+            m = LEGACY_RE.match(name)
+            if not m: continue
+            try:
+                with open(os.path.join(self.root, name), "r", encoding="utf-8") as f: logic = json.load(f)
+                meta = {}
+                meta_path = os.path.join(self.root, name.replace(".json", ".meta.json"))
+                if os.path.exists(meta_path):
+                    with open(meta_path, "r", encoding="utf-8") as f: meta = json.load(f)
+                self._add(merge_workflow_data(logic, meta), float(m.group(1)), label=name)
+            except (OSError, ValueError) as e:
+                print(f"[ComfyMini] Skipping legacy backup {name}: {e}")
+        if self._manifest["backups"]:
+            print(f"[ComfyMini] Imported {len(self._manifest['backups'])} legacy backups")
+
+    # --- snapshots ---
+    def _add(self, full_data, ts, label=None):
+        logic, meta = split_workflow_data(full_data)
+        tree = {
+            "logic": {k: self._put(v) for k, v in logic.items()},
+            "meta": {k: self._put(v) for k, v in meta.items()},
+        }
+        tree_id = self._put(tree)
+        backups = self._manifest["backups"]
+        if backups and backups[-1]["tree"] == tree_id:
+            return backups[-1], False
+        origin = full_data.get("_mini_origin") if isinstance(full_data, dict) else None
+        entry = {
+            "id": f"{int(ts * 1000)}-{tree_id[:8]}", "tree": tree_id, "ts": ts,
+            "origin": origin if isinstance(origin, str) else None, "label": label,
+            "nodes": sum(1 for v in logic.values() if isinstance(v, dict)),
+        }
+        backups.append(entry)
+        return entry, True
+
+    def save(self, full_data, label=None):
+        """Returns (entry, created). An unchanged snapshot returns the newest entry instead of adding one."""
+        with self._lock:
+            self._load()
+            entry, created = self._add(full_data, time.time(), label)
+            if created:
+                self._apply_retention()
+                self._save_manifest()
+            return entry, created
+
+    def list(self):
+        with self._lock:
+            return [dict(b) for b in reversed(self._load()["backups"])]
+
+    def _entry(self, backup_id):
+        entry = next((b for b in self._load()["backups"] if b["id"] == backup_id), None)
+        if entry is None: raise KeyError(backup_id)
+        return entry
+
+    def load(self, backup_id):
+        """Rebuilds the merged workflow of a snapshot. Raises KeyError for unknown ids."""
+        # Blob reads stay under the lock too: a retention pass may drop this snapshot and delete its objects mid-read
+        with self._lock:
+            tree = self._get(self._entry(backup_id)["tree"])
+            logic = {k: self._get(h) for k, h in tree["logic"].items()}
+            meta = {k: self._get(h) for k, h in tree["meta"].items()}
+        return merge_workflow_data(logic, meta)
+
+    def diff(self, backup_id, other):
+        """Node/input level changes from backup `backup_id` to `other` (another id, or a workflow dict)."""
+        old = self.load(backup_id)
+        new = self.load(other) if isinstance(other, str) else other
+        changes = {"added": [], "removed": [], "changed": {}}
+        for node_id in old:
+            if node_id not in new: changes["removed"].append(node_id)
+        for node_id, node in new.items():
+            if node_id not in old:
+                changes["added"].append(node_id)
+                continue
+            before = old[node_id]
+            if before == node: continue
+            if isinstance(before, dict) and isinstance(node, dict):
+                a, b = before.get("inputs", {}), node.get("inputs", {})
+                delta = {k: [a.get(k), b.get(k)] for k in set(a) | set(b) if a.get(k) != b.get(k)}
+                for key in ("class_type", "_meta"):
+                    if before.get(key) != node.get(key): delta[key] = [before.get(key), node.get(key)]
+                changes["changed"][node_id] = delta
+            else:
+                changes["changed"][node_id] = {"value": [before, node]}
+        return changes
+
+    # --- retention ---
+    def get_policy(self):
+        with self._lock:
+            return dict(self._load()["policy"])
+
+    def set_policy(self, policy):
+        with self._lock:
+            current = self._load()["policy"]
+            for key in DEFAULT_POLICY:
+                if key in policy: current[key] = max(0, int(policy[key]))
+            self._apply_retention()
+            self._save_manifest()
+            return dict(current)
+
+    def _apply_retention(self):
+        """Keeps the newest `keep_last`, plus the newest snapshot of each of the last `hourly` hours and `daily` days."""
+        policy = self._manifest["policy"]
+        backups = self._manifest["backups"]
+        keep = set(b["id"] for b in backups[-policy["keep_last"]:]) if policy["keep_last"] else set()
+        for bucket_seconds, count in ((3600, policy["hourly"]), (86400, policy["daily"])):
+            if not count: continue
+            newest_bucket = int(time.time() // bucket_seconds)
+            seen = set()
+            for b in reversed(backups):
+                bucket = int(b["ts"] // bucket_seconds)
+                if newest_bucket - bucket >= count: break
+                if bucket not in seen:
+                    seen.add(bucket); keep.add(b["id"])
+        if len(keep) == len(backups): return
+        self._manifest["backups"] = [b for b in backups if b["id"] in keep]
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        live = set()
+        for b in self._manifest["backups"]:
+            live.add(b["tree"])
+            try: tree = self._get(b["tree"])
+            except (OSError, ValueError): continue
+            live.update(tree["logic"].values()); live.update(tree["meta"].values())
+        removed = 0
+        for shard in os.listdir(self.objects_dir):
+            shard_dir = os.path.join(self.objects_dir, shard)
+            if not os.path.isdir(shard_dir): continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith(".json.gz") or shard + name[:-8] in live: continue
+                try: os.remove(os.path.join(shard_dir, name)); removed += 1
+                except OSError: pass
+        if removed: print(f"[ComfyMini] Backup retention removed {removed} unreferenced objects")
@@ -0,0 +1,232 @@
+import copy
+import json
+import time
+import uuid
+import random
+import asyncio
+import itertools
+from collections import OrderedDict
+
+from .prompts import (SERVER_CLIENT_ID, PromptError, prepare_prompt, enqueue, cancel_prompt,
+                      compile_prompt, randomize_seeds, build_pnginfo)
+
+MAX_ITEMS = 1000
+MAX_BATCHES = 50
+STYLE_CLASS = "easy stylesSelector"
+SEED_MAX = 10000000000 - 1
+
+
+# --- SWEEP SPEC ---
+def _range_values(spec):
+    start, stop = spec[0], spec[1]
+    step = spec[2] if len(spec) > 2 else 1
+    if not step: raise ValueError("range step cannot be 0")
+    count = int(round((stop - start) / step)) + 1
+    if count > MAX_ITEMS: raise ValueError(f"range has more than {MAX_ITEMS} values")
+    values = [start + i * step for i in range(max(count, 0))]
+    return [round(v, 6) for v in values] if isinstance(start + step, float) else values
+
+def _has_input(workflow, node_id, key):
+    node = workflow.get(node_id)
+    return isinstance(node, dict) and key in node.get("inputs", {})
+
+def _check_count(count, what):
+    # Checked before any list is built: the request is untrusted and expanded on the event loop
+    if count > MAX_ITEMS: raise ValueError(f"{what} has more than {MAX_ITEMS} values")
+    return count
+
+def _seed_axis(workflow, spec):
+    targets = [str(spec["node"])] if spec.get("node") is not None else [
+        nid for nid, n in workflow.items()
+        if isinstance(n, dict) and n.get("class_type") == "KSampler" and "seed" in n.get("inputs", {})]
+    if not targets: raise ValueError("no KSampler seed inputs to sweep")
+    if not _has_input(workflow, targets[0], "seed"): raise ValueError(f"unknown input {targets[0]}.seed")
+    if "values" in spec:
+        _check_count(len(spec["values"]), "seeds")
+        values = [int(v) for v in spec["values"]]
+    elif "random" in spec: values = [random.randint(0, SEED_MAX) for _ in range(_check_count(int(spec["random"]), "seeds"))]
+    else:
+        start = int(spec.get("start", 0))
+        values = list(range(start, start + _check_count(int(spec.get("count", 1)), "seeds")))
+    return [(nid, "seed") for nid in targets], values
+
+def _style_axis(workflow, spec, style_names):
+    node = spec.get("node")
+    if node is None:
+        node = next((nid for nid, n in workflow.items() if isinstance(n, dict) and n.get("class_type") == STYLE_CLASS), None)
+    if node is None: raise ValueError("workflow has no styles selector")
+    key = spec.get("key", "select_styles")
+    if not isinstance(workflow.get(str(node)), dict): raise ValueError(f"unknown node {node}")
+    _check_count(len(spec.get("values", [])), "styles")
+    values = []
+    for combo in spec.get("values", []):
+        combo = [combo] if isinstance(combo, str) else list(combo)
+        unknown = [s for s in combo if s not in style_names]
+        if unknown: raise ValueError(f"unknown styles: {', '.join(unknown)}")
+        values.append({"__value__": combo})
+    return [(str(node), key)], values
+
+def _check_spec(spec):
+    if not isinstance(spec, dict): raise ValueError("request must be an object")
+    sweep = spec.get("sweep") or []
+    if not isinstance(sweep, list) or not all(isinstance(axis, dict) for axis in sweep):
+        raise ValueError("sweep must be a list of {node, key, values|range} objects")
+    for name in ("seeds", "styles"):
+        if spec.get(name) and not isinstance(spec[name], dict): raise ValueError(f"{name} must be an object")
+
+def build_axes(workflow, spec, style_names=()):
+    """Turns the request's sweep/seeds/styles into [(targets, values)], each target a (node_id, key)."""
+    _check_spec(spec)
+    axes = []
+    for axis in spec.get("sweep") or []:
+        node_id, key = str(axis.get("node")), axis.get("key")
+        if not _has_input(workflow, node_id, key): raise ValueError(f"unknown input {node_id}.{key}")
+        values = _range_values(axis["range"]) if "range" in axis else list(axis.get("values", []))
+        _check_count(len(values), f"sweep {node_id}.{key}")
+        axes.append(([(node_id, key)], values))
+    if spec.get("seeds"): axes.append(_seed_axis(workflow, spec["seeds"]))
+    if spec.get("styles"): axes.append(_style_axis(workflow, spec["styles"], set(style_names)))
+    if any(not values for _, values in axes): raise ValueError("every axis needs at least one value")
+    return axes
+
+def expand(axes, mode="cartesian"):
+    """Yields one {(node_id, key): value} assignment per combination, duplicates removed."""
+    if not axes: return [{}]
+    if mode == "zip":
+        lengths = {len(values) for _, values in axes}
+        if len(lengths) > 1: raise ValueError("zip mode needs axes of equal length")
+        if lengths.pop() > MAX_ITEMS: raise ValueError(f"sweep expands to more than {MAX_ITEMS} prompts")
+        combos = zip(*(values for _, values in axes))
+    elif mode == "cartesian":
+        total = 1
+        for _, values in axes: total *= len(values)
+        if total > MAX_ITEMS: raise ValueError(f"sweep expands to {total} prompts (max {MAX_ITEMS})")
+        combos = itertools.product(*(values for _, values in axes))
+    else:
+        raise ValueError(f"unknown mode '{mode}'")
+
+    seen = set(); out = []
+    for combo in combos:
+        assignment = {}
+        for (targets, _), value in zip(axes, combo):
+            for target in targets: assignment[target] = value
+        key = json.dumps(sorted((f"{n}.{k}", v) for (n, k), v in assignment.items()), sort_keys=True, default=str)
+        if key in seen: continue
+        seen.add(key); out.append(assignment)
+    if len(out) > MAX_ITEMS: raise ValueError(f"sweep expands to {len(out)} prompts (max {MAX_ITEMS})")
+    return out
+
+def apply_assignment(workflow, assignment):
+    wf = copy.deepcopy(workflow)
+    seeded = any(key == "seed" for _, key in assignment)
+    # Without a seed axis every item gets a fresh seed, same as pressing Roll
+    if not seeded: randomize_seeds(wf)
+    for (node_id, key), value in assignment.items():
+        wf[node_id]["inputs"][key] = copy.deepcopy(value)
+    return wf
+
+
+# --- TRACKING ---
+class Batch:
+    def __init__(self, source, mode):
+        self.batch_id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.mode = mode
+        self.created = time.time()
+        self.items = []  # {index, params, prompt_id, state, images, error}
+        self.tasks = {}  # prompt_id -> follower task
+
+    def counts(self):
+        counts = {}
+        for item in self.items: counts[item["state"]] = counts.get(item["state"], 0) + 1
+        return counts
+
+    @property
+    def finished(self):
+        return all(item["state"] not in ("queued", "running") for item in self.items)
+
+    def to_dict(self, items=True):
+        data = {"batch_id": self.batch_id, "source": self.source, "mode": self.mode, "created": self.created,
+                "total": len(self.items), "counts": self.counts(), "finished": self.finished}
+        if items: data["items"] = self.items
+        return data
+
+
+class BatchManager:
+    """Builds, bulk-queues and tracks parameter sweeps submitted through /mini/batch."""
+
+    def __init__(self, prompt_server, events, publish):
+        self.prompt_server = prompt_server
+        self.events = events
+        self.publish = publish
+        self.batches = OrderedDict()
+        self._by_prompt = {}  # prompt_id -> item
+        events.add_listener(self._on_event)
+
+    def get(self, batch_id):
+        return self.batches.get(batch_id)
+
+    async def submit(self, workflow, assignments, source, mode, client_id=None, front=False):
+        batch = Batch(source, mode)
+        prepared = []
+        for i, assignment in enumerate(assignments):
+            if i: await asyncio.sleep(0)  # up to MAX_ITEMS validations: let other requests in between
+            wf = apply_assignment(workflow, assignment)
+            params = {f"{n}.{k}": v for (n, k), v in assignment.items()}
+            item = {"index": i, "params": params, "prompt_id": None, "state": "queued", "images": [], "error": None}
+            batch.items.append(item)
+            try:
+                queued = await prepare_prompt(self.prompt_server, compile_prompt(wf),
+                                              extra_data={"extra_pnginfo": build_pnginfo(wf)},
+                                              client_id=client_id or SERVER_CLIENT_ID, front=front)
+            except PromptError as e:
+                item["state"] = "invalid"; item["error"] = str(e)
+                continue
+            item["prompt_id"] = queued[1]
+            prepared.append((item, queued))
+
+        loop = asyncio.get_running_loop()
+        for item, queued in prepared:
+            self._by_prompt[queued[1]] = item
+            batch.tasks[queued[1]] = loop.create_task(self._follow(batch, item, self.events.track(queued[1])))
+        enqueue(self.prompt_server, [queued for _, queued in prepared])
+
+        self.batches[batch.batch_id] = batch
+        while len(self.batches) > MAX_BATCHES:
+            oldest = next((bid for bid, b in self.batches.items() if b.finished), None)
+            if oldest is None: break  # every batch is live; keep them all reachable
+            del self.batches[oldest]
+        print(f"[ComfyMini] Batch {batch.batch_id}: queued {len(prepared)}/{len(assignments)} prompts")
+        return batch
+
+    def cancel(self, batch):
+        cancelled = 0
+        for item in batch.items:
+            if item["state"] not in ("queued", "running"): continue
+            result = cancel_prompt(self.prompt_server, item["prompt_id"])
+            if not result: continue
+            item["state"] = "cancelled"; cancelled += 1
+            # Removed prompts never report back; interrupted ones finish through execution_interrupted
+            if result == "removed": batch.tasks[item["prompt_id"]].cancel()
+        return cancelled
+
+    def _on_event(self, event, data, sid):
+        if event != "execution_start" or not isinstance(data, dict): return
+        item = self._by_prompt.get(data.get("prompt_id"))
+        if item and item["state"] == "queued": item["state"] = "running"
+
+    async def _follow(self, batch, item, future):
+        try:
+            outputs = await future
+            item["images"] = [img for out in outputs.values() if isinstance(out, dict) for img in out.get("images", [])]
+            item["state"] = "done"
+        except PromptError as e:
+            if item["state"] != "cancelled":
+                item["state"] = "error"; item["error"] = str(e)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            batch.tasks.pop(item["prompt_id"], None)
+            self._by_prompt.pop(item["prompt_id"], None)
+            self.events.forget(item["prompt_id"])
+            self.publish("batch", {"batch_id": batch.batch_id, "item": item, "counts": batch.counts(), "finished": batch.finished})
@@ -0,0 +1,127 @@
+"""Backend pool check: /mini prompts spread over fake ComfyUI servers (fake_comfy.py).
+
+The package is served as in run.py with `local: false`, so every prompt goes to a fake.
+For each pool size a /mini/batch is timed until every item is done; then a /mini/run with
+a LoadImage input checks the upload, and with --failover one server is stopped mid-batch
+and every prompt must still finish on the others once the failover grace runs out. With
+--blip the first server only drops its sockets mid-batch: it must keep its prompts (no
+failovers) and every prompt must still finish.
+
+    python bench/dispatch.py --backends 1,2,4 --prompts 24 --job-time 0.5
+    python bench/dispatch.py --backends 3 --failover --grace 2
+    python bench/dispatch.py --backends 2 --blip
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+from aiohttp import ClientSession, web
+
+import fixtures
+from fake_comfy import FakeComfy
+from run import Backend, SCALES, PACKAGE
+
+TIMEOUT = 300
+
+
+async def serve(fake):
+    runner = web.AppRunner(fake.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, runner.addresses[0][1]
+
+async def crash(fake, runner):
+    for site in list(runner.sites): await site.stop()  # refuse reconnects before the sockets drop
+    await fake.crash()
+    await runner.cleanup()
+
+async def configure(client, ports):
+    config = {"local": False, "backends": [{"name": f"fake{i}", "url": f"http://127.0.0.1:{port}"} for i, port in enumerate(ports)]}
+    async with client.post("/mini/backends", json=config) as resp: assert resp.status == 200, await resp.text()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        async with client.get("/mini/backends") as resp: state = await resp.json()
+        if all(b["healthy"] for b in state["backends"]): return state
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"backends not healthy: {state}")
+
+async def run_batch(client, filename, prompts, stop=None):
+    """Returns (seconds, counts). `stop` is awaited once, a third of the way in."""
+    start = time.perf_counter()
+    async with client.post("/mini/batch", json={"filename": filename, "seeds": {"random": prompts}}) as resp:
+        batch_id = (await resp.json())["batch_id"]
+    while True:
+        async with client.get(f"/mini/batch/status?batch_id={batch_id}") as resp: status = await resp.json()
+        done = status["counts"].get("done", 0)
+        if stop and done >= prompts // 3:
+            await stop
+            stop = None
+        if status["finished"]: return time.perf_counter() - start, status["counts"]
+        if time.perf_counter() - start > TIMEOUT: raise RuntimeError(f"batch stuck: {status['counts']}")
+        await asyncio.sleep(0.05)
+
+async def check_upload(client, backend, fakes):
+    name = "bench_input.png"
+    with open(os.path.join(backend.root, "input", name), "wb") as f: f.write(fixtures.TINY_PNG)
+    workflow = {"1": {"class_type": "LoadImage", "inputs": {"image": name}},
+                "2": {"class_type": "KSampler", "inputs": {"seed": 1, "image": ["1", 0]}},
+                "3": {"class_type": "SaveImage", "inputs": {"images": ["2", 0], "filename_prefix": "ComfyMini"}}}
+    async with client.post("/mini/run", json={"workflow": workflow, "client_id": "bench"}) as resp:
+        assert resp.status == 200, await resp.text()
+    deadline = time.time() + TIMEOUT
+    while not any(name in f.uploads for f in fakes):
+        if time.time() > deadline: raise RuntimeError("input image was never uploaded")
+        await asyncio.sleep(0.05)
+    print(f"  upload: {name} sent to {sum(name in f.uploads for f in fakes)} backend(s)")
+
+async def main_async(args, backend):
+    filename = backend.library[0]
+    async with ClientSession(f"http://127.0.0.1:{backend.port}") as client:
+        for n in args.backends:
+            fakes = [FakeComfy(os.path.join(backend.root, f"fake{n}_{i}"), args.job_time) for i in range(n)]
+            servers = [await serve(f) for f in fakes]
+            await configure(client, [port for _, port in servers])
+            stop = None
+            if args.failover and n > 1: stop = crash(fakes[0], servers[0][0])
+            elif args.blip and n > 1: stop = fakes[0].drop()
+            seconds, counts = await run_batch(client, filename, args.prompts, stop)
+            async with client.get("/mini/backends") as resp: state = await resp.json()
+            ideal = args.prompts * args.job_time / n
+            spread = " ".join(f"{b['name']}={b['finished']}" for b in state["backends"])
+            print(f"  {n} backend(s): {args.prompts} prompts in {seconds:.2f}s (ideal {ideal:.2f}s)  {counts}  finished {spread}"
+                  f"  failovers {state['failovers']}  outputs {state['outputs_collected']}")
+            if counts.get("done") != args.prompts: raise RuntimeError(f"not every prompt finished: {counts}")
+            if args.blip and n > 1 and state["failovers"]: raise RuntimeError(f"a socket drop failed over {state['failovers']} prompt(s)")
+            crashed = args.failover and n > 1
+            if n == args.backends[-1]: await check_upload(client, backend, fakes[1:] if crashed else fakes)
+            for runner, _ in servers[1:] if crashed else servers: await runner.cleanup()
+        await client.post("/mini/backends", json={"local": True, "backends": []})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="1,2,4", help="comma-separated pool sizes")
+    parser.add_argument("--prompts", type=int, default=24)
+    parser.add_argument("--job-time", type=float, default=0.5, help="seconds per prompt on a fake server")
+    parser.add_argument("--failover", action="store_true", help="stop the first server a third of the way through each batch")
+    parser.add_argument("--blip", action="store_true", help="drop the first server's sockets a third of the way through each batch")
+    parser.add_argument("--grace", type=float, default=5.0, help="seconds a dropped backend gets before failover (package default 30)")
+    args = parser.parse_args()
+    args.backends = [int(n) for n in args.backends.split(",")]
+
+    root = tempfile.mkdtemp(prefix="comfymini-dispatch-")
+    backend = Backend(root, dict(SCALES["quick"], workflows=2, files=10))
+    try:
+        backend.start()
+        sys.modules[f"{PACKAGE}.backends"].FAILOVER_GRACE = args.grace
+        asyncio.run(main_async(args, backend))
+        backend.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
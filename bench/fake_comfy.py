@@ -0,0 +1,209 @@
+"""A stand-in ComfyUI server for exercising the backend pool (backends.py) without GPUs.
+
+Speaks the parts of the ComfyUI HTTP/websocket API the pool uses: GET/POST /prompt,
+GET /queue, POST /queue {delete}, GET /history/{prompt_id}, POST /interrupt,
+POST /upload/image, GET /view and /ws. Prompts run one at a time for `job_time` seconds,
+sending execution_start, executing, progress, a binary JPEG preview, executed (a tiny PNG
+written per Save* node) and execution_success, like the real executor.
+
+    python bench/fake_comfy.py --port 8190 --job-time 2
+"""
+import os
+import json
+import uuid
+import struct
+import asyncio
+import argparse
+import tempfile
+
+from aiohttp import web, WSMsgType
+
+from fixtures import TINY_PNG
+
+PREVIEW_IMAGE = 1
+# Smallest JPEG most decoders accept; previews only need to be well-formed enough to relay
+TINY_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f141d1a1f1e1d1a1c1c"
+    "20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b080001000101011100ffc4001f000001050101010101010000"
+    "0000000000000102030405060708090a0bffc400b5100002010303020403050504040000017d01020300041105122131410613516107227114328191"
+    "a1082342b1c11552d1f02433627282090a161718191a25262728292a3435363738393a434445464748494a535455565758595a636465666768696a73"
+    "7475767778797a838485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9da"
+    "e1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00fbd3ffd9")
+
+
+class FakeComfy:
+    def __init__(self, root, job_time=1.0, steps=5):
+        self.root = root
+        self.job_time = job_time
+        self.steps = steps
+        self.dirs = {t: os.path.join(root, t) for t in ("output", "input", "temp")}
+        for d in self.dirs.values(): os.makedirs(d, exist_ok=True)
+        self.sockets = {}  # client_id -> ws
+        self.queue = []  # (prompt_id, prompt, client_id)
+        self.running = None
+        self.interrupted = False
+        self.completed = []
+        self.history = {}  # prompt_id -> {outputs, status}, like ComfyUI's /history
+        self.uploads = []
+        self.counter = 0
+        self._wake = asyncio.Event()
+        self._worker = None
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get("/prompt", self.get_prompt), web.post("/prompt", self.post_prompt),
+            web.get("/queue", self.get_queue), web.post("/queue", self.post_queue),
+            web.get("/history/{prompt_id}", self.get_history), web.post("/interrupt", self.post_interrupt),
+            web.post("/upload/image", self.upload_image), web.get("/view", self.view), web.get("/ws", self.ws),
+        ])
+        self.app.on_startup.append(self._start)
+        self.app.on_cleanup.append(self._stop)
+
+    async def _start(self, app):
+        self._worker = asyncio.get_running_loop().create_task(self._work())
+
+    async def _stop(self, app):
+        await self.crash()
+
+    async def crash(self):
+        """Stops executing and drops every socket, like a process that died mid-prompt."""
+        self._worker.cancel()
+        for ws in list(self.sockets.values()): await ws.close()
+
+    async def drop(self):
+        """Closes every socket but keeps executing, like a network blip."""
+        for ws in list(self.sockets.values()): await ws.close()
+
+    def remaining(self):
+        return len(self.queue) + (1 if self.running else 0)
+
+    async def _send(self, event, data, sid=None):
+        targets = [self.sockets.get(sid)] if sid else list(self.sockets.values())
+        for ws in targets:
+            if ws is None or ws.closed: continue
+            if isinstance(event, int): await ws.send_bytes(struct.pack(">I", event) + data)
+            else: await ws.send_str(json.dumps({"type": event, "data": data}))
+
+    async def _status(self):
+        await self._send("status", {"status": {"exec_info": {"queue_remaining": self.remaining()}}})
+
+    # --- routes ---
+    async def get_prompt(self, request):
+        return web.json_response({"exec_info": {"queue_remaining": self.remaining()}})
+
+    async def post_prompt(self, request):
+        data = await request.json()
+        prompt = data.get("prompt")
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({"error": {"type": "invalid_prompt", "message": "No prompt"}, "node_errors": {}}, status=400)
+        prompt_id = str(data.get("prompt_id") or uuid.uuid4())
+        item = (prompt_id, prompt, data.get("client_id"))
+        if data.get("front"): self.queue.insert(0, item)
+        else: self.queue.append(item)
+        self._wake.set()
+        await self._status()
+        return web.json_response({"prompt_id": prompt_id, "number": len(self.queue), "node_errors": {}})
+
+    async def get_queue(self, request):
+        running = [[0, self.running, {}, {}, []]] if self.running else []
+        return web.json_response({"queue_running": running,
+                                  "queue_pending": [[n + 1, pid, {}, {}, []] for n, (pid, _, _) in enumerate(self.queue)]})
+
+    async def get_history(self, request):
+        prompt_id = request.match_info["prompt_id"]
+        return web.json_response({prompt_id: self.history[prompt_id]} if prompt_id in self.history else {})
+
+    async def post_queue(self, request):
+        delete = set((await request.json()).get("delete") or [])
+        self.queue = [item for item in self.queue if item[0] not in delete]
+        await self._status()
+        return web.Response(status=200)
+
+    async def post_interrupt(self, request):
+        self.interrupted = True
+        return web.Response(status=200)
+
+    async def upload_image(self, request):
+        form = await request.post()
+        image = form["image"]
+        subfolder = form.get("subfolder", "")
+        path = os.path.join(self.dirs[form.get("type", "input")], subfolder, image.filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f: f.write(image.file.read())
+        self.uploads.append(os.path.join(subfolder, image.filename))
+        return web.json_response({"name": image.filename, "subfolder": subfolder, "type": form.get("type", "input")})
+
+    async def view(self, request):
+        q = request.query
+        path = os.path.join(self.dirs.get(q.get("type", "output"), self.dirs["output"]), q.get("subfolder", ""), q.get("filename", ""))
+        if not os.path.isfile(path): return web.Response(status=404)
+        return web.FileResponse(path)
+
+    async def ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get("clientId") or uuid.uuid4().hex
+        self.sockets[client_id] = ws
+        await ws.send_str(json.dumps({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": self.remaining()}}, "sid": client_id}}))
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR: break
+        finally:
+            if self.sockets.get(client_id) is ws: del self.sockets[client_id]
+        return ws
+
+    # --- executor ---
+    async def _work(self):
+        while True:
+            if not self.queue:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            prompt_id, prompt, sid = self.queue.pop(0)
+            self.running, self.interrupted = prompt_id, False
+            await self._status()
+            await self._run(prompt_id, prompt, sid)
+            self.running = None
+            await self._status()
+
+    async def _run(self, prompt_id, prompt, sid):
+        await self._send("execution_start", {"prompt_id": prompt_id}, sid)
+        outputs = {}
+        saves = [nid for nid, node in prompt.items() if "Save" in node.get("class_type", "")]
+        sampler = next((nid for nid, node in prompt.items() if node.get("class_type") == "KSampler"), None)
+        await self._send("executing", {"node": sampler, "prompt_id": prompt_id}, sid)
+        for step in range(self.steps):
+            await asyncio.sleep(self.job_time / self.steps)
+            if self.interrupted:
+                self.history[prompt_id] = {"outputs": outputs, "status": {"status_str": "error", "completed": False, "messages": [
+                    ["execution_start", {"prompt_id": prompt_id}], ["execution_interrupted", {"prompt_id": prompt_id, "node_id": sampler}]]}}
+                await self._send("execution_interrupted", {"prompt_id": prompt_id, "node_id": sampler}, sid)
+                return
+            await self._send("progress", {"value": step + 1, "max": self.steps, "prompt_id": prompt_id, "node": sampler}, sid)
+            await self._send(PREVIEW_IMAGE, struct.pack(">I", 1) + TINY_JPEG, sid)
+        for nid in saves:
+            self.counter += 1
+            filename = f"ComfyMini_{self.counter:05d}_.png"
+            with open(os.path.join(self.dirs["output"], filename), "wb") as f: f.write(TINY_PNG)
+            outputs[nid] = {"images": [{"filename": filename, "subfolder": "", "type": "output"}]}
+            await self._send("executing", {"node": nid, "prompt_id": prompt_id}, sid)
+            await self._send("executed", {"node": nid, "prompt_id": prompt_id, "output": outputs[nid]}, sid)
+        self.completed.append(prompt_id)
+        self.history[prompt_id] = {"outputs": outputs, "status": {"status_str": "success", "completed": True, "messages": [
+            ["execution_start", {"prompt_id": prompt_id}], ["execution_success", {"prompt_id": prompt_id}]]}}
+        await self._send("execution_success", {"prompt_id": prompt_id}, sid)
+        await self._send("executing", {"node": None, "prompt_id": prompt_id}, sid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8190)
+    parser.add_argument("--job-time", type=float, default=1.0, help="seconds per prompt")
+    parser.add_argument("--root", help="folder for output/input/temp (default: a temp dir)")
+    args = parser.parse_args()
+    root = args.root or tempfile.mkdtemp(prefix="fake-comfy-")
+    print(f"[fake-comfy] root={root} port={args.port}")
+    web.run_app(FakeComfy(root, args.job_time).app, host="127.0.0.1", port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Synthetic data shaped like the real library, output tree and node schemas."""
+import os
+import random
+
+CLASSES = (
+    ("CheckpointLoaderSimple", {"ckpt_name": "model.safetensors"}),
+    ("CLIPTextEncode", {"text": "a photo of a cat, highly detailed, soft light"}),
+    ("KSampler", {"seed": 0, "steps": 20, "cfg": 7.0, "sampler_name": "euler", "scheduler": "normal", "denoise": 1.0}),
+    ("LoraLoader", {"lora_name": "style.safetensors", "strength_model": 0.8, "strength_clip": 0.8}),
+    ("EmptyLatentImage", {"width": 1024, "height": 1024, "batch_size": 1}),
+    ("VAEDecode", {}),
+    ("ImageScaleBy", {"upscale_method": "lanczos", "scale_by": 1.5}),
+    ("SaveImage", {"filename_prefix": "ComfyMini"}),
+)
+# 1x1 PNG; enough for the index to stat and for the metadata reader to parse and skip
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082")
+
+
+def make_workflow(n_nodes, rng):
+    """API-format workflow with links to earlier nodes, `_meta` titles and a couple of MiniGroups."""
+    workflow = {}
+    for i in range(1, n_nodes + 1):
+        class_type, widgets = CLASSES[(i - 1) % len(CLASSES)]
+        inputs = dict(widgets)
+        if "seed" in inputs: inputs["seed"] = rng.randint(0, 2**32)
+        if i > 1:
+            for k in range(rng.randint(1, 3)): inputs[f"in_{k}"] = [str(rng.randint(1, i - 1)), 0]
+        workflow[str(i)] = {"inputs": inputs, "class_type": class_type, "_meta": {"title": f"{class_type} #{i}"}}
+    for g in range(max(1, n_nodes // 200)):
+        workflow[f"group_{g}"] = {"class_type": "MiniGroup", "inputs": {}, "_meta": {"title": f"Group {g}"},
+                                  "nodes": [str(rng.randint(1, n_nodes)) for _ in range(8)]}
+    return workflow
+
+def make_groups(workflow, rng, count=4):
+    node_ids = [nid for nid, n in workflow.items() if n.get("class_type") != "MiniGroup"]
+    return [{"id": f"group_{g}", "title": f"Group {g}",
+             "inputs": [{"nodeId": nid, "key": next(iter(workflow[nid]["inputs"]), "value")}
+                        for nid in rng.sample(node_ids, min(6, len(node_ids)))]}
+            for g in range(count)]
+
+def write_library(storage, count, nodes, huge_nodes, seed=0):
+    """`count` workflows plus one `huge.json`, saved through the package's own Storage so the
+    .meta.json / .groups.json sidecars are exactly what real saves produce. Returns the names."""
+    rng = random.Random(seed)
+    names = []
+    for i in range(count + 1):
+        name = "huge.json" if i == count else f"wf_{i:05d}.json"
+        workflow = make_workflow(huge_nodes if i == count else nodes, rng)
+        storage.write_library(name, workflow)
+        storage.write_groups(name, make_groups(workflow, rng))
+        names.append(name)
+    return names
+
+def write_output_tree(output_dir, files, per_folder):
+    """`files` tiny PNGs spread over subfolders of `per_folder`. Returns the subfolder names."""
+    folders = []
+    for n in range(files):
+        if n % per_folder == 0:
+            folders.append(f"batch_{n // per_folder:03d}")
+            os.makedirs(os.path.join(output_dir, folders[-1]), exist_ok=True)
+        with open(os.path.join(output_dir, folders[-1], f"ComfyMini_{n:07d}_.png"), "wb") as f: f.write(TINY_PNG)
+    return folders
+
+def make_object_info(count):
+    """Schema dict shaped like /object_info: the real fixture classes plus `count` filler classes."""
+    info = {}
+    names = [c for c, _ in CLASSES] + [f"CustomNode{i:05d}" for i in range(count)]
+    for name in names:
+        info[name] = {
+            "input": {"required": {f"param_{k}": ["INT", {"default": 0, "min": 0, "max": 100}] for k in range(6)}},
+            "output": ["IMAGE"], "output_name": ["IMAGE"], "name": name, "display_name": name,
+            "description": "", "category": "bench", "output_node": False,
+        }
+    return info
@@ -0,0 +1,328 @@
+"""Benchmarks for the /mini backend, outside ComfyUI.
+
+A copy of the package is loaded into a temp dir against stubbed ComfyUI modules (see
+stubs.py), fed synthetic fixtures (fixtures.py) and served by aiohttp on a background
+thread. Requests come from a client on the main thread, so the server loop's blocked
+time is measured without the client's own work mixed in.
+
+    python bench/run.py                      # full scale, results in bench/results/
+    python bench/run.py --scale quick --only list_files_page,get_workflow
+    python bench/run.py --compare bench/results/A.json bench/results/B.json
+
+Per scenario: throughput, latency p50/p95/p99, server-loop time per request and the
+longest single stall, RSS growth (and the traced allocation peak with --trace-memory).
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import importlib.util
+
+from aiohttp import ClientSession, web
+
+import stubs
+import fixtures
+
+PACKAGE = "comfyui_mini"
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO, "bench", "results")
+# Never copied: user data and generated state
+COPY_IGNORE = shutil.ignore_patterns(".git", "bench", "cache", "__pycache__", "workflows", "backups", "automations",
+                                     "favorites.json", "backends.json", "requests.jsonl")
+SCALES = {
+    "full": {"workflows": 1000, "nodes": 60, "huge_nodes": 5000, "files": 100_000, "per_folder": 5000,
+             "object_info": 2000, "requests": 1.0},
+    "quick": {"workflows": 100, "nodes": 60, "huge_nodes": 2000, "files": 10_000, "per_folder": 2000,
+              "object_info": 500, "requests": 0.2},
+}
+SETTLE_TIMEOUT = 600
+
+
+def percentile(values, q):
+    if not values: return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, not current, off Linux
+
+def git_revision():
+    try:
+        sha = subprocess.run(["git", "-C", REPO, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "-C", REPO, "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class LoopMonitor:
+    """Time the server loop spends inside callbacks, i.e. not available to other requests.
+
+    Wraps asyncio.Handle._run (every callback and task step goes through it) and only
+    counts the server thread.
+    """
+
+    def __init__(self):
+        self.thread_id = None
+        self.busy = 0.0
+        self.max = 0.0
+
+    def install(self, thread_id):
+        self.thread_id = thread_id
+        original = asyncio.events.Handle._run
+        monitor = self
+
+        def _run(handle):
+            if threading.get_ident() != monitor.thread_id: return original(handle)
+            start = time.perf_counter()
+            try: return original(handle)
+            finally:
+                elapsed = time.perf_counter() - start
+                monitor.busy += elapsed
+                if elapsed > monitor.max: monitor.max = elapsed
+
+        asyncio.events.Handle._run = _run
+
+    def reset(self):
+        self.busy, self.max = 0.0, 0.0
+
+
+class Backend:
+    """The package under test, served on its own thread and event loop."""
+
+    def __init__(self, root, scale):
+        self.root = root
+        self.scale = scale
+        self.pkg_dir = os.path.join(root, PACKAGE)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="bench-server", daemon=True)
+        self.monitor = LoopMonitor()
+        self.module = None
+        self.runner = None
+        self.port = None
+        self.library = []
+        self.folders = []
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def start(self):
+        shutil.copytree(REPO, self.pkg_dir, ignore=COPY_IGNORE)
+        prompt_server, dirs = stubs.install(self.root, self.loop, fixtures.make_object_info(self.scale["object_info"]))
+        t = time.perf_counter()
+        self.folders = fixtures.write_output_tree(dirs["output"], self.scale["files"], self.scale["per_folder"])
+        print(f"  output tree: {self.scale['files']} files in {len(self.folders)} folders ({time.perf_counter() - t:.1f}s)")
+        self.thread.start()
+        self.monitor.install(self.thread.ident)
+        self.call(self._setup(prompt_server))
+
+    async def _setup(self, prompt_server):
+        spec = importlib.util.spec_from_file_location(
+            PACKAGE, os.path.join(self.pkg_dir, "__init__.py"), submodule_search_locations=[self.pkg_dir])
+        self.module = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE] = self.module
+        spec.loader.exec_module(self.module)
+
+        t = time.perf_counter()
+        self.library = fixtures.write_library(self.module.storage, self.scale["workflows"], self.scale["nodes"], self.scale["huge_nodes"])
+        print(f"  library: {len(self.library)} workflows with meta/groups sidecars ({time.perf_counter() - t:.1f}s)")
+
+        prompt_server.app.add_routes(prompt_server.routes)
+        self.runner = web.AppRunner(prompt_server.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    def settle(self):
+        """Waits for the startup metadata scan so it doesn't compete with the measurements."""
+        index = self.module.metadata_index
+        deadline = time.time() + SETTLE_TIMEOUT
+        while index.indexed < self.scale["files"] and time.time() < deadline: time.sleep(0.2)
+        print(f"  metadata index: {index.indexed} images")
+
+    def stop(self):
+        self.call(self.module.session.flush())  # before the temp dir goes, not at interpreter exit
+        self.call(self.runner.cleanup())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+# --- SCENARIOS ---
+def scenarios(backend, scale):
+    """(name, method, path(i), body(i) or None, requests, concurrency)"""
+    rng = random.Random(1)
+    names = backend.library[:-1]
+    folders = backend.folders
+    workflow = fixtures.make_workflow(scale["nodes"], rng)
+    huge = fixtures.make_workflow(scale["huge_nodes"], rng)
+    groups = fixtures.make_groups(workflow, rng)
+    pick = lambda seq: (lambda i: seq[(i * 7919) % len(seq)])
+    name, folder = pick(names), pick(folders)
+    return [
+        ("list_workflows", "GET", lambda i: "/mini/list_workflows", None, 200, 8),
+        ("library", "GET", lambda i: "/mini/library", None, 200, 8),
+        ("library_search", "GET", lambda i: f"/mini/library?q=wf_{i % 10}+ksampler&sort=name&order=asc", None, 200, 8),
+        ("get_workflow", "GET", lambda i: f"/mini/get_workflow?filename={name(i)}", None, 500, 8),
+        ("get_workflow_huge", "GET", lambda i: "/mini/get_workflow?filename=huge.json", None, 50, 4),
+        ("select_workflow", "POST", lambda i: "/mini/select_workflow", lambda i: {"filename": name(i)}, 100, 1),
+        ("workflow_json", "GET", lambda i: "/mini/workflow.json", None, 300, 8),
+        ("save_workflow", "POST", lambda i: "/mini/save_workflow", lambda i: workflow, 200, 4),
+        ("save_workflow_huge", "POST", lambda i: "/mini/save_workflow", lambda i: huge, 20, 1),
+        ("save_library", "POST", lambda i: "/mini/save_library", lambda i: dict(workflow, _save_name=f"bench_{i % 50}"), 200, 4),
+        ("load_groups", "GET", lambda i: f"/mini/load_groups?filename={name(i)}", None, 300, 8),
+        ("save_groups", "POST", lambda i: "/mini/save_groups", lambda i: {"filename": name(i), "groups": groups}, 200, 4),
+        ("list_files_root", "GET", lambda i: "/mini/files?path=", None, 200, 8),
+        ("list_files_page", "GET", lambda i: f"/mini/files?path={folder(i)}&sort=mtime&limit=200", None, 500, 8),
+        ("list_files_full", "GET", lambda i: f"/mini/files?path={folder(i)}", None, 100, 4),
+        ("search", "GET", lambda i: f"/mini/search?q=ComfyMini_{i % 1000:04d}&limit=60", None, 200, 8),
+        ("object_info", "GET", lambda i: "/mini/object_info", None, 100, 4),
+        ("object_info_subset", "GET", lambda i: "/mini/object_info?classes=KSampler,SaveImage,CLIPTextEncode", None, 300, 8),
+        ("run", "POST", lambda i: "/mini/run", lambda i: {"workflow": workflow, "client_id": "bench"}, 200, 4),
+    ]
+
+async def drive(port, method, path, body, count, concurrency):
+    latencies, errors = [], 0
+    first = None
+    async with ClientSession(f"http://127.0.0.1:{port}") as client:
+        async def one(i):
+            nonlocal errors, first
+            start = time.perf_counter()
+            async with client.request(method, path(i), json=body(i) if body else None) as resp:
+                await resp.read()
+                if resp.status >= 400: errors += 1
+            elapsed = time.perf_counter() - start
+            if first is None: first = elapsed
+            latencies.append(elapsed)
+
+        queue = iter(range(count))
+        async def worker():
+            for i in queue: await one(i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return latencies, errors, wall, first
+
+def run_scenario(backend, scenario, scale, trace_memory):
+    name, method, path, body, count, concurrency = scenario
+    count = max(concurrency, int(count * scale["requests"]))
+    gc.collect()
+    rss_before = rss_mb()
+    if trace_memory: tracemalloc.reset_peak()
+    backend.monitor.reset()
+    latencies, errors, wall, first = asyncio.run(drive(backend.port, method, path, body, count, concurrency))
+    busy, stall = backend.monitor.busy, backend.monitor.max
+    ms = lambda s: round(s * 1000, 3) if s is not None else None
+    result = {
+        "requests": count, "concurrency": concurrency, "errors": errors,
+        "throughput_rps": round(count / wall, 1),
+        "latency_ms": {"first": ms(first), "p50": ms(percentile(latencies, 0.5)), "p95": ms(percentile(latencies, 0.95)),
+                       "p99": ms(percentile(latencies, 0.99)), "max": ms(max(latencies)), "mean": ms(sum(latencies) / len(latencies))},
+        "loop_busy_ms_per_request": ms(busy / count), "loop_utilization": round(busy / wall, 3), "loop_max_stall_ms": ms(stall),
+        "rss_delta_mb": round(rss_mb() - rss_before, 1),
+    }
+    if trace_memory: result["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    return result
+
+def micro_benchmarks(backend, scale):
+    """The pure workflow split/merge done on every save and load."""
+    storage = sys.modules[f"{PACKAGE}.storage"]
+    rng = random.Random(2)
+    out = {}
+    for label, n_nodes, repeat in (("typical", scale["nodes"], 2000), ("huge", scale["huge_nodes"], 50)):
+        workflow = fixtures.make_workflow(n_nodes, rng)
+        logic, meta = storage.split_workflow_data(workflow)
+        for fn_name, args in (("split_workflow_data", (workflow,)), ("merge_workflow_data", (logic, meta))):
+            fn = getattr(storage, fn_name)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn(*args)
+                times.append(time.perf_counter() - start)
+            out[f"{fn_name}_{label}"] = {"calls": repeat, "nodes": n_nodes, "ops_per_s": round(repeat / sum(times), 1),
+                                          "p50_us": round(percentile(times, 0.5) * 1e6, 1), "p95_us": round(percentile(times, 0.95) * 1e6, 1)}
+    return out
+
+
+# --- REPORTING ---
+def print_row(name, r):
+    lat = r["latency_ms"]
+    print(f"  {name:<20} {r['throughput_rps']:>9.1f} rps  p50 {lat['p50']:>8.2f}  p95 {lat['p95']:>8.2f}  p99 {lat['p99']:>8.2f} ms"
+          f"  loop {r['loop_busy_ms_per_request']:>7.3f} ms/req  stall {r['loop_max_stall_ms']:>7.2f} ms"
+          f"  rss {r['rss_delta_mb']:>+6.1f} MB" + (f"  errors {r['errors']}" if r["errors"] else ""))
+
+def compare(old_path, new_path):
+    with open(old_path) as f: old = json.load(f)
+    with open(new_path) as f: new = json.load(f)
+    print(f"{old['meta']['revision']} -> {new['meta']['revision']}  (scale {old['meta']['scale']} -> {new['meta']['scale']})")
+    pct = lambda a, b: f"{(b - a) / a * 100:+6.1f}%" if a else "     n/a"
+    for name, b in new["scenarios"].items():
+        a = old["scenarios"].get(name)
+        if not a: continue
+        print(f"  {name:<20} p50 {pct(a['latency_ms']['p50'], b['latency_ms']['p50'])}  p95 {pct(a['latency_ms']['p95'], b['latency_ms']['p95'])}"
+              f"  rps {pct(a['throughput_rps'], b['throughput_rps'])}  loop/req {pct(a['loop_busy_ms_per_request'], b['loop_busy_ms_per_request'])}")
+    for name, b in new.get("micro", {}).items():
+        a = old.get("micro", {}).get(name)
+        if a: print(f"  {name:<34} p50 {pct(a['p50_us'], b['p50_us'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="full")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--out", help="results file (default bench/results/<time>-<revision>.json)")
+    parser.add_argument("--trace-memory", action="store_true", help="also report tracemalloc peaks (slower)")
+    parser.add_argument("--keep", action="store_true", help="keep the temp dir with the fixtures")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+    if args.compare: return compare(*args.compare)
+
+    scale = SCALES[args.scale]
+    root = tempfile.mkdtemp(prefix="comfymini-bench-")
+    print(f"[bench] scale={args.scale} root={root}")
+    if args.trace_memory: tracemalloc.start()
+    backend = Backend(root, scale)
+    try:
+        backend.start()
+        backend.settle()
+        only = set(args.only.split(",")) if args.only else None
+        results = {}
+        for scenario in scenarios(backend, scale):
+            if only and scenario[0] not in only: continue
+            results[scenario[0]] = run_scenario(backend, scenario, scale, args.trace_memory)
+            print_row(scenario[0], results[scenario[0]])
+        micro = micro_benchmarks(backend, scale)
+        for name, r in micro.items(): print(f"  {name:<34} {r['ops_per_s']:>10.1f} ops/s  p50 {r['p50_us']:>10.1f} us  p95 {r['p95_us']:>10.1f} us")
+        backend.stop()
+    finally:
+        if not args.keep: shutil.rmtree(root, ignore_errors=True)
+
+    revision = git_revision()
+    report = {
+        "meta": {"revision": revision, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "scale": args.scale, "fixtures": scale,
+                 "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                 "rss_mb": round(rss_mb(), 1)},
+        "scenarios": results, "micro": micro,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f: json.dump(report, f, indent=2)
+    print(f"[bench] results: {out}")
+
+
+if __name__ == "__main__":
+    main()
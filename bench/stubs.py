@@ -0,0 +1,89 @@
+"""Minimal stand-ins for the ComfyUI modules the package imports at load time.
+
+Only what the /mini routes touch is provided: PromptServer (routes, app, loop, queue,
+send_sync), folder_paths (output/input/temp dirs), execution.validate_prompt and
+nodes.NODE_CLASS_MAPPINGS. Prompts are validated as-is and never executed.
+"""
+import os
+import sys
+import types
+
+from aiohttp import web
+
+
+class PromptQueue:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+    def get_current_queue(self):
+        return [], list(self.items)
+
+    def delete_queue_item(self, match):
+        for i, item in enumerate(self.items):
+            if match(item):
+                del self.items[i]
+                return True
+        return False
+
+    def get_history(self, prompt_id=None):
+        return {}
+
+
+class PromptServer:
+    instance = None
+
+    def __init__(self, loop, object_info):
+        PromptServer.instance = self
+        self.loop = loop
+        self.app = web.Application(client_max_size=256 * 1024 * 1024)
+        self.routes = web.RouteTableDef()
+        self.prompt_queue = PromptQueue()
+        self.number = 0
+        self.client_id = None
+
+        @self.routes.get("/object_info")
+        async def get_object_info(request):
+            return web.json_response(object_info)
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+    def trigger_on_prompt(self, json_data):
+        return json_data
+
+    def queue_updated(self):
+        pass
+
+
+def _validate_prompt(prompt_id, prompt, partial_execution_list=None):
+    outputs = [nid for nid, node in prompt.items() if "Save" in node.get("class_type", "")]
+    return True, None, outputs, {}
+
+
+def install(root, loop, object_info):
+    """Registers fake `server`, `folder_paths`, `execution` and `nodes` modules rooted at `root`."""
+    dirs = {name: os.path.join(root, name) for name in ("output", "input", "temp", "models")}
+    for d in dirs.values(): os.makedirs(d, exist_ok=True)
+
+    server = types.ModuleType("server")
+    server.PromptServer = PromptServer
+    PromptServer(loop, object_info)
+
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.get_output_directory = lambda: dirs["output"]
+    folder_paths.get_input_directory = lambda: dirs["input"]
+    folder_paths.get_temp_directory = lambda: dirs["temp"]
+    folder_paths.folder_names_and_paths = {"checkpoints": ([dirs["models"]], {".safetensors"})}
+
+    execution = types.ModuleType("execution")
+    execution.validate_prompt = _validate_prompt
+
+    nodes = types.ModuleType("nodes")
+    nodes.NODE_CLASS_MAPPINGS = {name: object for name in object_info}
+    nodes.interrupt_processing = lambda value=True: None
+
+    sys.modules.update({"server": server, "folder_paths": folder_paths, "execution": execution, "nodes": nodes})
+    return PromptServer.instance, dirs
@@ -0,0 +1,169 @@
+import os
+import stat
+import time
+import errno
+import shutil
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import IO_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # ioctl(2) reflink on btrfs / xfs / bcachefs
+MAX_HASHES = 4096
+MAX_BATCH = 64
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mini-bridge")
+
+
+def _reflink(src, dest):
+    if fcntl is None: raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+    fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        with open(src, "rb") as s: fcntl.ioctl(fd, FICLONE, s.fileno())
+    except OSError:
+        os.close(fd)
+        os.remove(dest)
+        raise
+    os.close(fd)
+
+
+class ImageBridge:
+    """Puts output/temp images into the input folder for LoadImage without duplicating bytes.
+
+    An image already present in the input folder (same inode, or same size and sha256) is
+    returned under its existing name. Otherwise the file is reflinked (copy-on-write), and copied
+    when the filesystem can't (e.g. input on another disk). Hardlinking is opt-in through
+    `methods` and only used for read-only sources: a shared inode would let an in-place edit
+    of either name rewrite the other.
+    Candidates come from the input-folder FileIndex, so only same-size files are ever hashed.
+    """
+
+    def __init__(self, resolve_source, input_dir, file_index, methods=("reflink",)):
+        self.resolve_source = resolve_source  # (folder_type, subfolder, filename) -> path or None
+        self.input_dir = input_dir
+        self.file_index = file_index
+        self.methods = tuple(methods)
+        self.stats = {"reflink": 0, "hardlink": 0, "copy": 0, "existing": 0}
+        self._hashes = OrderedDict()  # path -> ((mtime_ns, size), sha256)
+        self._written = {}  # name -> size, for files created since the index last rescanned
+        self._lock = threading.Lock()
+
+    # --- hashing ---
+    def _digest(self, path, st):
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._hashes.get(path)
+            if cached and cached[0] == key:
+                self._hashes.move_to_end(path)
+                return cached[1]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._hashes[path] = (key, digest)
+            while len(self._hashes) > MAX_HASHES: self._hashes.popitem(last=False)
+        return digest
+
+    def _find_existing(self, src, src_st, sizes):
+        input_dir = self.input_dir()
+        src_digest = None
+        for name, size in sizes.items():
+            if size != src_st.st_size: continue
+            path = os.path.join(input_dir, name)
+            try: st = os.stat(path)
+            except OSError: continue
+            if st.st_size != src_st.st_size: continue
+            if (st.st_ino, st.st_dev) == (src_st.st_ino, src_st.st_dev): return name
+            if src_digest is None: src_digest = self._digest(src, src_st)
+            if self._digest(path, st) == src_digest: return name
+        return None
+
+    # --- linking ---
+    def _materialize(self, src, dest):
+        for method in self.methods:
+            try:
+                if method == "reflink": _reflink(src, dest)
+                elif method == "hardlink":
+                    if os.stat(src).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH): continue
+                    os.link(src, dest)
+                return method
+            except FileExistsError:
+                raise
+            except OSError:
+                continue  # EXDEV, EPERM, EOPNOTSUPP... try the next one
+        # O_EXCL keeps a concurrent bridge from clobbering a name chosen at the same time
+        with open(src, "rb") as s, open(dest, "xb") as d: shutil.copyfileobj(s, d, 1 << 20)
+        shutil.copymode(src, dest)
+        return "copy"
+
+    def _place(self, src, filename):
+        input_dir = self.input_dir()
+        base, ext = os.path.splitext(filename)
+        candidate, n = filename, 0
+        while True:
+            dest = os.path.join(input_dir, candidate)
+            if not os.path.exists(dest):
+                try: return candidate, self._materialize(src, dest)
+                except FileExistsError: pass
+            n += 1
+            # Name taken by different bytes: keep the old timestamp suffix scheme, with a counter on repeats
+            candidate = f"{base}_{int(time.time())}{ext}" if n == 1 else f"{base}_{int(time.time())}_{n}{ext}"
+
+    def _bridge_sync(self, image, sizes):
+        filename = os.path.basename(image.get("filename") or "")
+        if not filename: raise ValueError("No filename")
+        folder_type = "temp" if image.get("type") == "temp" else "output"
+        src = self.resolve_source(folder_type, image.get("subfolder", ""), filename)
+        if not src or not os.path.isfile(src): raise FileNotFoundError("Source file not found")
+        src_st = os.stat(src)
+
+        with self._lock: sizes = dict(sizes, **self._written)
+        existing = self._find_existing(src, src_st, sizes)
+        if existing:
+            with self._lock: self.stats["existing"] += 1
+            return {"filename": existing, "method": "existing"}
+
+        with IO_SECONDS.time(op="bridge_place"):
+            name, method = self._place(src, filename)
+        with self._lock:
+            self._written[name] = src_st.st_size
+            self.stats[method] += 1
+        print(f"[ComfyMini] Bridged image {filename} to Input folder as {name} ({method}).")
+        return {"filename": name, "method": method}
+
+    def _bridge_many(self, images, sizes):
+        results = []
+        for image in images:
+            try: results.append(self._bridge_sync(image, sizes))
+            except (OSError, ValueError) as e: results.append({"error": str(e)})
+        return results
+
+    # --- async API ---
+    async def _input_sizes(self):
+        idx = await self.file_index.get(self.input_dir())
+        entries, _, _ = idx.page("name", False, "", None, None)
+        with self._lock:
+            # The index caught up with these once it lists them
+            for e in entries: self._written.pop(e.name, None)
+        return {e.name: e.size for e in entries}
+
+    async def bridge(self, images):
+        """Bridges a list of {filename, subfolder, type}. Returns one {filename, method} or {error} per image."""
+        sizes = await self._input_sizes()
+        return await asyncio.get_running_loop().run_in_executor(_executor, self._bridge_many, images, sizes)
+
+    async def bridge_one(self, filename, subfolder="", folder_type="output"):
+        """Single image; returns the input filename and raises like the old copy did."""
+        sizes = await self._input_sizes()
+        image = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        result = await asyncio.get_running_loop().run_in_executor(_executor, self._bridge_sync, image, sizes)
+        return result["filename"]
@@ -0,0 +1,151 @@
+import os
+import json
+import threading
+
+from .prompts import EXCLUDED_CLASSES
+from .storage import write_atomic
+
+SCHEMA_VERSION = 1
+SORTS = {
+    "name": lambda e: e["filename"].lower(),
+    "mtime": lambda e: e["mtime"],
+    "last_run": lambda e: e.get("last_run") or 0,
+    "runs": lambda e: e.get("runs", 0),
+    "nodes": lambda e: e["nodes"],
+}
+
+
+def _stamp(path):
+    try: st = os.stat(path)
+    except OSError: return None
+    return [st.st_mtime_ns, st.st_size]
+
+def _load_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f: return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def _is_link(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int)
+
+def summarize(logic, meta, groups):
+    """Catalog fields of one library workflow (logic file, .meta.json, .groups.json)."""
+    nodes = [n for n in logic.values()
+             if isinstance(n, dict) and n.get("class_type") and n["class_type"] not in EXCLUDED_CLASSES]
+    inputs = links = 0
+    for node in nodes:
+        for value in (node.get("inputs") or {}).values():
+            if _is_link(value): links += 1
+            else: inputs += 1
+    groups = groups if isinstance(groups, list) else []
+    return {
+        "nodes": len(nodes),
+        "classes": sorted({n["class_type"] for n in nodes}),
+        "inputs": inputs,
+        "links": links,
+        "groups": len(groups),
+        "group_inputs": sum(len(g.get("inputs", [])) for g in groups if isinstance(g, dict)),
+        "mini_groups": sum(1 for n in meta.values() if isinstance(n, dict) and n.get("class_type") == "MiniGroup"),
+    }
+
+
+class LibraryCatalog:
+    """Summaries of every library workflow, persisted in cache/ and kept in step with the files.
+
+    A refresh costs two directory stats unless WORKFLOWS_DIR or META_DIR changed (every
+    save is an atomic rename, which bumps the directory mtime); then each workflow's
+    logic/meta/groups files are stat'ed and only the ones whose stamps moved are parsed.
+    Last run and latest output are not stored here: they come from the job ledger and the
+    metadata index at request time.
+    """
+
+    def __init__(self, workflows_dir, meta_dir, cache_path):
+        self.workflows_dir = workflows_dir
+        self.meta_dir = meta_dir
+        self.cache_path = cache_path
+        self.entries = {}  # filename -> entry (with "stamp")
+        self.version = 0
+        self.builds = 0
+        self._dirs = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try: data = _load_json(self.cache_path, {})
+        except ValueError: data = {}
+        if data.get("schema") == SCHEMA_VERSION: self.entries = data.get("entries", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        write_atomic(self.cache_path, json.dumps({"schema": SCHEMA_VERSION, "entries": self.entries}).encode("utf-8"), ".json")
+
+    def _paths(self, filename):
+        base = filename[:-5]
+        return (os.path.join(self.workflows_dir, filename), os.path.join(self.meta_dir, base + ".meta.json"),
+                os.path.join(self.meta_dir, base + ".groups.json"))
+
+    def _summarize(self, filename, paths, stamp):
+        entry = {"filename": filename, "stamp": stamp, "mtime": stamp[0][0] / 1e9, "size": stamp[0][1]}
+        try:
+            logic = _load_json(paths[0], {})
+            meta = _load_json(paths[1], {}) if stamp[1] else {}
+            groups = _load_json(paths[2], []) if stamp[2] else []
+            if not isinstance(logic, dict): raise ValueError("not an API-format workflow")
+            entry.update(summarize(logic, meta if isinstance(meta, dict) else {}, groups))
+            entry["has_groups"] = stamp[2] is not None
+        except (OSError, ValueError) as e:
+            entry.update(summarize({}, {}, []), has_groups=stamp[2] is not None, error=str(e))
+        return entry
+
+    def refresh(self):
+        """Brings the catalog up to date. Blocking; returns True when something changed."""
+        with self._lock:
+            dirs = (_stamp(self.workflows_dir), _stamp(self.meta_dir))
+            if dirs == self._dirs: return False
+            names = []
+            if os.path.isdir(self.workflows_dir):
+                with os.scandir(self.workflows_dir) as it:
+                    names = [e.name for e in it if e.name.endswith('.json') and not e.name.startswith('.') and e.is_file()]
+            changed = False
+            for name in names:
+                paths = self._paths(name)
+                stamp = [_stamp(p) for p in paths]
+                if stamp[0] is None: continue
+                entry = self.entries.get(name)
+                if entry is None or entry.get("stamp") != stamp:
+                    self.entries[name] = self._summarize(name, paths, stamp)
+                    changed = True
+            for name in set(self.entries) - set(names):
+                del self.entries[name]
+                changed = True
+            self._dirs = dirs
+            if changed or self.builds == 0:
+                self.version += 1
+                self.builds += 1
+                try: self._save()
+                except OSError as e: print(f"[ComfyMini] Could not persist library catalog: {e}")
+            return changed
+
+    def listing(self, q="", sort="mtime", reverse=True, runs=None, latest=None):
+        """Entries matching every word of `q` (filename or node class), annotated with run info and sorted.
+
+        runs: {origin: (last_run, count)} from the job ledger; latest: {origin: image} from the metadata index.
+        """
+        if sort not in SORTS: raise ValueError(f"Invalid sort '{sort}'")
+        terms = q.lower().split()
+        runs, latest = runs or {}, latest or {}
+        out = []
+        for entry in list(self.entries.values()):
+            if terms:
+                haystack = " ".join([entry["filename"]] + entry["classes"]).lower()
+                if not all(t in haystack for t in terms): continue
+            item = {k: v for k, v in entry.items() if k != "stamp"}
+            image = latest.get(entry["filename"])
+            last_run, count = runs.get(entry["filename"], (None, 0))
+            # Images made before the ledger existed still tell us when it last ran
+            if image and (last_run is None or image["mtime"] > last_run): last_run = image["mtime"]
+            item.update(last_run=last_run, runs=count, thumbnail=image)
+            out.append(item)
+        out.sort(key=SORTS[sort], reverse=reverse)
+        return out
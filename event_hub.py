@@ -0,0 +1,56 @@
+import json
+import asyncio
+
+from aiohttp import web
+
+HEARTBEAT_SECONDS = 15
+CLIENT_QUEUE_SIZE = 256
+
+
+class EventHub:
+    """Fan-out of server-side events to /mini clients over Server-Sent Events.
+
+    Each client subscribes to a set of topics; a client that stops reading has
+    its oldest queued events dropped rather than stalling publishers.
+    """
+
+    def __init__(self):
+        self._clients = set()  # (queue, topics)
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def publish(self, topic, data):
+        if not self._clients: return
+        payload = f"event: {topic}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+        for queue, topics in list(self._clients):
+            if topics and topic not in topics: continue
+            if queue.full():
+                try: queue.get_nowait()
+                except asyncio.QueueEmpty: pass
+            queue.put_nowait(payload)
+
+    async def handle(self, request):
+        topics = {t for t in request.query.get("topics", "").split(",") if t}
+        resp = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+        await resp.prepare(request)
+        client = (asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE), frozenset(topics))
+        self._clients.add(client)
+        try:
+            await resp.write(b"retry: 3000\n\n")
+            while True:
+                try:
+                    payload = await asyncio.wait_for(client[0].get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    payload = ": ping\n\n"
+                await resp.write(payload.encode("utf-8"))
+        except ConnectionResetError:
+            pass
+        finally:
+            self._clients.discard(client)
+        return resp
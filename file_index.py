@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+
+from .metrics import IO_SECONDS
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+SORT_KEYS = {
+    "name": lambda e: (e.name,),
+    "mtime": lambda e: (e.mtime_ns, e.name),
+    "size": lambda e: (e.size, e.name),
+}
+MAX_FOLDERS = 64
+STALE = -1  # dir_mtime_ns of an index whose watcher lost events: rescanned on next refresh, ignores apply()
+
+FileEntry = namedtuple("FileEntry", ["name", "mtime_ns", "size"])
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return tuple(json.loads(base64.urlsafe_b64decode(padded.encode("ascii"))))
+
+
+class FolderIndex:
+    """Image listing for one directory, rebuilt only when the directory mtime changes.
+
+    Sorted views are computed lazily per sort key and dropped on every rebuild.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dir_mtime_ns = None
+        self.files = {}  # name -> FileEntry
+        self.folders = []
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Rescans if the directory changed. Returns (added, removed) or None when nothing was rescanned."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            with self._lock:
+                removed = list(self.files)
+                self.dir_mtime_ns = None; self.files = {}; self.folders = []; self._views = {}
+            return ([], removed) if removed else None
+        with self._lock:
+            if st.st_mtime_ns == self.dir_mtime_ns: return None
+            files = {}; folders = []
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.name.startswith('.'): continue
+                    try:
+                        if entry.is_dir():
+                            folders.append(entry.name)
+                        elif entry.name.lower().endswith(IMAGE_EXTS):
+                            est = entry.stat()
+                            files[entry.name] = FileEntry(entry.name, est.st_mtime_ns, est.st_size)
+                    except OSError:
+                        continue  # vanished mid-scan
+            folders.sort()
+            first_scan = self.dir_mtime_ns is None and not self.files
+            added = [] if first_scan else [e for name, e in files.items() if self.files.get(name) != e]
+            removed = [] if first_scan else [name for name in self.files if name not in files]
+            self.files = files; self.folders = folders; self._views = {}
+            self.dir_mtime_ns = st.st_mtime_ns
+            return added, removed
+
+    def invalidate(self):
+        with self._lock:
+            if self.dir_mtime_ns is not None: self.dir_mtime_ns = STALE
+
+    def apply(self, added=(), removed=(), folders_added=(), folders_removed=()):
+        """Incremental update from the watcher. Only touches an index that has already been scanned and is not stale."""
+        with self._lock:
+            if self.dir_mtime_ns in (None, STALE): return
+            for e in added: self.files[e.name] = e
+            for name in removed: self.files.pop(name, None)
+            if folders_added or folders_removed:
+                self.folders = sorted((set(self.folders) | set(folders_added)) - set(folders_removed))
+            self._views = {}
+            try: self.dir_mtime_ns = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError: self.dir_mtime_ns = None
+
+    def _view(self, sort):
+        view = self._views.get(sort)
+        if view is None:
+            key_fn = SORT_KEYS[sort]
+            entries = sorted(self.files.values(), key=key_fn)
+            view = (entries, [key_fn(e) for e in entries])
+            self._views[sort] = view
+        return view
+
+    def page(self, sort="name", reverse=True, prefix="", cursor=None, limit=None):
+        """Returns (entries, next_cursor, total). The cursor is the sort key of the last entry returned."""
+        with self._lock:
+            entries, keys = self._view(sort)
+            n = len(entries)
+            ck = decode_cursor(cursor) if cursor else None
+            if reverse:
+                start = (bisect_left(keys, ck) - 1) if ck else n - 1
+                indices = range(start, -1, -1)
+            else:
+                start = bisect_right(keys, ck) if ck else 0
+                indices = range(start, n)
+
+            prefix = prefix.lower()
+            out = []
+            next_cursor = None
+            for i in indices:
+                e = entries[i]
+                if prefix and not e.name.lower().startswith(prefix): continue
+                if limit is not None and len(out) >= limit:
+                    next_cursor = encode_cursor(keys[out_last])
+                    break
+                out.append(e); out_last = i
+
+            total = n if not prefix else sum(1 for e in entries if e.name.lower().startswith(prefix))
+            return out, next_cursor, total
+
+
+class FileIndex:
+    """Registry of FolderIndex objects, bounded to the most recently used folders."""
+
+    def __init__(self, max_folders=MAX_FOLDERS):
+        self.max_folders = max_folders
+        self._folders = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def loaded(self):
+        return list(self._folders.values())
+
+    def peek(self, path):
+        return self._folders.get(path)
+
+    def folder(self, path):
+        idx = self._folders.get(path)
+        if idx is None:
+            idx = FolderIndex(path)
+            self._folders[path] = idx
+            while len(self._folders) > self.max_folders:
+                self._folders.popitem(last=False)
+        else:
+            self._folders.move_to_end(path)
+        return idx
+
+    async def get(self, path):
+        idx = self.folder(path)
+        start = time.perf_counter()
+        scanned = await asyncio.get_running_loop().run_in_executor(None, idx.refresh)
+        if scanned is not None: self.misses += 1
+        else: self.hits += 1
+        IO_SECONDS.observe(time.perf_counter() - start, op="folder_scan" if scanned is not None else "folder_stat")
+        return idx
@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import asyncio
+import threading
+
+from .file_index import FileEntry, IMAGE_EXTS
+
+POLL_INTERVAL = 2.0
+BATCH_WINDOW = 0.25  # inotify events are coalesced for this long before being published
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    def __init__(self):
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm = libc.inotify_rm_watch
+        self._rm.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._ctypes = ctypes
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path):
+        wd = self._add(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read_events(self):
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []; pos = 0
+        while pos < len(buf):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, pos)
+            pos += _EVENT_HEADER.size
+            name = buf[pos:pos + length].rstrip(b"\0")
+            pos += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+
+class DirectoryWatcher:
+    """Keeps FileIndex folders current and reports image deltas for the output/input trees.
+
+    Uses inotify on Linux and falls back to polling the directory mtime of every
+    indexed folder elsewhere (or when inotify is unavailable). Folders left without a
+    watch once the inotify limit is reached are polled alongside.
+    `on_change(folder_type, subfolder, added, removed)` is called on the event loop.
+    """
+
+    def __init__(self, file_index, roots, on_change, poll_interval=POLL_INTERVAL):
+        self.file_index = file_index
+        self.roots = {t: os.path.abspath(p) for t, p in roots.items()}
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.mode = None
+        self.loop = None
+        self._wds = {}  # wd -> (folder_type, abs dir)
+        self._limit_hit = False
+        self._polling = False
+        self._stop = threading.Event()
+
+    def start(self, loop):
+        self.loop = loop
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+                for folder_type, root in self.roots.items():
+                    self._watch_tree(folder_type, root)
+                threading.Thread(target=self._inotify_loop, name="mini-inotify", daemon=True).start()
+                self.mode = "inotify"
+                print(f"[ComfyMini] File watcher: inotify on {len(self._wds)} folders")
+                return
+            except Exception as e:
+                print(f"[ComfyMini] inotify unavailable ({e}), falling back to polling")
+        self.mode = "poll"
+        self._start_polling()
+        print(f"[ComfyMini] File watcher: polling every {self.poll_interval}s")
+
+    def _start_polling(self):
+        if self._polling: return
+        self._polling = True
+        self.loop.create_task(self._poll_loop())
+
+    def stop(self):
+        self._stop.set()
+
+    def _locate(self, folder_type, path):
+        rel = os.path.relpath(path, self.roots[folder_type])
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    # --- inotify ---
+    def _watch_tree(self, folder_type, root):
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            if self._limit_hit: continue  # polled instead
+            try:
+                self._wds[self._inotify.add_watch(dirpath)] = (folder_type, dirpath)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    self._limit_hit = True
+                    print(f"[ComfyMini] inotify watch limit reached at {dirpath}; polling unwatched folders "
+                          f"(raise fs.inotify.max_user_watches for full coverage)")
+                    self.loop.call_soon_threadsafe(self._start_polling)
+                    continue
+                if not os.path.isdir(dirpath): continue  # removed while walking
+                raise
+
+    def _inotify_loop(self):
+        pending = {}  # (folder_type, dir) -> {"added": {}, "removed": set(), "dirs_added": set(), "dirs_removed": set()}
+        deadline = None
+        while not self._stop.is_set():
+            timeout = max(0.0, deadline - time.monotonic()) if deadline else 1.0
+            ready, _, _ = select.select([self._inotify.fd], [], [], timeout)
+            if ready:
+                for wd, mask, name in self._inotify.read_events():
+                    self._handle_event(pending, wd, mask, name)
+                if pending and deadline is None: deadline = time.monotonic() + BATCH_WINDOW
+            if deadline and time.monotonic() >= deadline:
+                batch, pending, deadline = pending, {}, None
+                self.loop.call_soon_threadsafe(self._publish, batch)
+
+    def _handle_event(self, pending, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Kernel dropped events: rescan every loaded index and send clients what changed
+            for idx in self.file_index.loaded(): idx.invalidate()
+            asyncio.run_coroutine_threadsafe(self._resync(), self.loop)
+            return
+        if mask & IN_IGNORED:
+            self._wds.pop(wd, None)
+            return
+        target = self._wds.get(wd)
+        if not target or not name or name.startswith('.'): return
+        folder_type, dirpath = target
+        bucket = pending.setdefault(target, {"added": {}, "removed": set(), "dirs_added": set(), "dirs_removed": set()})
+        full = os.path.join(dirpath, name)
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                bucket["dirs_added"].add(name); bucket["dirs_removed"].discard(name)
+                try: self._watch_tree(folder_type, full)
+                except OSError: pass
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                bucket["dirs_removed"].add(name); bucket["dirs_added"].discard(name)
+            return
+
+        if not name.lower().endswith(IMAGE_EXTS): return
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            try: st = os.stat(full)
+            except OSError: return
+            bucket["added"][name] = FileEntry(name, st.st_mtime_ns, st.st_size)
+            bucket["removed"].discard(name)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            bucket["added"].pop(name, None)
+            bucket["removed"].add(name)
+
+    def _publish(self, batch):
+        for (folder_type, dirpath), b in batch.items():
+            idx = self.file_index.peek(dirpath)
+            if idx is not None:
+                idx.apply(b["added"].values(), b["removed"], b["dirs_added"], b["dirs_removed"])
+            if b["added"] or b["removed"]:
+                self.on_change(folder_type, self._locate(folder_type, dirpath), list(b["added"].values()), sorted(b["removed"]))
+
+    # --- polling fallback ---
+    async def _refresh(self, indexes):
+        loop = asyncio.get_running_loop()
+        for idx in indexes:
+            folder_type = next((t for t, r in self.roots.items() if idx.path == r or idx.path.startswith(r + os.sep)), None)
+            if folder_type is None: continue
+            try:
+                diff = await loop.run_in_executor(None, idx.refresh)
+            except OSError:
+                continue
+            if diff and (diff[0] or diff[1]):
+                self.on_change(folder_type, self._locate(folder_type, idx.path), diff[0], diff[1])
+
+    async def _resync(self):
+        await self._refresh(self.file_index.loaded())
+
+    async def _poll_loop(self):
+        if self.mode == "poll":
+            for root in self.roots.values(): self.file_index.folder(root)
+        while not self._stop.is_set():
+            await asyncio.sleep(self.poll_interval)
+            indexes = self.file_index.loaded()
+            if self.mode != "poll":
+                watched = {d for _, d in list(self._wds.values())}
+                indexes = [idx for idx in indexes if idx.path not in watched]
+            await self._refresh(indexes)
@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+SCHEMA_VERSION = 1
+RETENTION_DAYS = 90  # raw jobs/node rows; hourly rollups are kept forever
+PRUNE_EVERY = 500  # finished jobs between retention sweeps
+MAX_ACTIVE = 2000  # queued/running prompts tracked in memory (removed-from-queue ones never finish)
+MAX_OUTPUTS = 50
+BUCKETS = {"hour": 3600, "day": 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    prompt_id TEXT PRIMARY KEY,
+    origin TEXT NOT NULL,
+    params_hash TEXT,
+    nodes INTEGER,
+    cached INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL,
+    started_at REAL,
+    ended_at REAL,
+    status TEXT NOT NULL,
+    error TEXT,
+    outputs TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs(queued_at);
+CREATE INDEX IF NOT EXISTS jobs_origin ON jobs(origin, queued_at);
+CREATE TABLE IF NOT EXISTS node_runs (
+    prompt_id TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    class_type TEXT,
+    started_at REAL NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (prompt_id, node_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS node_runs_started ON node_runs(started_at);
+CREATE TABLE IF NOT EXISTS rollups (
+    hour INTEGER NOT NULL,
+    origin TEXT NOT NULL,
+    jobs INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    run_seconds REAL NOT NULL,
+    wait_seconds REAL NOT NULL,
+    PRIMARY KEY (hour, origin)
+) WITHOUT ROWID;
+"""
+
+FINAL_STATES = {"execution_success": "success", "execution_error": "error", "execution_interrupted": "interrupted"}
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values: return None
+    return values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+
+def _summary(values):
+    values = sorted(v for v in values if v is not None)
+    return {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+            "mean": sum(values) / len(values) if values else None}
+
+def _origin(extra_data):
+    workflow = (extra_data or {}).get("extra_pnginfo", {}).get("workflow", {})
+    return workflow.get("extra", {}).get("mini_origin") or "workflow"
+
+def params_hash(prompt):
+    return hashlib.sha1(json.dumps(prompt, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class JobLedger:
+    """Durable record of every prompt queued through /mini and how long each node took.
+
+    Queue-time facts come from the prompts queue hook; timings from the PromptEvents tap
+    (node time is the gap between consecutive `executing` events). In-flight prompts live
+    in memory; rows are written by one background thread so the event loop never touches
+    the database. Finished jobs also fold into hourly per-workflow rollups, which outlive
+    the raw rows pruned after RETENTION_DAYS.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.recorded = 0
+        self._active = OrderedDict()  # prompt_id -> in-flight state
+        self._writes = queue.Queue()
+        self._local = threading.local()
+        self._thread = None
+        self._init_db()
+
+    # --- database ---
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None: conn = self._local.conn = self._connect()
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._connect()
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS jobs; DROP TABLE IF EXISTS node_runs; DROP TABLE IF EXISTS rollups;")
+            conn.executescript(SCHEMA)
+            # Whatever was in flight when the server stopped will never report back
+            conn.execute("UPDATE jobs SET status = 'lost' WHERE status IN ('queued', 'running')")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def start(self, events):
+        events.add_listener(self.on_event)
+        self._thread = threading.Thread(target=self._run, name="mini-ledger", daemon=True)
+        self._thread.start()
+
+    # --- writer (worker thread only) ---
+    def _run(self):
+        conn = self._connect()
+        finished = 0
+        while True:
+            writes = [self._writes.get()]
+            while True:
+                try: writes.append(self._writes.get_nowait())
+                except queue.Empty: break
+            try:
+                for kind, row in writes:
+                    if kind == "queued":
+                        conn.execute("INSERT OR REPLACE INTO jobs (prompt_id, origin, params_hash, nodes, queued_at, status) "
+                                     "VALUES (?, ?, ?, ?, ?, 'queued')", row)
+                    elif kind == "started":
+                        conn.execute("UPDATE jobs SET started_at = ?, status = 'running' WHERE prompt_id = ?", row)
+                    elif kind == "finished":
+                        self._write_finished(conn, row)
+                        finished += 1
+                conn.commit()
+                if finished >= PRUNE_EVERY:
+                    finished = 0
+                    self._prune(conn)
+            except Exception as e:
+                print(f"[ComfyMini] Job ledger write failed: {e}")
+
+    def _write_finished(self, conn, job):
+        conn.execute("UPDATE jobs SET started_at = ?, ended_at = ?, status = ?, error = ?, cached = ?, outputs = ? WHERE prompt_id = ?",
+                     (job["started"], job["ended"], job["status"], job["error"], job["cached"],
+                      json.dumps(job["outputs"]) if job["outputs"] else None, job["prompt_id"]))
+        conn.executemany("INSERT OR REPLACE INTO node_runs (prompt_id, node_id, class_type, started_at, seconds) VALUES (?, ?, ?, ?, ?)",
+                         [(job["prompt_id"], nid, cls, start, secs) for nid, cls, start, secs in job["node_runs"]])
+        started = job["started"] or job["ended"]
+        conn.execute(
+            "INSERT INTO rollups (hour, origin, jobs, failed, run_seconds, wait_seconds) VALUES (?, ?, 1, ?, ?, ?) "
+            "ON CONFLICT(hour, origin) DO UPDATE SET jobs = jobs + 1, failed = failed + excluded.failed, "
+            "run_seconds = run_seconds + excluded.run_seconds, wait_seconds = wait_seconds + excluded.wait_seconds",
+            (int(job["ended"] // 3600) * 3600, job["origin"], int(job["status"] != "success"),
+             job["ended"] - started, max(0.0, started - job["queued"])))
+        self.recorded += 1
+
+    def _prune(self, conn):
+        cutoff = time.time() - RETENTION_DAYS * 86400
+        conn.execute("DELETE FROM node_runs WHERE started_at < ?", (cutoff,))
+        conn.execute("DELETE FROM jobs WHERE queued_at < ? AND status NOT IN ('queued', 'running')", (cutoff,))
+        conn.commit()
+
+    # --- capture (event loop) ---
+    def on_queued(self, items):
+        """prompts.add_queue_listener hook: items are prepared queue tuples (number, prompt_id, prompt, extra_data, ...)."""
+        now = time.time()
+        for item in items:
+            prompt_id, prompt, extra_data = item[1], item[2], item[3]
+            origin = _origin(extra_data)
+            self._active[prompt_id] = {
+                "prompt_id": prompt_id, "origin": origin, "queued": now, "started": None, "ended": None,
+                "classes": {str(nid): node.get("class_type") for nid, node in prompt.items()},
+                "node": None, "node_start": None, "node_runs": [], "cached": 0, "outputs": [],
+                "status": None, "error": None,
+            }
+            self._writes.put(("queued", (prompt_id, origin, params_hash(prompt), len(prompt), now)))
+        while len(self._active) > MAX_ACTIVE: self._active.popitem(last=False)
+
+    def on_event(self, event, data, sid):
+        if not isinstance(data, dict): return
+        job = self._active.get(data.get("prompt_id"))
+        if job is None: return
+        now = time.time()
+        if event == "execution_start":
+            self._start(job, data.get("timestamp", now * 1000) / 1000)
+        elif event == "execution_cached":
+            job["cached"] = len(data.get("nodes") or ())
+        elif event == "executing":
+            self._start(job, now)
+            self._close_node(job, now)
+            node = data.get("node")
+            if node is None: self._finish(job, "success", now)
+            else: job["node"], job["node_start"] = str(node), now
+        elif event == "executed":
+            for image in (data.get("output") or {}).get("images", [])[:MAX_OUTPUTS - len(job["outputs"])]:
+                job["outputs"].append({k: image.get(k) for k in ("filename", "subfolder", "type")})
+        elif event in FINAL_STATES:
+            self._close_node(job, now)
+            if event == "execution_error": job["error"] = data.get("exception_message") or "Execution error"
+            self._finish(job, FINAL_STATES[event], now)
+
+    def _start(self, job, ts):
+        if job["started"] is not None: return
+        job["started"] = ts
+        self._writes.put(("started", (ts, job["prompt_id"])))
+
+    @staticmethod
+    def _close_node(job, now):
+        if job["node"] is None: return
+        node = job["node"]
+        job["node_runs"].append((node, job["classes"].get(node), job["node_start"], now - job["node_start"]))
+        job["node"] = None
+
+    def _finish(self, job, status, now):
+        if self._active.pop(job["prompt_id"], None) is None: return
+        job["status"], job["ended"] = status, now
+        del job["classes"]
+        self._writes.put(("finished", job))
+
+    # --- queries (any thread) ---
+    def jobs(self, origin=None, limit=50):
+        where, params = ("WHERE origin = ?", [origin]) if origin else ("", [])
+        rows = self._reader().execute(
+            f"SELECT prompt_id, origin, params_hash, nodes, cached, queued_at, started_at, ended_at, status, error, outputs "
+            f"FROM jobs {where} ORDER BY queued_at DESC LIMIT ?", params + [max(1, min(int(limit), 500))]).fetchall()
+        keys = ("prompt_id", "origin", "params_hash", "nodes", "cached", "queued_at", "started_at", "ended_at", "status", "error", "outputs")
+        out = []
+        for row in rows:
+            job = dict(zip(keys, row))
+            job["outputs"] = json.loads(job["outputs"]) if job["outputs"] else []
+            out.append(job)
+        return out
+
+    def last_runs(self):
+        """{origin: (last finished run, successful runs)} over the retained rows."""
+        return {origin: (last, count) for origin, last, count in self._reader().execute(
+            "SELECT origin, MAX(ended_at), COUNT(*) FROM jobs WHERE status = 'success' GROUP BY origin")}
+
+    def stats(self, days=7, origin=None, bucket="hour", top=30):
+        """p50/p95 per workflow and node over the last `days`, queue wait, and throughput per bucket."""
+        if bucket not in BUCKETS: raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        since = time.time() - float(days) * 86400
+        conn = self._reader()
+        origin_clause, origin_params = (" AND origin = ?", [origin]) if origin else ("", [])
+
+        per_workflow = {}
+        for name, status, queued, started, ended in conn.execute(
+                f"SELECT origin, status, queued_at, started_at, ended_at FROM jobs WHERE queued_at >= ? AND ended_at IS NOT NULL{origin_clause}",
+                [since] + origin_params):
+            entry = per_workflow.setdefault(name, {"run": [], "wait": [], "failed": 0})
+            if status != "success": entry["failed"] += 1
+            else: entry["run"].append(ended - (started or ended))
+            if started is not None: entry["wait"].append(max(0.0, started - queued))
+        workflows = [dict(origin=name, jobs=len(e["run"]) + e["failed"], failed=e["failed"],
+                          duration=_summary(e["run"]), wait=_summary(e["wait"]))
+                     for name, e in per_workflow.items()]
+        workflows.sort(key=lambda w: w["jobs"], reverse=True)
+
+        # Per node id within one workflow, per node class across all of them
+        group = "n.node_id, n.class_type" if origin else "n.class_type"
+        per_node = {}
+        for row in conn.execute(
+                f"SELECT {group}, n.seconds FROM node_runs n JOIN jobs j ON j.prompt_id = n.prompt_id "
+                f"WHERE n.started_at >= ?{origin_clause.replace('origin', 'j.origin')}", [since] + origin_params):
+            per_node.setdefault(row[:-1], []).append(row[-1])
+        node_total = sum(sum(v) for v in per_node.values()) or 1.0
+        nodes = []
+        for key, seconds in per_node.items():
+            entry = dict(zip(("node_id", "class_type") if origin else ("class_type",), key))
+            entry.update(_summary(seconds), total=sum(seconds), share=sum(seconds) / node_total)
+            nodes.append(entry)
+        nodes.sort(key=lambda n: n["total"], reverse=True)
+
+        size = BUCKETS[bucket]
+        throughput = [
+            {"t": t, "jobs": jobs, "failed": failed, "run_seconds": run, "wait_avg": wait / jobs if jobs else 0.0}
+            for t, jobs, failed, run, wait in conn.execute(
+                f"SELECT (hour / {size}) * {size} AS t, SUM(jobs), SUM(failed), SUM(run_seconds), SUM(wait_seconds) "
+                f"FROM rollups WHERE hour >= ?{origin_clause} GROUP BY t ORDER BY t",
+                [int(since // 3600) * 3600] + origin_params)]
+
+        all_wait = [w for e in per_workflow.values() for w in e["wait"]]
+        in_flight = [j for j in list(self._active.values()) if origin is None or j["origin"] == origin]
+        return {
+            "since": since, "days": float(days), "origin": origin, "bucket": bucket,
+            "workflows": workflows, "nodes": nodes[:top], "throughput": throughput,
+            "queue": dict(_summary(all_wait), pending=sum(1 for j in in_flight if j["started"] is None),
+                          running=sum(1 for j in in_flight if j["started"] is not None)),
+        }
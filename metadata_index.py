@@ -0,0 +1,392 @@
+import os
+import re
+import json
+import zlib
+import queue
+import struct
+import sqlite3
+import threading
+
+from .file_index import encode_cursor, decode_cursor
+from .metrics import IO_SECONDS
+
+SCHEMA_VERSION = 1
+COMMIT_EVERY = 200
+MAX_LIMIT = 200
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+TEXT_KEYS = ("text", "text_g", "text_l", "string", "value", "prompt")
+CHECKPOINT_KEYS = ("ckpt_name", "unet_name")
+LORA_KEY_RE = re.compile(r"^lora(_\d+)?_name$")
+LORA_TAG_RE = re.compile(r"<lora:([^:>]+)")
+QUERY_TOKEN_RE = re.compile(r'(\w+):("[^"]*"|\S+)|"([^"]*)"|(\S+)')
+FILTER_ALIASES = {
+    "seed": "seed", "model": "checkpoint", "checkpoint": "checkpoint", "ckpt": "checkpoint",
+    "lora": "lora", "sampler": "sampler", "workflow": "origin", "origin": "origin", "folder": "subfolder",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    subfolder TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    width INTEGER, height INTEGER,
+    seed INTEGER, sampler TEXT, scheduler TEXT, steps INTEGER, cfg REAL,
+    checkpoint TEXT, loras TEXT, positive TEXT, negative TEXT, origin TEXT
+);
+CREATE INDEX IF NOT EXISTS images_recent ON images(mtime_ns DESC, id DESC);
+CREATE INDEX IF NOT EXISTS images_seed ON images(seed);
+"""
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+    positive, negative, checkpoint, loras, origin, filename, content='images', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS images_ai AFTER INSERT ON images BEGIN
+    INSERT INTO images_fts(rowid, positive, negative, checkpoint, loras, origin, filename)
+    VALUES (new.id, new.positive, new.negative, new.checkpoint, new.loras, new.origin, new.filename);
+END;
+CREATE TRIGGER IF NOT EXISTS images_ad AFTER DELETE ON images BEGIN
+    INSERT INTO images_fts(images_fts, rowid, positive, negative, checkpoint, loras, origin, filename)
+    VALUES ('delete', old.id, old.positive, old.negative, old.checkpoint, old.loras, old.origin, old.filename);
+END;
+CREATE TRIGGER IF NOT EXISTS images_au AFTER UPDATE ON images BEGIN
+    INSERT INTO images_fts(images_fts, rowid, positive, negative, checkpoint, loras, origin, filename)
+    VALUES ('delete', old.id, old.positive, old.negative, old.checkpoint, old.loras, old.origin, old.filename);
+    INSERT INTO images_fts(rowid, positive, negative, checkpoint, loras, origin, filename)
+    VALUES (new.id, new.positive, new.negative, new.checkpoint, new.loras, new.origin, new.filename);
+END;
+"""
+COLUMNS = ("path", "subfolder", "filename", "mtime_ns", "size", "width", "height", "seed", "sampler",
+           "scheduler", "steps", "cfg", "checkpoint", "loras", "positive", "negative", "origin")
+
+
+# --- PNG parsing ---
+def read_png_info(path):
+    """Returns (width, height, text_chunks) without decoding pixels, or None for non-PNG files."""
+    text = {}
+    width = height = None
+    with open(path, "rb") as f:
+        if f.read(8) != PNG_SIGNATURE: return None
+        while True:
+            head = f.read(8)
+            if len(head) < 8: break
+            length, kind = struct.unpack(">I4s", head)
+            if kind == b"IEND": break
+            if kind not in (b"IHDR", b"tEXt", b"zTXt", b"iTXt"):
+                f.seek(length + 4, 1)  # skip data + CRC (IDAT included)
+                continue
+            data = f.read(length)
+            f.seek(4, 1)
+            try:
+                if kind == b"IHDR":
+                    width, height = struct.unpack(">II", data[:8])
+                    continue
+                key, _, rest = data.partition(b"\0")
+                if kind == b"tEXt":
+                    value = rest.decode("latin-1")
+                elif kind == b"zTXt":
+                    value = zlib.decompress(rest[1:]).decode("latin-1")
+                else:
+                    compressed = rest[0]
+                    _lang, _, rest = rest[2:].partition(b"\0")
+                    _translated, _, rest = rest.partition(b"\0")
+                    value = (zlib.decompress(rest) if compressed else rest).decode("utf-8")
+                text[key.decode("latin-1")] = value
+            except (zlib.error, UnicodeDecodeError, IndexError, struct.error):
+                continue
+    return width, height, text
+
+
+# --- prompt graph extraction ---
+def _is_link(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[1], int)
+
+def _collect_text(prompt, value, seen):
+    """Follows a conditioning/string link back to the text that produced it."""
+    if isinstance(value, str): return [value]
+    if not _is_link(value) or str(value[0]) in seen: return []
+    seen.add(str(value[0]))
+    node = prompt.get(str(value[0]))
+    if not isinstance(node, dict): return []
+    texts = []
+    for key, inp in node.get("inputs", {}).items():
+        if key in TEXT_KEYS or key.startswith("conditioning") or key in ("positive", "negative"):
+            texts.extend(t for t in _collect_text(prompt, inp, seen) if t.strip())
+    return texts
+
+def _resolve_scalar(prompt, value, keys):
+    if _is_link(value):
+        node = prompt.get(str(value[0])) or {}
+        for key in keys:
+            inner = node.get("inputs", {}).get(key)
+            if inner is not None and not _is_link(inner): return inner
+        return None
+    return value
+
+def _node_order(item):
+    return (0, int(item[0])) if str(item[0]).isdigit() else (1, str(item[0]))
+
+def extract_metadata(text_chunks):
+    """Seed/sampler/models/prompts from ComfyUI's `prompt` chunk, and the mini origin from `workflow`."""
+    meta = {}
+    try: prompt = json.loads(text_chunks.get("prompt") or "{}")
+    except ValueError: prompt = {}
+    if not isinstance(prompt, dict): prompt = {}
+
+    checkpoints, loras = [], []
+    sampler_done = False
+    for node_id, node in sorted(prompt.items(), key=_node_order):
+        if not isinstance(node, dict): continue
+        inputs = node.get("inputs", {})
+        for key, value in inputs.items():
+            if not isinstance(value, str) or value == "None": continue
+            if key in CHECKPOINT_KEYS: checkpoints.append(value)
+            elif LORA_KEY_RE.match(key): loras.append(value)
+        if sampler_done or not ("seed" in inputs or "noise_seed" in inputs): continue
+        # First sampler-like node (has a seed) in node-id order
+        sampler_done = True
+        seed = _resolve_scalar(prompt, inputs.get("seed", inputs.get("noise_seed")), ("seed", "noise_seed", "value", "int"))
+        meta["seed"] = seed if isinstance(seed, int) else None
+        meta["sampler"] = inputs.get("sampler_name") if isinstance(inputs.get("sampler_name"), str) else None
+        meta["scheduler"] = inputs.get("scheduler") if isinstance(inputs.get("scheduler"), str) else None
+        steps, cfg = _resolve_scalar(prompt, inputs.get("steps"), ("value", "int")), _resolve_scalar(prompt, inputs.get("cfg"), ("value", "float"))
+        meta["steps"] = steps if isinstance(steps, int) else None
+        meta["cfg"] = float(cfg) if isinstance(cfg, (int, float)) else None
+        meta["positive"] = "\n".join(dict.fromkeys(_collect_text(prompt, inputs.get("positive"), set())))
+        meta["negative"] = "\n".join(dict.fromkeys(_collect_text(prompt, inputs.get("negative"), set())))
+
+    loras.extend(LORA_TAG_RE.findall(meta.get("positive") or ""))
+    # Newline-separated: model names may contain spaces
+    meta["checkpoint"] = "\n".join(dict.fromkeys(checkpoints)) or None
+    meta["loras"] = "\n".join(dict.fromkeys(loras)) or None
+
+    try:
+        workflow = json.loads(text_chunks.get("workflow") or "{}")
+        origin = workflow.get("extra", {}).get("mini_origin") if isinstance(workflow, dict) else None
+    except (ValueError, AttributeError):
+        origin = None
+    meta["origin"] = origin if isinstance(origin, str) else None
+    return meta
+
+
+# --- query parsing ---
+def parse_query(q):
+    """`seed:123 lora:detail "red dress" castle` -> ({"seed": "123", "lora": "detail"}, ["red dress", "castle"])."""
+    filters, terms = {}, []
+    for m in QUERY_TOKEN_RE.finditer(q or ""):
+        key, value, quoted, bare = m.groups()
+        if key and key.lower() in FILTER_ALIASES:
+            filters[FILTER_ALIASES[key.lower()]] = value.strip('"')
+        elif key:
+            terms.append(m.group(0))
+        else:
+            terms.append(quoted if quoted is not None else bare)
+    return filters, [t for t in terms if t]
+
+def _fts_query(terms):
+    return " ".join('"' + t.replace('"', '""') + '"*' for t in terms)
+
+
+class MetadataIndex:
+    """SQLite index of generation metadata embedded in output PNGs.
+
+    A background thread scans OUTPUT_DIR once at startup (skipping files whose mtime and
+    size match the database) and then applies the file watcher's deltas. Searches run on
+    their own read connection; the FTS5 table is used when SQLite has it, LIKE otherwise.
+    """
+
+    def __init__(self, db_path, root):
+        self.db_path = db_path
+        self.root = root
+        self.fts = True
+        self.scanning = False
+        self.indexed = 0
+        self.generation = 0  # bumped after every batch of index writes
+        self._jobs = queue.Queue()
+        self._local = threading.local()
+        self._thread = None
+        self._init_db()
+
+    # --- database ---
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None: conn = self._local.conn = self._connect()
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._connect()
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS images_fts; DROP TABLE IF EXISTS images;")
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+            except sqlite3.OperationalError:
+                self.fts = False
+                print("[ComfyMini] SQLite has no FTS5; metadata search falls back to LIKE")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # --- indexing (worker thread only) ---
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mini-metadata", daemon=True)
+        self._thread.start()
+        self.reindex()
+
+    def reindex(self):
+        self._jobs.put(("full",))
+
+    def notify(self, subfolder, added, removed):
+        """File watcher delta for OUTPUT_DIR (names relative to `subfolder`)."""
+        self._jobs.put(("delta", subfolder, list(added), list(removed)))
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            jobs = [self._jobs.get()]
+            while True:
+                try: jobs.append(self._jobs.get_nowait())
+                except queue.Empty: break
+            try:
+                if any(job[0] == "full" for job in jobs):
+                    self._full_scan(conn)  # covers the deltas drained with it
+                else:
+                    for _, subfolder, added, removed in jobs:
+                        self._index_paths(conn, [self._rel(subfolder, name) for name in added])
+                        self._delete(conn, [self._rel(subfolder, name) for name in removed])
+                    conn.commit()
+            except Exception as e:
+                print(f"[ComfyMini] Metadata index error: {e}")
+            self.indexed = conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+            self.generation += 1
+
+    @staticmethod
+    def _rel(subfolder, name):
+        subfolder = subfolder.replace(os.sep, "/").strip("/")
+        return f"{subfolder}/{name}" if subfolder else name
+
+    def _full_scan(self, conn):
+        self.scanning = True
+        try:
+            on_disk = {}
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for name in filenames:
+                    if not name.lower().endswith(".png"): continue
+                    path = os.path.join(dirpath, name)
+                    try: st = os.stat(path)
+                    except OSError: continue
+                    on_disk[os.path.relpath(path, self.root).replace(os.sep, "/")] = (st.st_mtime_ns, st.st_size)
+            known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT path, mtime_ns, size FROM images")}
+            changed = [rel for rel, stamp in on_disk.items() if known.get(rel) != stamp]
+            self._delete(conn, [rel for rel in known if rel not in on_disk])
+            if changed: print(f"[ComfyMini] Indexing metadata of {len(changed)} images...")
+            self._index_paths(conn, changed)
+            conn.commit()
+        finally:
+            self.scanning = False
+
+    def _index_paths(self, conn, rels):
+        done = 0
+        for rel in rels:
+            if not rel.lower().endswith(".png"): continue
+            path = os.path.join(self.root, rel)
+            try:
+                st = os.stat(path)
+                info = read_png_info(path)
+            except OSError:
+                continue
+            if info is None: continue
+            width, height, chunks = info
+            meta = extract_metadata(chunks)
+            subfolder, _, filename = rel.rpartition("/")
+            row = dict(meta, path=rel, subfolder=subfolder, filename=filename, mtime_ns=st.st_mtime_ns,
+                       size=st.st_size, width=width, height=height)
+            conn.execute(
+                f"INSERT INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                f"ON CONFLICT(path) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in COLUMNS[1:])}",
+                [row.get(c) for c in COLUMNS])
+            done += 1
+            if done % COMMIT_EVERY == 0: conn.commit()
+
+    def _delete(self, conn, rels):
+        if rels: conn.executemany("DELETE FROM images WHERE path = ?", [(rel,) for rel in rels])
+
+    # --- search (any thread) ---
+    def search(self, q="", filters=None, cursor=None, limit=60):
+        """Newest-first matches. Returns (rows, next_cursor, total); rows are gallery-ready image dicts."""
+        query_filters, terms = parse_query(q)
+        query_filters.update({k: v for k, v in (filters or {}).items() if v not in (None, "")})
+        where, params = [], []
+        if terms:
+            if self.fts:
+                where.append("id IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)")
+                params.append(_fts_query(terms))
+            else:
+                for term in terms:
+                    where.append("(positive LIKE ? OR negative LIKE ? OR checkpoint LIKE ? OR loras LIKE ? OR origin LIKE ? OR filename LIKE ?)")
+                    params.extend([f"%{term}%"] * 6)
+        for key, value in query_filters.items():
+            if key == "seed":
+                where.append("seed = ?"); params.append(int(value))
+            elif key == "lora":
+                where.append("loras LIKE ?"); params.append(f"%{value}%")
+            elif key == "subfolder":
+                where.append("subfolder = ?"); params.append(value)
+            elif key in ("checkpoint", "sampler", "origin"):
+                where.append(f"{key} LIKE ?"); params.append(f"%{value}%")
+            elif key == "after":
+                where.append("mtime_ns >= ?"); params.append(int(float(value) * 1e9))
+            elif key == "before":
+                where.append("mtime_ns < ?"); params.append(int(float(value) * 1e9))
+
+        conn = self._reader()
+        clause = (" WHERE " + " AND ".join(where)) if where else ""
+        page_where, page_params = list(where), list(params)
+        if cursor:
+            page_where.append("(mtime_ns, id) < (?, ?)"); page_params.extend(decode_cursor(cursor))
+        page_clause = (" WHERE " + " AND ".join(page_where)) if page_where else ""
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        with IO_SECONDS.time(op="metadata_search"):
+            total = conn.execute(f"SELECT COUNT(*) FROM images{clause}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT id, {', '.join(COLUMNS)} FROM images{page_clause} ORDER BY mtime_ns DESC, id DESC LIMIT ?",
+                page_params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor((rows[-1][4], rows[-1][0]))
+        return [self._to_image(row) for row in rows], next_cursor, total
+
+    @staticmethod
+    def _to_image(row):
+        data = dict(zip(("id",) + COLUMNS, row))
+        return {
+            "filename": data["filename"], "subfolder": data["subfolder"], "type": "output",
+            "mtime": data["mtime_ns"] / 1e9, "size": data["size"], "width": data["width"], "height": data["height"],
+            "seed": data["seed"], "sampler": data["sampler"], "scheduler": data["scheduler"], "steps": data["steps"],
+            "cfg": data["cfg"], "checkpoint": data["checkpoint"], "loras": (data["loras"] or "").split("\n") if data["loras"] else [],
+            "positive": data["positive"], "negative": data["negative"], "origin": data["origin"],
+        }
+
+    def latest_by_origin(self):
+        """{origin: newest image} for images whose PNG names the library workflow that made them."""
+        out = {}
+        # SQLite returns the other columns from the row that holds the MAX()
+        for origin, subfolder, filename, mtime_ns in self._reader().execute(
+                "SELECT origin, subfolder, filename, MAX(mtime_ns) FROM images WHERE origin IS NOT NULL GROUP BY origin"):
+            out[origin] = {"filename": filename, "subfolder": subfolder, "type": "output", "mtime": mtime_ns / 1e9}
+        return out
+
+    def status(self):
+        return {"indexed": self.indexed, "pending": self._jobs.qsize(), "scanning": self.scanning, "fts": self.fts}
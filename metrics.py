@@ -0,0 +1,234 @@
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+LAG_INTERVAL = 0.5  # seconds between event-loop lag probes
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4"
+PREPARED_KEY = "mini_prepared_at"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+def _number(value):
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = registry._lock
+        self._values = {}  # sorted label tuple -> value
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock: self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock: return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock: self._values[self._key(labels)] = value
+
+    def set_max(self, value, **labels):
+        key = self._key(labels)
+        with self._lock: self._values[key] = max(self._values.get(key, value), value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None: state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    out.append((self.name + "_bucket", key + (("le", _number(bound)),), cumulative))
+                out.append((self.name + "_sum", key, total))
+                out.append((self.name + "_count", key, count))
+        return out
+
+    def summary(self):
+        """Per label set: count, avg and bucket-interpolated p50/p95/p99 (for humans, not Prometheus)."""
+        out = {}
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                entry = {"count": count, "avg": total / count if count else 0.0}
+                for q in (0.5, 0.95, 0.99):
+                    entry[f"p{int(q * 100)}"] = self._quantile(counts, count, q)
+                out[_labels(key) or "{}"] = entry
+        return out
+
+    def _quantile(self, counts, count, q):
+        if not count: return 0.0
+        rank, seen, lower = q * count, 0, 0.0
+        for bound, n in zip(self.buckets + (self.buckets[-1],), counts):
+            if n and seen + n >= rank: return lower + (bound - lower) * (rank - seen) / n
+            seen += n; lower = bound
+        return self.buckets[-1]
+
+
+class Registry:
+    """Process-wide metrics in Prometheus text format.
+
+    Metrics are created once at import time; values that already live on other objects
+    (cache hit counters, index sizes) are read at scrape time through collectors.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._add(Counter(self, name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._add(Gauge(self, name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, help_text, buckets))
+
+    def collector(self, fn):
+        """fn() -> [(name, kind, help, [(labels_dict, value), ...]), ...]"""
+        self._collectors.append(fn)
+        return fn
+
+    def _collected(self):
+        out = []
+        for fn in self._collectors:
+            try: out.extend(fn())
+            except Exception as e: print(f"[ComfyMini] Metrics collector failed: {e}")
+        return out
+
+    def render_text(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+        for name, kind, help_text, samples in self._collected():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        out = {}
+        for metric in self._metrics:
+            if isinstance(metric, Histogram):
+                out[metric.name] = metric.summary()
+            else:
+                out[metric.name] = {_labels(key) or "{}": value for _, key, value in metric.samples()}
+        for name, _, _, samples in self._collected():
+            out[name] = {_labels(sorted(labels.items())) or "{}": value for labels, value in samples}
+        return out
+
+
+REGISTRY = Registry()
+HTTP_REQUESTS = REGISTRY.counter("mini_http_requests_total", "Requests to /mini routes by route, method and status.")
+HTTP_LATENCY = REGISTRY.histogram("mini_http_request_seconds", "Handler latency of /mini routes (streams: until headers are sent).")
+HTTP_SIZE = REGISTRY.histogram("mini_http_response_bytes", "Response body size of /mini routes (when known).", SIZE_BUCKETS)
+IO_SECONDS = REGISTRY.histogram("mini_io_seconds", "Blocking file I/O done on behalf of /mini handlers, by operation.")
+LOOP_LAG = REGISTRY.histogram("mini_event_loop_lag_seconds", "How late a timer fired on the aiohttp event loop.")
+LOOP_LAG_MAX = REGISTRY.gauge("mini_event_loop_lag_max_seconds", "Worst event-loop lag seen since the last scrape.")
+
+
+def _route_name(request):
+    route = request.match_info.route
+    resource = getattr(route, "resource", None)
+    return resource.canonical if resource is not None else "unmatched"
+
+async def mark_prepared(request, response):
+    """on_response_prepare hook: stamps when a handler sent its own headers (SSE, websockets, downloads)."""
+    if request.path.startswith("/mini"): request[PREPARED_KEY] = time.perf_counter()
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Counts, times and sizes every /mini request; other ComfyUI routes pass straight through.
+
+    Streaming handlers return only when the stream ends, so their latency stops at
+    `mark_prepared` instead: time to headers, not the life of the connection.
+    """
+    if not request.path.startswith("/mini"): return await handler(request)
+    start = time.perf_counter()
+    status, size = 500, None
+    try:
+        response = await handler(request)
+        status, size = response.status, getattr(response, "content_length", None)
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        route = _route_name(request)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=status)
+        HTTP_LATENCY.observe(request.get(PREPARED_KEY, time.perf_counter()) - start, route=route)
+        if size is not None: HTTP_SIZE.observe(size, route=route)
+
+
+async def watch_loop_lag(interval=LAG_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_MAX.set_max(lag)
+
+def scrape_reset():
+    """Called after each scrape so the lag maximum covers one scrape interval."""
+    LOOP_LAG_MAX.set(0.0)
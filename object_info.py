@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import nodes
+import folder_paths
+
+from .assets import compress_variants
+
+MAX_SUBSETS = 64
+FINGERPRINT_TTL = 2.0  # seconds a model-folder walk is reused between requests
+SKIP_FOLDERS = ("custom_nodes",)  # registered with folder_paths but not listed in the schema
+
+
+def _model_dirs():
+    dirs = set()
+    for name, entry in getattr(folder_paths, "folder_names_and_paths", {}).items():
+        if name not in SKIP_FOLDERS: dirs.update(entry[0])
+    return sorted(dirs)
+
+def _tree_mtimes(roots):
+    """(path, mtime) of every directory under `roots`: a file added or removed anywhere changes one of them."""
+    out, seen = [], set()
+    for root in roots:
+        for dirpath, dirnames, _ in os.walk(root, followlinks=True):
+            real = os.path.realpath(dirpath)
+            if real in seen:
+                dirnames[:] = []
+                continue
+            seen.add(real)
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            try: out.append((dirpath, os.stat(dirpath).st_mtime_ns))
+            except OSError: pass
+    return out
+
+
+class ObjectInfoCache:
+    """Caches ComfyUI's /object_info output and serves it whole or per class, precompressed.
+
+    The schema is rebuilt only when the fingerprint changes: the registered node classes
+    plus the mtimes of every directory in the model folders, subfolders included (the schema
+    embeds their file lists). The walk runs off the loop, at most every FINGERPRINT_TTL.
+    The input folder is left out so uploads and bridged images don't force rebuilds; its
+    LoadImage list in the schema can lag, and pages take it from /mini/input_images.
+    """
+
+    def __init__(self, prompt_server):
+        self.prompt_server = prompt_server
+        self.fingerprint = None
+        self.schema = None
+        self.full = None  # (etag, variants)
+        self._subsets = OrderedDict()
+        self._folders = (0.0, None)  # (monotonic time of the walk, its mtimes)
+        self.builds = 0
+
+    async def current_fingerprint(self, fresh=False):
+        checked, mtimes = self._folders
+        if fresh or mtimes is None or time.monotonic() - checked >= FINGERPRINT_TTL:
+            mtimes = await asyncio.get_running_loop().run_in_executor(None, _tree_mtimes, _model_dirs())
+            self._folders = (time.monotonic(), mtimes)
+        h = hashlib.sha1()
+        h.update("\0".join(sorted(nodes.NODE_CLASS_MAPPINGS)).encode("utf-8"))
+        h.update(repr(mtimes).encode("utf-8"))
+        return h.hexdigest()
+
+    def _object_info_handler(self):
+        for route in self.prompt_server.routes:
+            if getattr(route, "method", None) == "GET" and getattr(route, "path", None) == "/object_info":
+                return route.handler
+        raise RuntimeError("ComfyUI /object_info route not found")
+
+    async def get(self, request, force=False):
+        """Returns the schema dict, rebuilding it through ComfyUI's own handler when stale."""
+        fingerprint = await self.current_fingerprint(fresh=force)
+        if force or self.schema is None or fingerprint != self.fingerprint:
+            resp = await self._object_info_handler()(request)
+            self.schema = json.loads(resp.body)
+            raw = json.dumps(self.schema, separators=(",", ":")).encode("utf-8")
+            self.full = (f'"{fingerprint[:16]}"', compress_variants(raw))
+            self._subsets.clear()
+            self.fingerprint = fingerprint
+            self.builds += 1
+            print(f"[ComfyMini] object_info cached: {len(self.schema)} classes, {len(raw) // 1024} KB")
+        return self.schema
+
+    async def body(self, request, classes=None, force=False):
+        """Returns (etag, variants) for the whole schema or for a subset of class types."""
+        schema = await self.get(request, force)
+        if not classes: return self.full
+        key = tuple(sorted(set(classes)))
+        cached = self._subsets.get(key)
+        if cached is None:
+            raw = json.dumps({c: schema[c] for c in key if c in schema}, separators=(",", ":")).encode("utf-8")
+            digest = hashlib.sha1(self.fingerprint.encode("ascii") + "\0".join(key).encode("utf-8")).hexdigest()
+            cached = (f'"{digest[:16]}"', compress_variants(raw))
+            self._subsets[key] = cached
+            while len(self._subsets) > MAX_SUBSETS: self._subsets.popitem(last=False)
+        else:
+            self._subsets.move_to_end(key)
+        return cached
@@ -0,0 +1,224 @@
+import uuid
+import heapq
+import random
+import inspect
+
+import execution
+
+# Mini-only node types that never go to the ComfyUI executor
+EXCLUDED_CLASSES = ("MiniGroup", "Note", "AppInfo")
+# Only sent when the prompt carries a client_id, so server-side submissions always set one
+FAIL_EVENTS = ("execution_error", "execution_interrupted")
+SERVER_CLIENT_ID = "comfymini-runner"
+
+_queue_listeners = []  # callback(items), see add_queue_listener
+_dispatcher = None  # see set_dispatcher
+
+
+class PromptError(Exception):
+    def __init__(self, message, node_errors=None):
+        super().__init__(message)
+        self.node_errors = node_errors or {}
+
+
+# --- COMPILE ---
+def randomize_seeds(workflow):
+    """Same rule as the Roll button: every KSampler gets a fresh seed. Mutates in place."""
+    for node in workflow.values():
+        if isinstance(node, dict) and node.get("class_type") == "KSampler" and "seed" in node.get("inputs", {}):
+            node["inputs"]["seed"] = random.randint(0, 10000000000 - 1)
+    return workflow
+
+def compile_prompt(workflow):
+    """Builds the API prompt: drops `_` keys, nodes without class_type and mini-only node types."""
+    prompt = {}
+    for node_id, node in workflow.items():
+        if node_id.startswith('_') or not isinstance(node, dict): continue
+        class_type = node.get("class_type")
+        if not class_type or class_type in EXCLUDED_CLASSES: continue
+        prompt[node_id] = {"inputs": dict(node.get("inputs", {})), "class_type": class_type}
+        if "_meta" in node: prompt[node_id]["_meta"] = node["_meta"]
+    return prompt
+
+def build_pnginfo(workflow):
+    """Minimal UI-format workflow for extra_pnginfo (ComfyUI expects a 'nodes' list)."""
+    nodes = []
+    for node_id, node in workflow.items():
+        if not isinstance(node, dict): continue
+        nodes.append({"id": int(node_id) if str(node_id).isdigit() else node_id, "type": node.get("class_type"), **node})
+    wf = {"nodes": nodes, "links": [], "groups": [], "version": 0.4}
+    if workflow.get("_mini_origin"): wf["extra"] = {"mini_origin": workflow["_mini_origin"]}
+    return {"workflow": wf}
+
+
+# --- QUEUE ---
+async def _validate(prompt_id, prompt):
+    params = inspect.signature(execution.validate_prompt).parameters
+    if len(params) >= 3: result = execution.validate_prompt(prompt_id, prompt, None)
+    elif len(params) == 2: result = execution.validate_prompt(prompt_id, prompt)
+    else: result = execution.validate_prompt(prompt)
+    if inspect.isawaitable(result): result = await result
+    return result
+
+async def prepare_prompt(prompt_server, prompt, extra_data=None, client_id=None, front=False):
+    """Runs on_prompt handlers and validation like POST /prompt. Returns the queue item without queueing it."""
+    json_data = {"prompt": prompt, "extra_data": dict(extra_data or {})}
+    if client_id: json_data["client_id"] = client_id
+    json_data = prompt_server.trigger_on_prompt(json_data)
+    prompt = json_data["prompt"]
+    extra_data = json_data.get("extra_data", {})
+    if client_id: extra_data["client_id"] = client_id
+
+    prompt_id = str(uuid.uuid4())
+    valid = await _validate(prompt_id, prompt)
+    if not valid[0]:
+        error = valid[1]
+        raise PromptError(error.get("message", str(error)) if isinstance(error, dict) else str(error), valid[3])
+
+    number = prompt_server.number
+    prompt_server.number += 1
+    if front: number = -number
+
+    item = (number, prompt_id, prompt, extra_data, valid[2])
+    sensitive_keys = getattr(execution, "SENSITIVE_EXTRA_DATA_KEYS", None)
+    if sensitive_keys is not None:
+        sensitive = {k: extra_data.pop(k) for k in sensitive_keys if k in extra_data}
+        item = item + (sensitive,)
+    return item
+
+def add_queue_listener(callback):
+    """callback(items) runs on the event loop for every prompt queued through /mini, before the worker can see it."""
+    _queue_listeners.append(callback)
+
+def set_dispatcher(dispatcher):
+    """dispatcher.dispatch(items) -> items to queue locally; dispatcher.cancel(prompt_id) -> result or None.
+
+    Lets prompts queued through /mini run on another ComfyUI instance (see backends.py).
+    """
+    global _dispatcher
+    _dispatcher = dispatcher
+
+def enqueue(prompt_server, items):
+    """Puts prepared items on the queue: one lock acquisition and one status broadcast for the lot."""
+    for cb in _queue_listeners:
+        try: cb(items)
+        except Exception as e: print(f"[ComfyMini] Queue listener failed: {e}")
+    if _dispatcher: items = _dispatcher.dispatch(items)
+    put_local(prompt_server, items)
+
+def put_local(prompt_server, items):
+    """Queues on this instance's PromptServer, skipping listeners and the dispatcher."""
+    if not items: return
+    queue = prompt_server.prompt_queue
+    if len(items) == 1 or not (hasattr(queue, "mutex") and hasattr(queue, "queue")):
+        for item in items: queue.put(item)
+        return
+    with queue.mutex:
+        for item in items: heapq.heappush(queue.queue, item)
+        prompt_server.queue_updated()
+        queue.not_empty.notify()
+
+async def queue_prompt(prompt_server, prompt, extra_data=None, client_id=None, front=False, on_queued=None):
+    """Validates and enqueues straight into the PromptServer queue, like POST /prompt. Returns (prompt_id, number).
+
+    `on_queued(prompt_id)` runs before the item becomes visible to the worker so callers
+    can start tracking without racing the executor.
+    """
+    item = await prepare_prompt(prompt_server, prompt, extra_data, client_id, front)
+    if on_queued: on_queued(item[1])
+    enqueue(prompt_server, [item])
+    return item[1], item[0]
+
+def cancel_prompt(prompt_server, prompt_id):
+    """Removes a pending prompt, or interrupts it if it is the one executing."""
+    import nodes
+    if _dispatcher:
+        result = _dispatcher.cancel(prompt_id)
+        if result: return result
+    queue = prompt_server.prompt_queue
+    running, _pending = queue.get_current_queue()
+    if any(item[1] == prompt_id for item in running):
+        nodes.interrupt_processing()
+        return "interrupted"
+    if queue.delete_queue_item(lambda item: item[1] == prompt_id):
+        return "removed"
+    return None
+
+def get_history_outputs(prompt_server, prompt_id):
+    history = prompt_server.prompt_queue.get_history(prompt_id=prompt_id)
+    return history.get(prompt_id, {}).get("outputs", {})
+
+
+# --- EVENTS ---
+class PromptEvents:
+    """Taps PromptServer.send_sync so server-side code can follow execution.
+
+    Listeners get (event, data, sid) on the event loop. `track(prompt_id)` returns a
+    future that resolves with the prompt's outputs once it finishes.
+    """
+
+    def __init__(self, prompt_server):
+        self.prompt_server = prompt_server
+        self.loop = prompt_server.loop
+        self._listeners = []
+        self._binary_listeners = []
+        self._waiters = {}  # prompt_id -> future
+        self._outputs = {}  # prompt_id -> {node_id: output} collected from 'executed'
+        original = prompt_server.send_sync
+
+        def send_sync(event, data, sid=None):
+            original(event, data, sid)
+            if isinstance(event, str):
+                if self._listeners or self._waiters:
+                    self.loop.call_soon_threadsafe(self._dispatch, event, data, sid)
+            elif self._binary_listeners:
+                self.loop.call_soon_threadsafe(self._dispatch_binary, event, data, sid)
+
+        prompt_server.send_sync = send_sync
+
+    def add_listener(self, callback, binary=False):
+        (self._binary_listeners if binary else self._listeners).append(callback)
+
+    def remove_listener(self, callback):
+        for lst in (self._listeners, self._binary_listeners):
+            if callback in lst: lst.remove(callback)
+
+    def track(self, prompt_id):
+        fut = self._waiters.get(prompt_id)
+        if fut is None:
+            fut = self.loop.create_future()
+            self._waiters[prompt_id] = fut
+        return fut
+
+    def forget(self, prompt_id):
+        self._waiters.pop(prompt_id, None)
+        self._outputs.pop(prompt_id, None)
+
+    def _dispatch_binary(self, event, data, sid):
+        for cb in list(self._binary_listeners):
+            try: cb(event, data, sid)
+            except Exception as e: print(f"[ComfyMini] Binary event listener failed: {e}")
+
+    def _dispatch(self, event, data, sid):
+        prompt_id = data.get("prompt_id") if isinstance(data, dict) else None
+        if prompt_id in self._waiters:
+            if event == "executed":
+                self._outputs.setdefault(prompt_id, {})[data.get("node")] = data.get("output")
+            elif event in FAIL_EVENTS or (event == "executing" and data.get("node") is None):
+                self._finish(prompt_id, event, data)
+
+        for cb in list(self._listeners):
+            try: cb(event, data, sid)
+            except Exception as e: print(f"[ComfyMini] Event listener failed: {e}")
+
+    def _finish(self, prompt_id, event, data):
+        fut = self._waiters.pop(prompt_id)
+        collected = self._outputs.pop(prompt_id, {})
+        if fut.done(): return
+        if event == "execution_error":
+            fut.set_exception(PromptError(data.get("exception_message", "Execution error"), {data.get("node_id"): data}))
+        elif event == "execution_interrupted":
+            fut.set_exception(PromptError("Interrupted"))
+        else:
+            outputs = get_history_outputs(self.prompt_server, prompt_id) or collected
+            fut.set_result(outputs)
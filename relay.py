@@ -0,0 +1,225 @@
+import io
+import json
+import uuid
+import struct
+import asyncio
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web, WSMsgType
+from PIL import Image
+
+# ComfyUI's server.BinaryEventTypes / image type numbers
+PREVIEW_IMAGE = 1
+UNENCODED_PREVIEW_IMAGE = 2
+PREVIEW_IMAGE_WITH_METADATA = 4
+JPEG_TYPE = 1
+# Latest-wins: only the newest of each is kept between sends
+COALESCED_EVENTS = ("progress", "progress_state", "crystools.monitor", "kaytool.resources")
+PROGRESS_EVENTS = ("progress", "progress_state")
+# A preview queued before one of these would land on top of the final image
+FRAME_BARRIERS = ("executing", "executed", "execution_success", "execution_error", "execution_interrupted")
+DEFAULT_CAPS = {"max_preview": 512, "fps": 4.0, "progress_ms": 250, "quality": 70, "previews": True, "json": True, "drop": ()}
+CAP_LIMITS = {"max_preview": (0, 4096), "fps": (0, 60), "progress_ms": (0, 10000), "quality": (10, 95)}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mini-preview")
+
+
+def parse_caps(values, base=DEFAULT_CAPS):
+    """Client capabilities from query params or a {"type": "caps"} message; unknown keys are ignored."""
+    caps = dict(base)
+    for key, (lo, hi) in CAP_LIMITS.items():
+        if values.get(key) in (None, ""): continue
+        try: caps[key] = min(hi, max(lo, type(DEFAULT_CAPS[key])(float(values[key]))))
+        except (TypeError, ValueError): pass
+    for key in ("previews", "json"):
+        if key in values: caps[key] = str(values[key]).lower() not in ("0", "false", "no")
+    if "drop" in values:
+        drop = values["drop"]
+        caps["drop"] = tuple(drop.split(",") if isinstance(drop, str) else drop or ())
+    return caps
+
+def _frame_source(event, data):
+    """(image or encoded bytes, ComfyUI's own max size, image type of the bytes) from a binary preview event, or None."""
+    if event == PREVIEW_IMAGE_WITH_METADATA: data = data[0] if isinstance(data, (tuple, list)) else None
+    elif event == PREVIEW_IMAGE and isinstance(data, (bytes, bytearray)) and len(data) > 4:
+        return bytes(data[4:]), None, struct.unpack(">I", data[:4])[0]
+    elif event != UNENCODED_PREVIEW_IMAGE: return None
+    if isinstance(data, (tuple, list)) and len(data) >= 2 and hasattr(data[1], "size"):
+        return data[1], (data[2] if len(data) > 2 else None), None
+    return None
+
+def encode_preview(source, max_size, quality, image_type=JPEG_TYPE):
+    """Preview framed like ComfyUI's PREVIEW_IMAGE message (event, image type, bytes).
+
+    Encoded bytes that are already small enough pass through under their own `image_type`;
+    anything resized is re-encoded as JPEG.
+    """
+    image = source
+    if isinstance(source, bytes):
+        image = Image.open(io.BytesIO(source))
+        if not max_size or max(image.size) <= max_size:  # already small enough
+            return struct.pack(">II", PREVIEW_IMAGE, image_type) + source
+    else:
+        image = image.copy()  # the sampler's image is shared by every client
+    if max_size and max(image.size) > max_size: image.thumbnail((max_size, max_size), Image.BILINEAR)
+    if image.mode != "RGB": image = image.convert("RGB")
+    buf = io.BytesIO()
+    buf.write(struct.pack(">II", PREVIEW_IMAGE, JPEG_TYPE))
+    image.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+class RelayClient:
+    def __init__(self, ws, client_id, caps):
+        self.ws = ws
+        self.client_id = client_id
+        self.caps = caps
+        self.critical = deque()  # JSON texts, sent in order, never dropped
+        self.coalesced = OrderedDict()  # event -> newest JSON text
+        self.frame_seq = 0  # newest frame already sent or skipped
+        self.epoch = 0  # bumped by FRAME_BARRIERS; invalidates frames being encoded
+        self.last_progress = 0.0
+        self.last_frame = 0.0
+        self.wake = asyncio.Event()
+        self.timer = None
+
+
+class PreviewRelay:
+    """Per-client view of the ComfyUI websocket for /mini pages on slow links.
+
+    Subscribes to the PromptEvents tap. Status, executing, executed and every other event are
+    queued and always delivered in order; progress-style events are coalesced to the newest
+    one per `progress_ms`. Previews are kept latest-wins and sent at most `fps` times a
+    second, downscaled to `max_preview` and re-encoded as JPEG on a worker thread; clients
+    with the same settings share one encode. Messages keep ComfyUI's format, so a page only
+    has to change its socket URL.
+    """
+
+    def __init__(self, prompt_server, events):
+        self.prompt_server = prompt_server
+        self.clients = set()
+        self.frame = None  # (seq, sid, source, max_size, image_type)
+        self.seq = 0
+        self.stats = {"frames_sent": 0, "frames_dropped": 0, "messages_sent": 0, "messages_coalesced": 0}
+        self._encoded = {}  # (max_size, quality) -> future, for the current frame only
+        events.add_listener(self._on_event)
+        events.add_listener(self._on_binary, binary=True)
+
+    def _targets(self, sid):
+        return [c for c in self.clients if sid is None or sid == c.client_id]
+
+    # --- event taps (event loop) ---
+    def _on_event(self, event, data, sid):
+        if not self.clients: return
+        text = None
+        for c in self._targets(sid):
+            if not c.caps["json"] or event in c.caps["drop"]: continue
+            if text is None: text = json.dumps({"type": event, "data": data})
+            if event in COALESCED_EVENTS:
+                if event in c.coalesced: self.stats["messages_coalesced"] += 1
+                c.coalesced[event] = text
+            else:
+                # Queued progress is older than this event; sending it afterwards would rewind the UI
+                for e in PROGRESS_EVENTS: c.coalesced.pop(e, None)
+                c.critical.append(text)
+                if event in FRAME_BARRIERS:
+                    c.epoch += 1
+                    c.frame_seq = self.seq
+            c.wake.set()
+
+    def _on_binary(self, event, data, sid):
+        if not self.clients: return
+        source = _frame_source(event, data)
+        if source is None: return  # e.g. TEXT: the mini pages treat every binary message as an image
+        self.seq += 1
+        self.frame = (self.seq, sid) + source
+        self._encoded.clear()
+        for c in self._targets(sid):
+            if not c.caps["previews"]: continue
+            if c.frame_seq < self.seq - 1: self.stats["frames_dropped"] += 1  # replaced before it went out
+            c.wake.set()
+
+    # --- sending ---
+    def _encode(self, frame, caps):
+        _, _, source, own_max, image_type = frame
+        max_size = min(s for s in (caps["max_preview"], own_max) if s) if (caps["max_preview"] or own_max) else 0
+        key = (max_size, caps["quality"])
+        fut = self._encoded.get(key)
+        if fut is None:
+            fut = self._encoded[key] = asyncio.get_running_loop().run_in_executor(
+                _executor, encode_preview, source, max_size, caps["quality"], image_type or JPEG_TYPE)
+        return fut
+
+    async def _pump(self, c):
+        try:
+            await self._send_loop(c)
+        except (ConnectionResetError, RuntimeError):
+            pass  # the socket closed under a send; handle() drops the client when its read loop ends
+
+    async def _send_loop(self, c):
+        loop = asyncio.get_running_loop()
+        while not c.ws.closed:
+            await c.wake.wait()
+            c.wake.clear()
+            while c.critical:
+                await c.ws.send_str(c.critical.popleft())
+                self.stats["messages_sent"] += 1
+            now = loop.time()
+            delays = []
+            if c.coalesced:
+                due = c.last_progress + c.caps["progress_ms"] / 1000
+                if now >= due:
+                    while c.coalesced:
+                        await c.ws.send_str(c.coalesced.popitem(last=False)[1])
+                        self.stats["messages_sent"] += 1
+                    c.last_progress = now
+                else: delays.append(due - now)
+            frame = self.frame
+            if frame and frame[0] > c.frame_seq and c.caps["previews"] and frame[1] in (None, c.client_id):
+                due = c.last_frame + (1 / c.caps["fps"] if c.caps["fps"] else 0)
+                if now >= due:
+                    epoch, c.frame_seq = c.epoch, frame[0]
+                    try: data = await self._encode(frame, c.caps)
+                    except Exception as e:
+                        print(f"[ComfyMini] Preview encode failed: {e}")
+                        data = None
+                    if data is not None and epoch == c.epoch:
+                        await c.ws.send_bytes(data)
+                        c.last_frame = loop.time()
+                        self.stats["frames_sent"] += 1
+                    else:
+                        self.stats["frames_dropped"] += 1
+                    if c.critical: c.wake.set()
+                else: delays.append(due - now)
+            if delays:
+                if c.timer: c.timer.cancel()
+                c.timer = loop.call_later(min(delays), c.wake.set)
+
+    def _status(self, client_id):
+        queue_info = getattr(self.prompt_server, "get_queue_info", None)
+        status = queue_info() if queue_info else {"exec_info": {"queue_remaining": 0}}
+        return json.dumps({"type": "status", "data": {"status": status, "sid": client_id}})
+
+    async def handle(self, request):
+        """GET /mini/ws?clientId=&max_preview=&fps=&progress_ms=&quality=&previews=&json=&drop=a,b"""
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        client = RelayClient(ws, request.query.get("clientId") or uuid.uuid4().hex, parse_caps(request.query))
+        client.critical.append(self._status(client.client_id))
+        client.wake.set()
+        self.clients.add(client)
+        pump = asyncio.create_task(self._pump(client))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT: continue
+                try: data = json.loads(msg.data)
+                except ValueError: continue
+                if isinstance(data, dict) and data.get("type") == "caps":
+                    client.caps = parse_caps(data.get("data") or {}, client.caps)
+                    client.wake.set()
+        finally:
+            self.clients.discard(client)
+            if client.timer: client.timer.cancel()
+            pump.cancel()
+        return ws
@@ -0,0 +1,242 @@
+import copy
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+
+from .prompts import SERVER_CLIENT_ID, queue_prompt, cancel_prompt, compile_prompt, randomize_seeds, build_pnginfo
+
+MAX_RUNS = 20
+PROGRESS_INTERVAL = 1.0
+
+
+def _is_image_bridge(prev_step, prev_workflow):
+    out = prev_step.get("connectedOutput") or {}
+    if out.get("special") == "IMAGE": return True
+    if out.get("key") == "filename_prefix":
+        node = prev_workflow.get(str(out.get("nodeId"))) or {}
+        return "Save" in node.get("class_type", "")
+    return False
+
+def _last_image(outputs):
+    image = None
+    for out in outputs.values():
+        if isinstance(out, dict) and out.get("images"): image = out["images"][0]
+    return image
+
+def apply_outputs(workflow, outputs):
+    """Writes text/number outputs back into matching node inputs (ShowText -> text_0, etc.). Returns {node: {key: val}}."""
+    updates = {}
+    for node_id, out in outputs.items():
+        node = workflow.get(str(node_id))
+        if not isinstance(node, dict) or not isinstance(out, dict): continue
+        inputs = node.setdefault("inputs", {})
+        for key, val in out.items():
+            if key == "images": continue
+            val = val[0] if isinstance(val, list) and val else val
+            if isinstance(val, (dict, list)) or val is None: continue
+            for target in ([key, "text_0"] if key == "text" else [key]):
+                if target in inputs and inputs[target] != val:
+                    inputs[target] = val
+                    updates.setdefault(str(node_id), {})[target] = val
+    return updates
+
+
+class AutomationRun:
+    def __init__(self, name, steps, client_id=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.client_id = client_id or SERVER_CLIENT_ID
+        self.state = "queued"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.task = None
+        self.steps = [{
+            "filename": s["filename"],
+            "connectedOutput": s.get("connectedOutput"),
+            "connectedInput": s.get("connectedInput"),
+            "state": "pending", "prompt_id": None, "progress": 0, "images": [], "updates": {}, "error": None,
+        } for s in steps]
+        self._workflows = {}  # step index -> library workflow with bridged inputs (seeds as saved)
+        self._done = [asyncio.Event() for _ in steps]
+
+    @property
+    def active(self):
+        return self.state in ("queued", "running")
+
+    def to_dict(self):
+        return {
+            "run_id": self.run_id, "name": self.name, "state": self.state, "error": self.error,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "steps": self.steps,
+        }
+
+
+class AutomationRunner:
+    """Runs automation chains on the server so they survive the browser going away.
+
+    Each step is queued directly on the PromptServer. A step that receives the previous
+    step's output is queued as soon as that one prompt finishes; independent steps are
+    queued immediately behind it instead of waiting for the whole queue to drain.
+    """
+
+    def __init__(self, prompt_server, events, read_workflow, write_workflow, bridge_image, publish):
+        self.prompt_server = prompt_server
+        self.events = events
+        self.read_workflow = read_workflow
+        self.write_workflow = write_workflow
+        self.bridge_image = bridge_image
+        self.publish = publish
+        self.runs = OrderedDict()
+        self._by_prompt = {}  # prompt_id -> (run, index)
+        self._last_progress = 0
+        events.add_listener(self._on_event)
+
+    def start(self, name, steps, client_id=None):
+        run = AutomationRun(name, steps, client_id)
+        self.runs[run.run_id] = run
+        while len(self.runs) > MAX_RUNS:
+            oldest = next((rid for rid, r in self.runs.items() if not r.active), None)
+            if oldest is None: break
+            del self.runs[oldest]
+        run.task = asyncio.get_running_loop().create_task(self._execute(run))
+        return run
+
+    def get(self, run_id=None):
+        if run_id: return self.runs.get(run_id)
+        return next(reversed(self.runs.values()), None)
+
+    def cancel(self, run):
+        if not run.active: return False
+        run.cancelled = True
+        for step in run.steps:
+            if step["prompt_id"] and step["state"] in ("queued", "running"):
+                cancel_prompt(self.prompt_server, step["prompt_id"])
+        if run.task: run.task.cancel()
+        return True
+
+    def _emit(self, run):
+        self.publish("automation", run.to_dict())
+
+    def _on_event(self, event, data, sid):
+        if not isinstance(data, dict): return
+        ref = self._by_prompt.get(data.get("prompt_id"))
+        if ref is None: return
+        run, i = ref
+        step = run.steps[i]
+        if event == "execution_start" and step["state"] == "queued":
+            step["state"] = "running"
+            self._emit(run)
+        elif event == "progress" and data.get("max"):
+            step["progress"] = round(data["value"] / data["max"], 3)
+            now = time.monotonic()
+            if now - self._last_progress >= PROGRESS_INTERVAL:
+                self._last_progress = now
+                self._emit(run)
+
+    async def _execute(self, run):
+        loop = asyncio.get_running_loop()
+        run.state = "running"; run.started = time.time()
+        self._emit(run)
+        finishers = []
+        try:
+            for i, step in enumerate(run.steps):
+                prev = run.steps[i - 1] if i > 0 else None
+                depends = bool(prev and step["connectedInput"] and prev["connectedOutput"])
+                if depends:
+                    step["state"] = "waiting"
+                    self._emit(run)
+                    await run._done[i - 1].wait()
+                    if prev["state"] != "done":
+                        raise RuntimeError(f"Step {i} did not finish, stopping chain")
+
+                workflow = await self.read_workflow(step["filename"])
+                if depends:
+                    await self._apply_connection(run, i, workflow)
+                # Fresh seeds go to the prompt only; the library copy keeps its own, as the browser runner did
+                submitted = randomize_seeds(copy.deepcopy(workflow))
+                submitted["_mini_origin"] = step["filename"]
+
+                tracked = {}
+                def on_queued(pid, i=i):
+                    tracked["future"] = self.events.track(pid)
+                    self._by_prompt[pid] = (run, i)
+                prompt_id, _ = await queue_prompt(
+                    self.prompt_server, compile_prompt(submitted),
+                    extra_data={"extra_pnginfo": build_pnginfo(submitted)},
+                    client_id=run.client_id, on_queued=on_queued)
+                run._workflows[i] = workflow
+                step["prompt_id"] = prompt_id; step["state"] = "queued"
+                self._emit(run)
+                print(f"[ComfyMini] Automation {run.name}: step {i + 1} queued ({prompt_id})")
+                finishers.append(loop.create_task(self._finish_step(run, i, tracked["future"])))
+
+            await asyncio.gather(*finishers)
+            failed = [s for s in run.steps if s["state"] == "error"]
+            run.state = "error" if failed else "done"
+            if failed: run.error = failed[0]["error"]
+        except asyncio.CancelledError:
+            run.state = "cancelled"
+            for f in finishers: f.cancel()
+        except Exception as e:
+            run.error = str(e)
+            print(f"[ComfyMini] Automation {run.name} failed: {e}")
+            # Steps already queued keep running in ComfyUI; wait for them so their results are still saved
+            try:
+                await asyncio.gather(*finishers)
+                run.state = "error"
+            except asyncio.CancelledError:
+                run.state = "cancelled"
+        finally:
+            # Never drop the future of a prompt that is still live: stop it first
+            for f in finishers: f.cancel()
+            for step in run.steps:
+                if step["prompt_id"] and step["state"] in ("queued", "running"):
+                    cancel_prompt(self.prompt_server, step["prompt_id"])
+                if step["state"] in ("pending", "waiting", "queued", "running"):
+                    step["state"] = "cancelled" if run.cancelled else "skipped"
+                self._by_prompt.pop(step["prompt_id"], None)
+                if step["prompt_id"]: self.events.forget(step["prompt_id"])
+            run.finished = time.time()
+            self._emit(run)
+
+    async def _apply_connection(self, run, i, workflow):
+        prev = run.steps[i - 1]
+        prev_workflow = run._workflows.get(i - 1, {})
+        step_in = run.steps[i]["connectedInput"]
+        node = workflow.get(str(step_in["nodeId"]))
+        if not node: return
+
+        if _is_image_bridge(prev, prev_workflow):
+            if not prev["images"]:
+                print(f"[ComfyMini] Automation {run.name}: step {i} has no image to bridge")
+                return
+            image = prev["images"][-1]  # _last_image(); the automation page bridges the same one
+            node["inputs"][step_in["key"]] = await self.bridge_image(
+                image["filename"], image.get("subfolder", ""), image.get("type", "output"))
+        else:
+            out = prev["connectedOutput"]
+            prev_node = prev_workflow.get(str(out["nodeId"])) or {}
+            val = prev_node.get("inputs", {}).get(out["key"])
+            if val is not None: node["inputs"][step_in["key"]] = val
+
+    async def _finish_step(self, run, i, future):
+        step = run.steps[i]
+        try:
+            outputs = await future
+            workflow = run._workflows[i]
+            step["updates"] = apply_outputs(workflow, outputs)
+            image = _last_image(outputs)
+            step["images"] = [image] if image else []
+            # Persist bridged inputs and text results back to the library, as the browser runner did
+            await self.write_workflow(step["filename"], workflow)
+            step["state"] = "done"; step["progress"] = 1
+        except Exception as e:
+            step["state"] = "cancelled" if run.cancelled else "error"
+            step["error"] = str(e)
+        finally:
+            run._done[i].set()
+            self._emit(run)
@@ -0,0 +1,160 @@
+import time
+import atexit
+import asyncio
+
+from .storage import clone
+
+FLUSH_DELAY = 1.0  # saves inside this window collapse into one write
+MAX_FLUSH_DELAY = 5.0  # ...but a steady stream of edits is still written at least this often
+
+
+class SessionConflict(Exception):
+    def __init__(self, version):
+        super().__init__(f"Session is at version {version}")
+        self.version = version
+
+
+class PatchError(ValueError):
+    pass
+
+
+_MISSING = object()
+
+
+# --- JSON Patch (RFC 6902: add / replace / remove / test) ---
+def _split_path(path):
+    if path == "": return []
+    if not path.startswith("/"): raise PatchError(f"bad path '{path}'")
+    return [p.replace("~1", "/").replace("~0", "~") for p in path[1:].split("/")]
+
+def _resolve(doc, parts):
+    parent = doc
+    for part in parts[:-1]:
+        if isinstance(parent, list):
+            try: parent = parent[int(part)]
+            except (ValueError, IndexError): raise PatchError(f"no such index '{part}'")
+        elif isinstance(parent, dict) and part in parent:
+            parent = parent[part]
+        else:
+            raise PatchError(f"no such key '{part}'")
+    return parent
+
+def apply_patch(doc, ops):
+    """Applies ops to doc in place. Raises PatchError; doc may be partially modified on error."""
+    for op in ops:
+        kind = op.get("op")
+        parts = _split_path(op.get("path", ""))
+        if not parts: raise PatchError("cannot patch the document root")
+        parent, key = _resolve(doc, parts), parts[-1]
+        if isinstance(parent, list):
+            index = len(parent) if key == "-" else int(key)
+            if kind == "add": parent.insert(index, op["value"])
+            elif kind == "replace": parent[index] = op["value"]
+            elif kind == "remove": del parent[index]
+            elif kind == "test":
+                if parent[index] != op["value"]: raise PatchError(f"test failed at {op['path']}")
+            else: raise PatchError(f"unsupported op '{kind}'")
+        elif isinstance(parent, dict):
+            if kind in ("add", "replace"):
+                if kind == "replace" and key not in parent: raise PatchError(f"no such key '{key}'")
+                parent[key] = op["value"]
+            elif kind == "remove":
+                if parent.pop(key, _MISSING) is _MISSING: raise PatchError(f"no such key '{key}'")
+            elif kind == "test":
+                if parent.get(key, _MISSING) != op["value"]: raise PatchError(f"test failed at {op['path']}")
+            else: raise PatchError(f"unsupported op '{kind}'")
+        else:
+            raise PatchError(f"cannot patch into {type(parent).__name__} at {op['path']}")
+
+
+class Session:
+    """The active workflow held in memory with a version number.
+
+    Edits arrive as full replacements or JSON-patch deltas against a base version; a stale
+    base raises SessionConflict. Disk writes (workflow.json, its meta and the library
+    origin) are debounced so bursts of saves become one flush.
+    """
+
+    def __init__(self, storage, flush_delay=FLUSH_DELAY, max_flush_delay=MAX_FLUSH_DELAY):
+        self.storage = storage
+        self.flush_delay = flush_delay
+        self.max_flush_delay = max_flush_delay
+        # Starts from the clock so a version held by a client from before a restart never matches
+        self.version = int(time.time() * 1000)
+        self.flushes = 0
+        self._workflow = None
+        self._load_lock = asyncio.Lock()
+        self._timer = None
+        self._dirty_since = None
+        atexit.register(self._flush_at_exit)
+
+    async def load(self):
+        if self._workflow is None:
+            async with self._load_lock:
+                if self._workflow is None:
+                    self._workflow = await self.storage.run(self.storage.read_active)
+        return self._workflow
+
+    async def snapshot(self, copy=True):
+        """Returns (version, workflow). Pass copy=False only for read-only use such as serializing."""
+        workflow = await self.load()
+        return self.version, (clone(workflow) if copy else workflow)
+
+    async def replace(self, workflow, base_version=None):
+        await self.load()
+        self._check(base_version)
+        self._workflow = workflow
+        return self._changed()
+
+    async def patch(self, base_version, ops):
+        _, patched = await self.patched(base_version, ops)
+        self._workflow = patched
+        return self._changed()
+
+    async def patched(self, base_version, ops):
+        """(version, patched copy) without committing it; the caller replace()s it once the result is accepted."""
+        workflow = await self.load()
+        self._check(base_version)
+        patched = clone(workflow)
+        apply_patch(patched, ops)
+        return self.version, patched
+
+    async def reload(self):
+        """Re-reads the active files after they were replaced on disk (select_workflow)."""
+        self._cancel_timer()
+        self._workflow = await self.storage.run(self.storage.read_active)
+        self.version += 1
+        return self.version
+
+    async def flush(self):
+        """Writes pending edits now and waits for them to hit disk."""
+        if self._dirty_since is None: return
+        await asyncio.wrap_future(self._flush())
+
+    def _check(self, base_version):
+        if base_version is not None and int(base_version) != self.version:
+            raise SessionConflict(self.version)
+
+    def _changed(self):
+        self.version += 1
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._dirty_since is None: self._dirty_since = now
+        self._cancel_timer()
+        delay = min(self.flush_delay, max(0.0, self._dirty_since + self.max_flush_delay - now))
+        self._timer = loop.call_later(delay, self._flush)
+        return self.version
+
+    def _cancel_timer(self):
+        if self._timer: self._timer.cancel()
+        self._timer = None
+
+    def _flush(self):
+        self._cancel_timer()
+        self._dirty_since = None
+        self.flushes += 1
+        return self.storage.write_behind(self.storage.write_active, clone(self._workflow))
+
+    def _flush_at_exit(self):
+        if self._dirty_since is not None and self._workflow is not None:
+            self.storage.write_active(self._workflow)
@@ -0,0 +1,309 @@
+import os
+import json
+import asyncio
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import IO_SECONDS
+
+_MISSING = object()
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+# mkstemp creates 0600 files; replaced files get the mode a plain open() would have given them
+FILE_MODE = 0o666 & ~_umask()
+
+def set_default_mode(fd):
+    if hasattr(os, "fchmod"): os.fchmod(fd, FILE_MODE)
+
+def write_atomic(path, data, suffix=""):
+    """Writes bytes to a temp file beside `path` and renames it over; the temp file never outlives a failure."""
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=suffix, dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            set_default_mode(f.fileno())
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+
+
+def split_workflow_data(full_data):
+    """Separates Logic (Nodes/Links) from Layout (Pos/Groups)"""
+    if not isinstance(full_data, dict):
+        return full_data, {}
+
+    logic_data = {}
+    meta_data = {}
+
+    for node_id, node in full_data.items():
+        if not isinstance(node, dict):
+            # Keep top-level keys like 'version' or 'extra' in logic
+            logic_data[node_id] = node
+            continue
+
+        logic_node = {
+            "inputs": node.get("inputs", {}),
+            "class_type": node.get("class_type", ""),
+        }
+
+        if node.get("class_type") == "MiniGroup":
+            meta_data[node_id] = node
+        else:
+            logic_data[node_id] = logic_node
+            if "_meta" in node:
+                meta_data[node_id] = { "_meta": node["_meta"] }
+
+    return logic_data, meta_data
+
+def merge_workflow_data(logic_data, meta_data):
+    if not isinstance(logic_data, dict):
+        return logic_data
+
+    merged = {}
+    for node_id, node in logic_data.items():
+        merged[node_id] = node
+        if node_id in meta_data and isinstance(node, dict):
+            if "_meta" in meta_data[node_id]:
+                merged[node_id] = node.copy()
+                merged[node_id]["_meta"] = meta_data[node_id]["_meta"]
+
+    for node_id, node in meta_data.items():
+        if node_id not in merged:
+            merged[node_id] = node
+
+    return merged
+
+def clone(data):
+    """Copy of a JSON value; much cheaper than copy.deepcopy for plain dict/list trees."""
+    if isinstance(data, dict): return {k: clone(v) for k, v in data.items()}
+    if isinstance(data, list): return [clone(v) for v in data]
+    return data
+
+
+class JsonFiles:
+    """Thread-safe JSON file access: atomic replace on write, per-file locks, mtime-validated cache.
+
+    Cached values are shared; pass copy=True (the default) when the caller will mutate the result.
+    """
+
+    def __init__(self):
+        self._cache = {}  # path -> (mtime_ns, size, data)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lock(self, path):
+        with self._locks_guard:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = threading.RLock()
+            return lock
+
+    def read(self, path, default=_MISSING, copy=True):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._cache.pop(path, None)
+            if default is _MISSING: raise
+            return default
+        cached = self._cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            self.hits += 1
+            data = cached[2]
+        else:
+            self.misses += 1
+            with self.lock(path):
+                with open(path, 'r', encoding='utf-8') as f: data = json.load(f)
+            self._cache[path] = (st.st_mtime_ns, st.st_size, data)
+        return clone(data) if copy else data
+
+    def write(self, path, data, indent=2):
+        """Writes to a temp file in the same directory and renames it over the target."""
+        directory = os.path.dirname(path)
+        with self.lock(path):
+            fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    set_default_mode(f.fileno())
+                    json.dump(data, f, indent=indent)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+            except BaseException:
+                try: os.remove(tmp)
+                except OSError: pass
+                raise
+            st = os.stat(path)
+            self._cache[path] = (st.st_mtime_ns, st.st_size, clone(data))
+
+    def remove(self, path):
+        with self.lock(path):
+            self._cache.pop(path, None)
+            try:
+                os.remove(path)
+                return True
+            except FileNotFoundError:
+                return False
+
+
+class Storage:
+    """All ComfyMini persistence: active workflow, library, groups, layout, automations, favorites.
+
+    Methods are blocking; handlers call them through `await storage.run(...)` so disk I/O
+    happens on a dedicated executor instead of the aiohttp event loop.
+    """
+
+    def __init__(self, webroot, workflows_dir, meta_dir, automations_dir, max_workers=2):
+        self.webroot = webroot
+        self.workflows_dir = workflows_dir
+        self.meta_dir = meta_dir
+        self.automations_dir = automations_dir
+        self.files = JsonFiles()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mini-storage")
+        # Single worker so deferred saves land in the order they were scheduled
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mini-writer")
+
+    @staticmethod
+    def _timed(fn, *args):
+        with IO_SECONDS.time(op=getattr(fn, "__name__", "storage")): return fn(*args)
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, fn, *args)
+
+    def write_behind(self, fn, *args):
+        """Schedules a save without waiting for it. Failures are logged, not raised."""
+        future = self._writer.submit(self._timed, fn, *args)
+        def _done(f):
+            if f.exception(): print(f"[ComfyMini] Deferred save failed ({fn.__name__}): {f.exception()}")
+        future.add_done_callback(_done)
+        return future
+
+    # --- paths ---
+    def active_paths(self, suffix=""):
+        return (os.path.join(self.webroot, f"workflow{suffix}.json"),
+                os.path.join(self.webroot, f"workflow{suffix}.meta.json"))
+
+    def library_paths(self, filename):
+        return (os.path.join(self.workflows_dir, filename),
+                os.path.join(self.meta_dir, filename.replace('.json', '.meta.json')))
+
+    def groups_path(self, name):
+        if name.endswith('.json'): name = name[:-5]
+        return os.path.join(self.meta_dir, name + ".groups.json")
+
+    def _read_meta(self, path, copy=True):
+        try:
+            return self.files.read(path, {}, copy=copy)
+        except ValueError:
+            print(f"[ComfyMini] Warning: {os.path.basename(path)} corrupted, ignoring.")
+            return {}
+
+    # --- active session ---
+    def read_active(self, copy=True):
+        wf_path, meta_path = self.active_paths()
+        return merge_workflow_data(self.files.read(wf_path, {}, copy=copy), self._read_meta(meta_path, copy))
+
+    def active_origin(self):
+        return self._read_meta(self.active_paths()[1], copy=False).get("_mini_origin")
+
+    def write_active(self, full_data, suffix=""):
+        """Saves the session (optionally under a suffix); an unsuffixed save syncs back to the library origin."""
+        origin_file = full_data.get("_mini_origin") if isinstance(full_data, dict) else None
+        logic, meta = split_workflow_data(full_data)
+        if not origin_file: origin_file = self.active_origin()
+        # Ensure meta has the origin tag
+        if origin_file: meta["_mini_origin"] = origin_file
+
+        wf_path, meta_path = self.active_paths(suffix)
+        self.files.write(wf_path, logic)
+        self.files.write(meta_path, meta)
+
+        if suffix == "" and origin_file:
+            print(f"[ComfyMini] Syncing save to library: {origin_file}")
+            lib_meta = meta.copy()
+            lib_meta.pop("_mini_origin", None)
+            lib_path, lib_meta_path = self.library_paths(origin_file)
+            self.files.write(lib_path, logic)
+            self.files.write(lib_meta_path, lib_meta)
+        return origin_file
+
+    def select(self, filename):
+        """Makes a library workflow the active session."""
+        src_path, src_meta = self.library_paths(filename)
+        logic, meta = split_workflow_data(self.files.read(src_path))
+        meta.update(self._read_meta(src_meta))
+        meta["_mini_origin"] = filename
+        wf_path, meta_path = self.active_paths()
+        self.files.write(wf_path, logic)
+        self.files.write(meta_path, meta)
+
+    # --- library ---
+    def list_library(self):
+        entries = []
+        with os.scandir(self.workflows_dir) as it:
+            for e in it:
+                if e.name.endswith('.json') and e.is_file(): entries.append((e.stat().st_mtime, e.name))
+        return [name for _, name in sorted(entries, reverse=True)]
+
+    def read_library(self, filename, copy=True):
+        """Library workflow with its layout meta merged back in. Raises FileNotFoundError."""
+        lib_path, meta_path = self.library_paths(filename)
+        return merge_workflow_data(self.files.read(lib_path, copy=copy), self._read_meta(meta_path, copy))
+
+    def write_library(self, filename, full_data):
+        logic, meta = split_workflow_data(full_data)
+        meta.pop("_mini_origin", None)
+        lib_path, meta_path = self.library_paths(filename)
+        self.files.write(lib_path, logic)
+        self.files.write(meta_path, meta)
+
+    def write_library_raw(self, filename, content):
+        """Stores uploaded bytes as-is (atomic rename, no JSON round trip)."""
+        path = os.path.join(self.workflows_dir, filename)
+        with self.files.lock(path): write_atomic(path, content, ".json")
+
+    def delete_library(self, filename):
+        base = filename.replace('.json', '')
+        deleted = []
+        for path in (*self.library_paths(filename), self.groups_path(base)):
+            if self.files.remove(path): deleted.append(os.path.basename(path))
+        return deleted
+
+    # --- groups / layout / favorites ---
+    def read_groups(self, name, copy=True):
+        return self.files.read(self.groups_path(name), [], copy=copy)
+
+    def write_groups(self, name, groups):
+        self.files.write(self.groups_path(name), groups)
+
+    def read_layout(self, copy=True):
+        return self.files.read(os.path.join(self.webroot, "layout.json"), [], copy=copy)
+
+    def write_layout(self, data):
+        self.files.write(os.path.join(self.webroot, "layout.json"), data)
+
+    def read_favorites(self, copy=True):
+        return self.files.read(os.path.join(self.webroot, "favorites.json"), [], copy=copy)
+
+    def write_favorites(self, items):
+        self.files.write(os.path.join(self.webroot, "favorites.json"), items, indent=None)
+
+    # --- automations ---
+    def list_automations(self):
+        if not os.path.exists(self.automations_dir): return []
+        return [f for f in os.listdir(self.automations_dir) if f.endswith('.json')]
+
+    def read_automation(self, filename, copy=True):
+        return self.files.read(os.path.join(self.automations_dir, filename), copy=copy)
+
+    def write_automation(self, filename, steps):
+        self.files.write(os.path.join(self.automations_dir, filename), steps)
@@ -0,0 +1,150 @@
+import os
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from .metrics import IO_SECONDS
+
+# Preset edge lengths (px). Gallery tiles use sm/md via srcset, lg is for tablets.
+THUMB_SIZES = {"sm": 256, "md": 512, "lg": 1024}
+THUMB_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+THUMB_QUALITY = 80
+FULL_SIZE = "full"  # re-encoded at the source resolution (ZIP downloads)
+THUMB_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="mini-thumb")
+
+
+class ThumbnailCache:
+    """Content-addressed thumbnail store on disk with an in-memory LRU index.
+
+    Keys are derived from the source path, mtime and size, so an overwritten
+    source simply produces a new key and the stale entry ages out.
+    """
+
+    def __init__(self, cache_dir, max_bytes=THUMB_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (path, size)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"): continue
+                path = os.path.join(root, name)
+                try: st = os.stat(path)
+                except OSError: continue
+                found.append((st.st_atime, os.path.splitext(name)[0], path, st.st_size))
+        found.sort()
+        for _, key, path, size in found:
+            self._entries[key] = (path, size)
+            self.total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def make_key(src_path, st, size_name, fmt, quality=THUMB_QUALITY):
+        raw = f"{src_path}|{st.st_mtime_ns}|{st.st_size}|{size_name}|{fmt}"
+        if quality != THUMB_QUALITY: raw += f"|q{quality}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key, fmt):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{fmt}")
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _store(self, key, path, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old: self.total_bytes -= old[1]
+            self._entries[key] = (path, size)
+            self.total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (path, size) = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                try: os.remove(path)
+                except OSError: pass
+
+    def _render(self, src_path, key, size_name, fmt, quality=THUMB_QUALITY):
+        with IO_SECONDS.time(op="thumb_render"): return self._render_sync(src_path, key, size_name, fmt, quality)
+
+    def _render_sync(self, src_path, key, size_name, fmt, quality=THUMB_QUALITY):
+        edge = THUMB_SIZES.get(size_name)  # None for FULL_SIZE
+        pil_format, _ = THUMB_FORMATS[fmt]
+        with Image.open(src_path) as img:
+            if edge: img.draft("RGB", (edge, edge))  # JPEG sources decode at reduced scale
+            img = ImageOps.exif_transpose(img)
+            if edge: img.thumbnail((edge, edge), Image.LANCZOS)
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+            if has_alpha and pil_format == "JPEG":
+                # Flatten onto the gallery card background
+                img = img.convert("RGBA")
+                bg = Image.new("RGB", img.size, (10, 10, 10))
+                bg.paste(img, mask=img.split()[-1])
+                img = bg
+            elif img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if has_alpha else "RGB")
+
+            out_path = self._path_for(key, fmt)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            tmp_path = f"{out_path}.{threading.get_ident()}.tmp"
+            if pil_format == "WEBP":
+                img.save(tmp_path, pil_format, quality=quality, method=4)
+            else:
+                img.save(tmp_path, pil_format, quality=quality, optimize=True, progressive=True)
+            os.replace(tmp_path, out_path)
+        self._store(key, out_path, os.path.getsize(out_path))
+        return out_path
+
+    def _read(self, path):
+        with IO_SECONDS.time(op="thumb_read"):
+            with open(path, "rb") as f: return f.read()
+
+    async def key_for(self, src_path, size_name="sm", fmt="webp", quality=THUMB_QUALITY):
+        st = await asyncio.get_running_loop().run_in_executor(_executor, os.stat, src_path)
+        return self.make_key(src_path, st, size_name, fmt, quality)
+
+    async def render_path(self, src_path, key, size_name="sm", fmt="webp", quality=THUMB_QUALITY):
+        """Path of the cached rendition for `key`, rendering on the worker pool on a miss. It may be evicted later."""
+        path = self._lookup(key)
+        if path:
+            self.hits += 1
+            return path
+        self.misses += 1
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.get_running_loop().run_in_executor(_executor, self._render, src_path, key, size_name, fmt, quality)
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        return await fut
+
+    async def get(self, src_path, key, size_name="sm", fmt="webp"):
+        """Returns the thumbnail bytes for `key`, rendering on the worker pool on a miss."""
+        loop = asyncio.get_running_loop()
+        path = await self.render_path(src_path, key, size_name, fmt)
+        try:
+            return await loop.run_in_executor(_executor, self._read, path)
+        except FileNotFoundError:
+            # Evicted between lookup and read; render again
+            path = await loop.run_in_executor(_executor, self._render, src_path, key, size_name, fmt)
+            return await loop.run_in_executor(_executor, self._read, path)
@@ -29,6 +29,8 @@ let fooocusStyles = [];
 let clientId = ([1e7]+-1e3+-4e3+-8e3+-1e11).replace(/[018]/g, c => (c ^ crypto.getRandomValues(new Uint8Array(1))[0] & 15 >> c / 4).toString(16));
 let socket = null;
 let currentPromptId = null;
+let sessionVersion = null;   // server session version loadedWorkflow was last synced at
+let syncedWorkflow = null;   // copy of loadedWorkflow as of that version (base for deltas)
 
 // --- Terminal Console State ---
 const terminalMaxLines = 300;
@@ -125,7 +127,32 @@ function logTerminal(msg, level) {
     els.termLog.scrollTop = els.termLog.scrollHeight;
 }
 
+// Server-side latency per /mini route (same data Prometheus scrapes from /mini/metrics)
+export async function showMetrics() {
+    const data = await safeFetch('/mini/metrics?format=json', null);
+    if (!data) return null;
+    const ms = (s) => `${(s * 1000).toFixed(1)}ms`;
+    const rows = Object.entries(data.mini_http_request_seconds || {})
+        .map(([labels, s]) => ({ route: labels.replace(/^\{route="|"\}$/g, ''), count: s.count, p50: ms(s.p50), p95: ms(s.p95), p99: ms(s.p99) }))
+        .sort((a, b) => b.count - a.count);
+    for (const r of rows) logTerminal(`${r.route}  n=${r.count}  p50 ${r.p50}  p95 ${r.p95}  p99 ${r.p99}`, "info");
+    const lag = data.mini_event_loop_lag_seconds?.['{}'];
+    if (lag) logTerminal(`Event loop lag p95 ${ms(lag.p95)}, max ${ms(data.mini_event_loop_lag_max_seconds?.['{}'] || 0)}`, lag.p95 > 0.05 ? "warn" : "info");
+    console.table(rows);
+    return data;
+}
+window.miniMetrics = showMetrics;
+
 // --- IMAGE THUMBNAIL RENDERER ---
+// Input-image versions (mtime, ms) from /mini/input_images, bumped after an upload, so /view URLs
+// stay cacheable but change when a file with the same name is overwritten
+const inputVersions = {};
+
+export function inputImageUrl(filename) {
+    const v = inputVersions[filename];
+    return `/view?filename=${encodeURIComponent(filename)}&type=input${v ? `&v=${v}` : ''}`;
+}
+
 function renderImageThumbnail(nodeId, filename) {
     if (!filename || !els.result) return null;
 
@@ -133,7 +160,7 @@ function renderImageThumbnail(nodeId, filename) {
     container.className = "image-thumb-container flex items-center gap-2";
 
     const img = document.createElement('img');
-    img.src = `/view?filename=${encodeURIComponent(filename)}&type=input&t=${Date.now()}`;
+    img.src = inputImageUrl(filename);
     img.alt = filename;
     img.loading = 'lazy';
     img.decoding = 'async';
@@ -153,7 +180,7 @@ function renderImageThumbnail(nodeId, filename) {
 
     img.onclick = (e) => {
         e.stopPropagation();
-        openModal(`/view?filename=${encodeURIComponent(filename)}&type=input&t=${Date.now()}`);
+        openModal(inputImageUrl(filename));
     };
 
     container.appendChild(img);
@@ -296,7 +323,7 @@ function renderGroupThumbnails() {
             container.className = "absolute top-2 right-2 z-10";
 
             const img = document.createElement('img');
-            img.src = `/view?filename=${encodeURIComponent(filename)}&type=input&t=${Date.now()}`;
+            img.src = inputImageUrl(filename);
             img.alt = filename;
             img.loading = 'lazy';
             img.decoding = 'async';
@@ -309,7 +336,7 @@ function renderGroupThumbnails() {
 
             img.onclick = (e) => {
                 e.stopPropagation();
-                openModal(`/view?filename=${encodeURIComponent(filename)}&type=input&t=${Date.now()}`);            };
+                openModal(inputImageUrl(filename));            };
 
             container.appendChild(img);
             groupCard.appendChild(container);
@@ -426,7 +453,7 @@ function updateGroupThumbnail(group, nodeId, key, filename) {
             container.className = "absolute top-2 left-2 z-10";
 
             const img = document.createElement('img');
-            img.src = `/view?filename=${encodeURIComponent(filename)}&type=input&t=${Date.now()}`;
+            img.src = inputImageUrl(filename);
             img.alt = filename;
             img.loading = 'lazy';
             img.decoding = 'async';
@@ -439,7 +466,7 @@ function updateGroupThumbnail(group, nodeId, key, filename) {
 
             img.onclick = (e) => {
                 e.stopPropagation();
-                openModal(`/view?filename=${encodeURIComponent(filename)}&type=input&t=${Date.now()}`);
+                openModal(inputImageUrl(filename));
 
     };
 
@@ -456,6 +483,100 @@ export async function safeFetch(url, fallbackValue) {
     } catch (e) { return fallbackValue; }
 }
 
+// --- SESSION SYNC (versioned JSON-patch deltas) ---
+// `snapshot` is the state that was sent; edits made while the request was in flight stay unsynced
+function markSynced(version, snapshot = JSON.parse(JSON.stringify(loadedWorkflow))) {
+    sessionVersion = version;
+    syncedWorkflow = snapshot;
+}
+
+function diffOps(base, cur, path = '') {
+    const isObj = (v) => v !== null && typeof v === 'object' && !Array.isArray(v);
+    const esc = (k) => String(k).replace(/~/g, '~0').replace(/\//g, '~1');
+    const ops = [];
+    for (const k of Object.keys(base)) {
+        if (!(k in cur)) ops.push({ op: 'remove', path: `${path}/${esc(k)}` });
+    }
+    for (const [k, v] of Object.entries(cur)) {
+        const p = `${path}/${esc(k)}`;
+        if (!(k in base)) ops.push({ op: 'add', path: p, value: v });
+        else if (isObj(v) && isObj(base[k])) ops.push(...diffOps(base[k], v, p));
+        else if (JSON.stringify(v) !== JSON.stringify(base[k])) ops.push({ op: 'replace', path: p, value: v });
+    }
+    return ops;
+}
+
+async function saveSessionFull() {
+    const body = JSON.stringify(loadedWorkflow);
+    const res = await fetch('/mini/save_workflow', { method: 'POST', body });
+    const data = await res.json();
+    if (data.version !== undefined) markSynced(data.version, JSON.parse(body));
+}
+
+async function pushSession(retry = true) {
+    if (sessionVersion === null || !syncedWorkflow) return saveSessionFull();
+    const snapshot = JSON.parse(JSON.stringify(loadedWorkflow));
+    const ops = diffOps(syncedWorkflow, snapshot);
+    if (ops.length === 0) return;
+    const res = await fetch('/mini/session/patch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ base_version: sessionVersion, ops })
+    });
+    const data = await res.json();
+    if (res.status === 409) {
+        if (retry && await rebaseSession()) return pushSession(false);
+        logTerminal(`Not saved: session was changed on another device (v${data.version})`, "error");
+        return;
+    }
+    if (!res.ok) throw new Error(data.error || `Server Error ${res.status}`);
+    markSynced(data.version, snapshot);
+}
+
+function applyOps(doc, ops) {
+    for (const op of ops) {
+        const parts = op.path.slice(1).split('/').map(p => p.replace(/~1/g, '/').replace(/~0/g, '~'));
+        const key = parts.pop();
+        let parent = doc;
+        for (const p of parts) {
+            if (parent[p] === null || typeof parent[p] !== 'object') parent[p] = {};
+            parent = parent[p];
+        }
+        if (op.op === 'remove') delete parent[key];
+        else parent[key] = JSON.parse(JSON.stringify(op.value));
+    }
+    return doc;
+}
+
+function valueAt(doc, path) {
+    let cur = doc;
+    for (const p of path.slice(1).split('/').map(p => p.replace(/~1/g, '/').replace(/~0/g, '~'))) {
+        if (cur === null || typeof cur !== 'object' || !(p in cur)) return undefined;
+        cur = cur[p];
+    }
+    return cur;
+}
+
+// Another device changed the session: replay this screen's unsynced edits on top of its version.
+// Edits that touched a value the other device also changed are kept only if the user says so.
+// Returns false if the session couldn't be fetched.
+async function rebaseSession() {
+    const res = await fetch('/mini/workflow.json', { cache: 'no-cache' });
+    const version = res.headers.get('X-Mini-Version');
+    if (!res.ok || version === null) return false;
+    const remote = await res.json();
+    const ops = diffOps(syncedWorkflow, loadedWorkflow);
+    const changed = (op) => JSON.stringify(valueAt(remote, op.path)) !== JSON.stringify(valueAt(syncedWorkflow, op.path));
+    const clashes = ops.filter(changed);
+    const keepMine = clashes.length === 0 || confirm(
+        `This workflow was changed on another device.\n${clashes.length} of your edits touch the same settings.\n\nOK: keep your values\nCancel: take the other device's values`);
+    loadedWorkflow = applyOps(JSON.parse(JSON.stringify(remote)), keepMine ? ops : ops.filter(op => !changed(op)));
+    markSynced(Number(version), remote);
+    logTerminal(`Merged changes from another device (v${version})`, "info");
+    renderControls();
+    return true;
+}
+
 async function saveGroups() {
     console.log("Saving groups...");
     try {
@@ -495,16 +616,17 @@ function renameGroup(id) {
 
 export async function getObjectInfo(nodeClass) {
     if (objectInfo[nodeClass]) return objectInfo[nodeClass];
+    await fetchObjectInfo([nodeClass]);
+    return objectInfo[nodeClass] || null;
+}
+
+// Schemas for just the given classes, from the server-side cache (gzip + ETag)
+async function fetchObjectInfo(classes) {
     try {
-        const res = await fetch(`/object_info/${nodeClass}`);
-        if (!res.ok) return null;
-        const data = await res.json();
-        if (data[nodeClass]) {
-            objectInfo[nodeClass] = data[nodeClass];
-            return data[nodeClass];
-        }
-        return null;
-    } catch (e) { return null; }
+        const res = await fetch(`/mini/object_info?classes=${encodeURIComponent(classes.join(','))}`);
+        if (!res.ok) return;
+        Object.assign(objectInfo, await res.json());
+    } catch (e) { console.error('[app] object_info fetch failed:', e.message); }
 }
 
 async function checkBackendForNodes() {
@@ -518,16 +640,9 @@ async function checkBackendForNodes() {
         }
     }
     
-    const promises = [];
     console.log(`[DEBUG] Checking backend for ${neededTypes.size} unique node types...`);
-    
-    for (const type of neededTypes) {
-        if (!objectInfo[type]) {
-            console.log(`[DEBUG] Fetching info for missing type: ${type}`);
-            promises.push(getObjectInfo(type));
-        }
-    }
-    if (promises.length > 0) await Promise.all(promises);
+    const missing = [...neededTypes].filter(type => !objectInfo[type]);
+    if (missing.length > 0) await fetchObjectInfo(missing);
     
     // Final check
     neededTypes.forEach(type => {
@@ -539,8 +654,8 @@ async function checkBackendForNodes() {
 async function loadSharedComponents() {
     try {
         const [headerRes, footerRes] = await Promise.all([
-            fetch('/mini/shared/header.html?t=' + Date.now()),
-            fetch('/mini/shared/footer.html?t=' + Date.now())
+            fetch('/mini/shared/header.html'),
+            fetch('/mini/shared/footer.html')
         ]);
 
         if (headerRes.ok) {
@@ -577,28 +692,28 @@ async function init() {
     connectWS();
     await loadSharedComponents();
     try {
-        const infoRes = await fetch('/object_info');
-        if(infoRes.ok) objectInfo = await infoRes.json();
-
         // --- 1. DETERMINE SOURCE ---
         const urlParams = new URLSearchParams(window.location.search);
         const specificFile = urlParams.get('file');
 
-        let wfUrl = '/mini/workflow.json?t=' + Date.now(); // Default: Resume session
-        let groupsUrl = '/mini/load_groups?t=' + Date.now();
+        let wfUrl = '/mini/workflow.json'; // Default: Resume session
+        let groupsUrl = '/mini/load_groups'; // Data routes revalidate by ETag, no cache busting needed
         
         if (specificFile) {
             console.log(`[Init] Loading specific workflow: ${specificFile}`);
             // Load the specific file content directly from the Workflows folder
-            wfUrl = `/mini/get_workflow?filename=${encodeURIComponent(specificFile)}&t=${Date.now()}`;
+            wfUrl = `/mini/get_workflow?filename=${encodeURIComponent(specificFile)}`;
             // Load groups for this specific file
-            groupsUrl = `/mini/load_groups?filename=${encodeURIComponent(specificFile)}&t=${Date.now()}`;
+            groupsUrl = `/mini/load_groups?filename=${encodeURIComponent(specificFile)}`;
         }
 
         // --- 2. FETCH DATA ---
-        const wfRes = await fetch(wfUrl, { headers: { 'Cache-Control': 'no-cache' } });
+        const wfRes = await fetch(wfUrl, { cache: 'no-cache' });
         if(wfRes.ok) loadedWorkflow = await wfRes.json();
         if (!loadedWorkflow || typeof loadedWorkflow !== 'object') loadedWorkflow = {};
+        if (!specificFile && wfRes.headers.get('X-Mini-Version') !== null) {
+            markSynced(Number(wfRes.headers.get('X-Mini-Version')));
+        }
 
         // Debug Log
         console.log(`[DEBUG] Loaded ${specificFile || "Session"} keys:`, Object.keys(loadedWorkflow));
@@ -606,7 +721,7 @@ async function init() {
         await checkBackendForNodes();
 
         // Load config files
-        loadedLayout = await safeFetch('/mini/layout.json?t=' + Date.now(), []);
+        loadedLayout = await safeFetch('/mini/layout.json', []);
         customGroups = await safeFetch(groupsUrl, []); 
         fooocusStyles = await safeFetch('/mini/fooocus_styles.json', []);
         
@@ -633,10 +748,7 @@ async function init() {
             if (!loadedWorkflow._mini_origin) loadedWorkflow._mini_origin = specificFile;
             // Trigger a silent save to overwrite workflow.json with what we just loaded
             saveGroups(); 
-            fetch('/mini/save_workflow', { 
-                method: 'POST', 
-                body: JSON.stringify(loadedWorkflow) 
-            });
+            saveSessionFull();
         }
 
         logTerminal(`Loaded ${Object.keys(loadedWorkflow).length} nodes${specificFile ? ` from ${specificFile}` : ''}`, "info");
@@ -712,6 +824,7 @@ export function handleImageUpload(nodeId, inputKey, statusElement, inputElement,
             if (xhr.status === 200) {
                 const data = JSON.parse(xhr.responseText);
                 const filename = data.name; 
+                inputVersions[filename] = Date.now(); // overwrite=true may have replaced a cached image
 
                 // 4. Success State & Dropdown Handling
                 if (inputElement.tagName === 'SELECT') {
@@ -806,9 +919,25 @@ function setupMainPageModal() {
 }
 
 // --- WEBSOCKET & HANDLERS ---
-function connectWS() {
+// /mini/ws relays ComfyUI's socket with previews and progress sized for this device (see relay.py)
+export function relaySocketUrl(id, caps = {}) {
     const proto = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    socket = new WebSocket(`${proto}//${window.location.host}/ws?clientId=${clientId}`);
+    const conn = navigator.connection || {};
+    const slow = conn.saveData || ['slow-2g', '2g', '3g'].includes(conn.effectiveType);
+    const small = window.matchMedia('(max-width: 768px)').matches;
+    const params = new URLSearchParams({
+        clientId: id,
+        max_preview: slow ? 256 : small ? 512 : 1024,
+        fps: slow ? 1 : small ? 3 : 8,
+        progress_ms: slow ? 1000 : 250,
+        quality: slow ? 60 : 75,
+        ...caps,
+    });
+    return `${proto}//${window.location.host}/mini/ws?${params}`;
+}
+
+function connectWS() {
+    socket = new WebSocket(relaySocketUrl(clientId, { drop: 'kaytool.resources,crystools.monitor' }));
     socket.binaryType = "arraybuffer";
     socket.onopen = () => {
         if(els.dot) { els.dot.classList.replace('bg-red-500', 'bg-green-500'); els.dot.classList.add('shadow-green-500'); }
@@ -918,11 +1047,7 @@ async function updateNodeDisplay(nodeId, newData) {
     if (hasChanges) {
         console.log("[Auto-Save] Saving dynamic updates...");
         try {
-            await fetch('/mini/save_workflow', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(loadedWorkflow)
-            });
+            await pushSession();
         } catch(e) { 
             console.error("Failed to auto-save dynamic updates", e); 
         }
@@ -979,7 +1104,7 @@ async function handleMsg(msg) {
             const img = msg.data.output.images[0];
             logTerminal(`Image generated: ${img.filename}`, "success");
             if(els.result) {
-                els.result.src = `/view?filename=${img.filename}&subfolder=${img.subfolder}&type=${img.type}&t=${Date.now()}`;
+                els.result.src = `/view?filename=${encodeURIComponent(img.filename)}&subfolder=${encodeURIComponent(img.subfolder)}&type=${img.type}&v=${msg.data.prompt_id || ''}`;
                 els.result.classList.remove('opacity-50');
                 if(els.empty) els.empty.classList.add('hidden');
             }
@@ -1333,14 +1458,14 @@ async function renderControls() {
                 // Thumbnail preview (always render if filename exists)
                 if (imageFilename) {
                     const imgEl = document.createElement('img');
-                    imgEl.src = `/view?filename=${encodeURIComponent(imageFilename)}&type=input&t=${Date.now()}`;
+                    imgEl.src = inputImageUrl(imageFilename);
                     imgEl.alt = imageFilename;
                     imgEl.loading = 'lazy';
                     imgEl.decoding = 'async';
                     imgEl.style.cssText = `width:48px;height:48px;object-fit:cover;border-radius:6px;border:1.5px solid #3f3f46;cursor:pointer;background:#09090b;display:block;flex-shrink:0;`;
 
                     imgEl.onerror = () => { showGroupImageNotFoundIndicator(inputRef.nodeId, inputRef.key); };
-                    imgEl.onclick = (e) => { e.stopPropagation(); openModal(`/view?filename=${encodeURIComponent(imageFilename)}&type=input&t=${Date.now()}`); };
+                    imgEl.onclick = (e) => { e.stopPropagation(); openModal(inputImageUrl(imageFilename)); };
 
                     thumbContainer.appendChild(imgEl);
                 }
@@ -1354,20 +1479,15 @@ async function renderControls() {
                 let options3 = [];
                 
                 try {
-                    const imgListRes3 = await fetch('/object_info/LoadImage');
+                    const imgListRes3 = await fetch('/mini/input_images');
                     if (imgListRes3.ok) {
                         // Check for auth-protected responses that return HTML instead of JSON
                         const ct = imgListRes3.headers.get('content-type') || '';
                         if (!ct.includes('application/json')) throw new Error('Auth required');
-                        const infoData3 = await imgListRes3.json();
-                        const raw = infoData3?.LoadImage?.input?.required?.image;
-                        if (Array.isArray(raw)) {
-                            // ComfyUI format: [0] is the option list, [1] may be "IMAGE" type hint
-                            options3 = Array.isArray(raw[0]) ? raw[0] : [];
-                        } else if (raw && typeof raw === 'object' && Array.isArray(raw.options)) {
-                            options3 = raw.options;
-                        }
-                        if (options3.length === 0) console.warn('[app] LoadImage options empty:', JSON.stringify(infoData3).substring(0, 500));
+                        const list3 = await imgListRes3.json();
+                        options3 = list3.images || [];
+                        Object.assign(inputVersions, list3.versions || {});
+                        if (options3.length === 0) console.warn('[app] LoadImage options empty');
                         await populateImageSelect(selectEl3, options3, imageFilename);
                     } else {
                         // Fallback: populate with just the current filename so user has something to see
@@ -1393,7 +1513,7 @@ async function renderControls() {
                             });
                             if (bridgeRes.ok) {
                                 const bridgeData = await bridgeRes.json();
-                                const newFile = bridgeData.file;
+                                const newFile = bridgeData.filename;
                                 if (newFile) {
                                     originalNode.inputs[inputRef.key] = newFile;
                                     await populateImageSelect(selectEl3, options3, newFile);
@@ -1627,14 +1747,14 @@ async function renderControls() {
                     // Thumbnail preview (always render if filename exists)
                     if (val) {
                         const imgEl2 = document.createElement('img');
-                        imgEl2.src = `/view?filename=${encodeURIComponent(val)}&type=input&t=${Date.now()}`;
+                        imgEl2.src = inputImageUrl(val);
                         imgEl2.alt = val;
                         imgEl2.loading = 'lazy';
                         imgEl2.decoding = 'async';
                         imgEl2.style.cssText = `width:48px;height:48px;object-fit:cover;border-radius:6px;border:1.5px solid #3f3f46;cursor:pointer;background:#09090b;display:block;flex-shrink:0;`;
 
                         imgEl2.onerror = () => { showImageNotFoundIndicator(item.id, val); };
-                        imgEl2.onclick = (e) => { e.stopPropagation(); openModal(`/view?filename=${encodeURIComponent(val)}&type=input&t=${Date.now()}`); };
+                        imgEl2.onclick = (e) => { e.stopPropagation(); openModal(inputImageUrl(val)); };
 
                         thumbWrap.appendChild(imgEl2);
                     }
@@ -1647,19 +1767,15 @@ async function renderControls() {
                     let options4 = [];
                     
                     try {
-                        const imgListRes4 = await fetch('/object_info/LoadImage');
+                        const imgListRes4 = await fetch('/mini/input_images');
                         if (imgListRes4.ok) {
                             // Check for auth-protected responses that return HTML instead of JSON
                             const ct4 = imgListRes4.headers.get('content-type') || '';
                             if (!ct4.includes('application/json')) throw new Error('Auth required');
-                            const infoData4 = await imgListRes4.json();
-                            const raw4 = infoData4?.LoadImage?.input?.required?.image;
-                            if (Array.isArray(raw4)) {
-                                options4 = Array.isArray(raw4[0]) ? raw4[0] : [];
-                            } else if (raw4 && typeof raw4 === 'object' && Array.isArray(raw4.options)) {
-                                options4 = raw4.options;
-                            }
-                            if (options4.length === 0) console.warn('[app] LoadImage options empty:', JSON.stringify(infoData4).substring(0, 500));
+                            const list4 = await imgListRes4.json();
+                            options4 = list4.images || [];
+                            Object.assign(inputVersions, list4.versions || {});
+                            if (options4.length === 0) console.warn('[app] LoadImage options empty');
                             await populateImageSelect(selectStandalone, options4, val);
                         } else {
                             if (val) {
@@ -1684,7 +1800,7 @@ async function renderControls() {
                                 });
                                 if (bridgeRes.ok) {
                                     const bridgeData = await bridgeRes.json();
-                                    const newFile = bridgeData.file;
+                                    const newFile = bridgeData.filename;
                                     if (newFile) {
                                         node.inputs[key] = newFile;
                                         await populateImageSelect(selectStandalone, options4, newFile);
@@ -1877,59 +1993,49 @@ async function run() {
     if(els.loading) els.loading.classList.remove('hidden');
     if(els.progress) els.progress.innerText = '0%';
 
-    // 1. UPDATE STATE & SAVE
-    for (let id in loadedWorkflow) {
-        const node = loadedWorkflow[id];
-        if (!node || typeof node !== 'object') continue;
-        if (node.class_type === 'KSampler' && node.inputs && node.inputs.seed !== undefined) {
-            node.inputs.seed = Math.floor(Math.random() * 10000000000);
-        }
-    }
-    // ADDED: Force save active workflow to disk before running
-    logTerminal("Saving workflow...");
-    await fetch('/mini/save_workflow', { 
-        method: 'POST', 
-        body: JSON.stringify(loadedWorkflow) 
-    });
-
-    await saveGroups(); 
-
-    // 2. PREPARE PAYLOAD
-    const apiPrompt = JSON.parse(JSON.stringify(loadedWorkflow));
-    for (let id in apiPrompt) {
-        const node = apiPrompt[id];
-        if (id.startsWith('_')) { delete apiPrompt[id]; continue; }
-        if (!node.class_type) { delete apiPrompt[id]; continue; }
-        if (node.class_type === 'MiniGroup' || node.class_type === 'Note' || node.class_type === 'AppInfo') {
-            delete apiPrompt[id];
-            continue;
-        }
-    }
-
-    // 3. META FORMAT (Fix for KeyError: 'nodes')
-    const metaWorkflow = { "nodes": [], "links": [], "groups": [], "version": 0.4 };
-    for (let [id, node] of Object.entries(loadedWorkflow)) {
-        const nodeForMeta = { id: Number(id), type: node.class_type, ...node };
-        metaWorkflow.nodes.push(nodeForMeta);
-    }
-
-    // 4. EXECUTE & CAPTURE ID
+    // 1. ONE ROUND TRIP: server randomizes seeds, compiles, queues, then saves session + groups behind the prompt
     try {
-        const payload = { 
-            client_id: clientId, 
-            prompt: apiPrompt,
-            extra_data: { extra_pnginfo: { workflow: metaWorkflow } }
-        };
+        let snapshot = JSON.parse(JSON.stringify(loadedWorkflow));
+        const payload = { client_id: clientId, groups: customGroups };
+        if (sessionVersion !== null && syncedWorkflow) {
+            // Only what changed since the last sync
+            payload.base_version = sessionVersion;
+            payload.ops = diffOps(syncedWorkflow, snapshot);
+        } else {
+            payload.workflow = snapshot;
+        }
 
-        console.log("[DEBUG] Sending Prompt:", payload);
-        const res = await fetch('/prompt', { 
+        console.log("[DEBUG] Sending Run:", payload);
+        const post = (body) => fetch('/mini/run', { 
             method: 'POST', 
-            body: JSON.stringify(payload) 
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(body) 
         });
+        let res = await post(payload);
+        let data = await res.json();
+        if (res.status === 409 && !data.prompt_id) {
+            // Another device saved first: merge its edits, then run the merged workflow
+            if (!await rebaseSession()) throw new Error("Session changed on another device and could not be reloaded");
+            snapshot = JSON.parse(JSON.stringify(loadedWorkflow));
+            res = await post({ client_id: clientId, groups: customGroups, base_version: sessionVersion, ops: diffOps(syncedWorkflow, snapshot) });
+            data = await res.json();
+        }
+        if (res.status === 409 && data.prompt_id) {
+            // Queued as shown, but another device saved meanwhile: keep our seeds, merge, then save on top of theirs
+            for (const [id, seed] of Object.entries(data.seeds || {})) {
+                if (loadedWorkflow[id] && loadedWorkflow[id].inputs) loadedWorkflow[id].inputs.seed = seed;
+            }
+            if (await rebaseSession()) await pushSession(false);
+        } else if (!res.ok) {
+            throw new Error(data.error || `Server Error ${res.status}`);
+        }
         
-        if (!res.ok) throw new Error(`Server Error ${res.status}`);
-        
-        const data = await res.json();
+        // Keep the seeds the server picked so the UI and the next save match what ran
+        for (const [id, seed] of Object.entries(data.seeds || {})) {
+            if (loadedWorkflow[id] && loadedWorkflow[id].inputs) loadedWorkflow[id].inputs.seed = seed;
+            if (snapshot[id] && snapshot[id].inputs) snapshot[id].inputs.seed = seed;
+        }
+        if (res.ok && data.version !== undefined) markSynced(data.version, snapshot);
         logTerminal(`Prompt queued (id: ${data.prompt_id})`, "info");
         console.log("[DEBUG] Run Started. Prompt ID:", data.prompt_id);
         
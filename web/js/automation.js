@@ -1,4 +1,4 @@
-import { createInputDOM, safeFetch, getObjectInfo, handleImageUpload, openModal, setupModalListeners, createStyleSelector } from './app.js';
+import { createInputDOM, safeFetch, getObjectInfo, handleImageUpload, openModal, setupModalListeners, createStyleSelector, relaySocketUrl } from './app.js';
 
 window.openModal = openModal;
 
@@ -24,6 +24,8 @@ let isRunning = false;
 let socket = null;
 let clientId = ([1e7]+-1e3+-4e3+-8e3+-1e11).replace(/[018]/g, c => (c ^ crypto.getRandomValues(new Uint8Array(1))[0] & 15 >> c / 4).toString(16));
 let currentStepIndex = -1;
+let activeRunId = null;
+let runOffset = 0; // queue index of the run's first step
 let latestRenderId = 0; 
 let fooocusStyles = []; 
 
@@ -31,8 +33,8 @@ let fooocusStyles = [];
 async function loadSharedComponents() {
     try {
         const [headerRes, footerRes] = await Promise.all([
-            fetch('/mini/shared/header.html?t=' + Date.now()),
-            fetch('/mini/shared/footer.html?t=' + Date.now())
+            fetch('/mini/shared/header.html'),
+            fetch('/mini/shared/footer.html')
         ]);
 
         if (headerRes.ok) {
@@ -67,6 +69,7 @@ async function loadSharedComponents() {
 
 async function init() {
     connectWS();
+    setupRunEvents();
     setupModalListeners(); 
     fooocusStyles = await safeFetch('/mini/fooocus_styles.json', []);
 
@@ -87,6 +90,7 @@ async function init() {
     els.savedSelector.onchange = loadSelectedAutomation;
     els.runBtn.onclick = runAll;
     els.stopBtn.onclick = stopRun;
+    await reattachActiveRun();
     await loadSharedComponents();
 }
 
@@ -442,230 +446,182 @@ function renderResultImage(container, src, isFinished) {
 }
 
 // --- EXECUTION ---
+// Runs happen on the server (/mini/automation/*); this page only follows them over SSE,
+// so a locked phone or closed tab no longer kills the chain.
+
+function serializeStep(step) {
+    return { filename: step.filename, connectedOutput: step.connectedOutput, connectedInput: step.connectedInput };
+}
 
 async function runAll() {
     if (automationQueue.length === 0 || isRunning) return;
     
-    // SAVE ALL CHANGES BEFORE RUNNING
+    // SAVE ALL CHANGES BEFORE RUNNING (the runner reads each step from the library)
     for (const step of automationQueue) {
         await saveStepToLibrary(step.filename, step.workflow);
     }
-
-    isRunning = true;
-    updateUIState();
-
-    for (let i = 0; i < automationQueue.length; i++) {
-        if (!isRunning) break;
-        currentStepIndex = i;
-        await executeStep(i);
-    }
-
-    isRunning = false;
-    currentStepIndex = -1;
-    updateUIState();
+    await startServerRun(automationQueue.map(serializeStep), 0);
 }
 
 async function runSingleStep(index) {
     if (isRunning) return;
     
-    // SAVE CHANGES BEFORE RUNNING
     const step = automationQueue[index];
+    await applyConnection(index);
+    // SAVE CHANGES BEFORE RUNNING
     await saveStepToLibrary(step.filename, step.workflow);
-
-    isRunning = true;
-    currentStepIndex = index;
-    updateUIState();
-    await executeStep(index);
-    isRunning = false;
-    currentStepIndex = -1;
-    updateUIState();
+    await startServerRun([{ filename: step.filename }], index);
 }
 
-async function executeStep(index) {
+// Single-step runs still take their input from the previous card's last result
+async function applyConnection(index) {
     const step = automationQueue[index];
-    
-    // --- CONNECTION LOGIC ---
-    if (index > 0 && step.connectedInput) {
-        const prevStep = automationQueue[index - 1];
-        
-        if (prevStep.connectedOutput) {
-            
-            let shouldBridge = false;
-            
-            if (prevStep.connectedOutput.special === 'IMAGE') {
-                shouldBridge = true;
-            } else if (prevStep.connectedOutput.key === 'filename_prefix') {
-                const prevNode = prevStep.workflow[prevStep.connectedOutput.nodeId];
-                if (prevNode && (prevNode.class_type.includes("Save") || prevNode.class_type === 'Save Image')) {
-                    shouldBridge = true;
-                }
-            }
-
-            if (shouldBridge) {
-                if (prevStep.outputImageMeta) {
-                    console.log(`[Automation] Bridging Image from Step ${index-1} to Step ${index}...`);
-                    try {
-                        const bridgeRes = await fetch('/mini/bridge_image', { 
-                            method: 'POST', 
-                            body: JSON.stringify(prevStep.outputImageMeta) 
-                        });
-                        
-                        if (bridgeRes.ok) {
-                            const bridgeData = await bridgeRes.json();
-                            const currNode = step.workflow[step.connectedInput.nodeId];
-                            if (currNode) {
-                                currNode.inputs[step.connectedInput.key] = bridgeData.filename;
-                                console.log(`[Automation] Image bridged successfully: ${bridgeData.filename}`);
-                            }
-                        } else {
-                            console.error("Bridge Image Failed");
-                        }
-                    } catch(e) { console.error("Bridge Error", e); }
-                } else {
-                    console.warn("Previous step selected for IMAGE bridge but no image meta found.");
-                }
-            }
-            // STANDARD VALUE PASSING
-            else {
-                const prevNode = prevStep.workflow[prevStep.connectedOutput.nodeId];
-                if (prevNode) {
-                    const valToPass = prevNode.inputs[prevStep.connectedOutput.key];
-                    if (valToPass !== undefined) {
-                        const currNode = step.workflow[step.connectedInput.nodeId];
-                        if (currNode) {
-                            currNode.inputs[step.connectedInput.key] = valToPass;
-                            console.log(`[Automation] Passed value '${valToPass}' from Step ${index-1} to Step ${index}`);
-                        }
-                    }
-                }
-            }
-        }
+    if (index === 0 || !step.connectedInput) return;
+    const prevStep = automationQueue[index - 1];
+    if (!prevStep.connectedOutput) return;
+    const currNode = step.workflow[step.connectedInput.nodeId];
+    if (!currNode) return;
+
+    let shouldBridge = prevStep.connectedOutput.special === 'IMAGE';
+    if (!shouldBridge && prevStep.connectedOutput.key === 'filename_prefix') {
+        const prevNode = prevStep.workflow[prevStep.connectedOutput.nodeId];
+        shouldBridge = !!(prevNode && prevNode.class_type.includes("Save"));
     }
 
-    step.status = 'running';
-    step.outputImage = null; 
-    step.outputImageMeta = null;
-    step.isFinished = false;
-
-    renderQueue(); 
-
-    els.status.innerText = `Running Step ${index+1}: ${step.filename}...`;
-    els.overlay.classList.remove('hidden');
-
-    const apiPrompt = JSON.parse(JSON.stringify(step.workflow));
-    for (let id in apiPrompt) {
-        const node = apiPrompt[id];
-        if (id.startsWith('_') || !node.class_type || node.class_type === 'MiniGroup') {
-            delete apiPrompt[id];
-        }
-        if (node.class_type === 'KSampler' && node.inputs && node.inputs.seed) {
-            node.inputs.seed = Math.floor(Math.random() * 10000000000);
-        }
+    if (shouldBridge) {
+        if (!prevStep.outputImageMeta) return console.warn("Previous step selected for IMAGE bridge but no image meta found.");
+        // Only the image that feeds the input goes over: the run's last image, the same one the server runner bridges
+        const images = [prevStep.outputImageMeta];
+        try {
+            const bridgeRes = await fetch('/mini/bridge_images', { method: 'POST', body: JSON.stringify({ images }) });
+            if (!bridgeRes.ok) return console.error("Bridge Image Failed");
+            const { results } = await bridgeRes.json();
+            if (results[0].error) return console.error("Bridge Image Failed:", results[0].error);
+            currNode.inputs[step.connectedInput.key] = results[0].filename;
+            console.log(`[Automation] Bridged input: ${results[0].filename} (${results[0].method})`);
+        } catch(e) { console.error("Bridge Error", e); }
+    } else {
+        const prevNode = prevStep.workflow[prevStep.connectedOutput.nodeId];
+        const valToPass = prevNode ? prevNode.inputs[prevStep.connectedOutput.key] : undefined;
+        if (valToPass !== undefined) currNode.inputs[step.connectedInput.key] = valToPass;
     }
+}
 
+async function startServerRun(steps, offset) {
     try {
-        const payload = { client_id: clientId, prompt: apiPrompt };
-        const res = await fetch('/prompt', { method: 'POST', body: JSON.stringify(payload) });
-        if (!res.ok) throw new Error("API Error");
-        
+        const res = await fetch('/mini/automation/start', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ name: steps.length === 1 ? steps[0].filename : 'Queue', queue: steps, client_id: clientId })
+        });
         const data = await res.json();
-        const promptId = data.prompt_id;
-
-        await new Promise((resolve, reject) => {
-            const checkInterval = setInterval(() => {
-                if (!isRunning) { clearInterval(checkInterval); reject("Stopped"); }
-            }, 100);
-
-            const handler = (e) => {
-                try {
-                    if (e.data instanceof ArrayBuffer) {
-                        const blob = new Blob([e.data.slice(8)], { type: 'image/jpeg' });
-                        const url = URL.createObjectURL(blob);
-                        step.outputImage = url;
-                        step.isFinished = false;
-                        const cont = document.getElementById(`result-container-${index}`);
-                        if(cont) renderResultImage(cont, url, false);
-                        return;
-                    }
+        if (!res.ok) throw new Error(data.error || "API Error");
+        followRun(data.run, offset);
+    } catch (e) {
+        console.error(e);
+        els.status.innerText = "Error: " + e.message;
+        els.overlay.classList.remove('hidden');
+    }
+}
 
-                    const msg = JSON.parse(e.data);
-                    if (msg.type === 'executed' && msg.data.output.images) {
-                        const img = msg.data.output.images[0];
-                        const url = `/view?filename=${img.filename}&subfolder=${img.subfolder}&type=${img.type}&t=${Date.now()}`;
-                        step.outputImage = url;
-                        step.outputImageMeta = img; // Store meta for bridging
-                        step.isFinished = true;
-                        const cont = document.getElementById(`result-container-${index}`);
-                        if(cont) renderResultImage(cont, url, true);
-                    }
+function followRun(run, offset) {
+    activeRunId = run.run_id;
+    runOffset = offset;
+    isRunning = true;
+    for (let j = 0; j < run.steps.length; j++) {
+        const step = automationQueue[offset + j];
+        if (!step) continue;
+        step.status = 'pending'; step.outputImage = null; step.outputImageMeta = null; step.isFinished = false;
+    }
+    updateUIState();
+    applyRunState(run);
+}
 
-                    if (msg.type === 'status' && msg.data.status.exec_info.queue_remaining === 0) {
-                        socket.removeEventListener('message', handlerWrapper);
-                        clearInterval(checkInterval);
-                        resolve();
-                    }
-                } catch(err) {}
-            };
-            const handlerWrapper = (e) => handler(e);
-            socket.addEventListener('message', handlerWrapper);
-        });
+const STEP_STATUS = { running: 'running', done: 'done', error: 'error', cancelled: 'error' };
 
-        step.status = 'done';
-        await updateStepFromHistory(index, promptId);
-        
-        // SAVE FINAL STATE (Seeds, Bridged inputs)
-        await saveStepToLibrary(step.filename, step.workflow);
+async function applyRunState(run) {
+    if (run.run_id !== activeRunId) return;
+    let changed = false;
 
-    } catch (e) {
-        console.error(e);
-        step.status = 'error';
-        els.status.innerText = "Error in Step " + (index+1);
+    for (let j = 0; j < run.steps.length; j++) {
+        const s = run.steps[j];
+        const index = runOffset + j;
+        const step = automationQueue[index];
+        if (!step || step.filename !== s.filename) continue;
+
+        const status = STEP_STATUS[s.state] || 'pending';
+        if (status === 'running') {
+            currentStepIndex = index;
+            els.status.innerText = `Running Step ${index+1}: ${step.filename}... ${Math.round(s.progress * 100)}%`;
+        }
+        if (status === step.status) continue;
+        step.status = status;
+        changed = true;
+
+        if (status === 'done') {
+            const img = s.images[0];
+            if (img) {
+                step.outputImage = `/view?filename=${encodeURIComponent(img.filename)}&subfolder=${encodeURIComponent(img.subfolder)}&type=${img.type}&v=${s.prompt_id || ''}`;
+                step.outputImageMeta = img; // The runner's last image; kept for single-step bridging
+                step.isFinished = true;
+            }
+            // The runner saved bridged inputs and text outputs back to the library
+            const fresh = await safeFetch(`/mini/get_workflow?filename=${encodeURIComponent(step.filename)}`, null);
+            if (fresh) step.workflow = fresh;
+        }
     }
-    
-    renderQueue();
+
+    if (!['queued', 'running'].includes(run.state)) {
+        if (run.state === 'error') els.status.innerText = "Error: " + (run.error || "run failed");
+        console.log(`[Automation] Run ${run.run_id} ${run.state}`);
+        activeRunId = null;
+        isRunning = false;
+        currentStepIndex = -1;
+        updateUIState();
+        if (run.state === 'error') els.overlay.classList.remove('hidden');
+    } else {
+        els.overlay.classList.remove('hidden');
+    }
+    if (changed) renderQueue();
 }
 
-async function updateStepFromHistory(stepIndex, promptId) {
-    try {
-        const res = await fetch(`/history/${promptId}`);
-        if (!res.ok) return;
-        const history = await res.json();
-        const runData = history[promptId];
-        if (!runData || !runData.outputs) return;
-
-        const card = document.getElementById(`step-card-${stepIndex}`);
-        if(!card) return;
-        const inputs = card.querySelectorAll('input, textarea, select');
-        
-        const updateInput = (nodeId, key, val) => {
-            const target = Array.from(inputs).find(el => el.dataset.node == nodeId && el.dataset.key == key);
-            if (target) {
-                target.value = val;
-                target.classList.add('bg-blue-900/50', 'text-white');
-                setTimeout(() => target.classList.remove('bg-blue-900/50', 'text-white'), 1000);
-                const step = automationQueue[stepIndex];
-                if(step.workflow[nodeId] && step.workflow[nodeId].inputs) {
-                    step.workflow[nodeId].inputs[key] = val;
-                }
-            }
-        };
+function setupRunEvents() {
+    const source = new EventSource('/mini/events?topics=automation');
+    source.addEventListener('automation', (e) => {
+        try { applyRunState(JSON.parse(e.data)); } catch (err) { console.error('[Automation] Bad event', err); }
+    });
+    // Events sent while disconnected are lost; resync from the status endpoint
+    source.onopen = async () => {
+        if (!activeRunId) return;
+        const run = await safeFetch(`/mini/automation/status?run_id=${activeRunId}`, null);
+        if (run) applyRunState(run);
+    };
+}
 
-        for (const [nodeId, outputs] of Object.entries(runData.outputs)) {
-            for (const [key, val] of Object.entries(outputs)) {
-                if(key === 'images') continue;
-                let valToSet = Array.isArray(val) ? val[0] : val;
-                if (typeof valToSet === 'object') continue;
-                updateInput(nodeId, key, valToSet);
-                if (key === 'text') updateInput(nodeId, 'text_0', valToSet);
-            }
+// Picks up a run that was started before this page was (re)opened
+async function reattachActiveRun() {
+    const res = await safeFetch('/mini/automation/runs', { runs: [] });
+    const active = (res.runs || []).find(r => r.state === 'queued' || r.state === 'running');
+    if (!active || automationQueue.length > 0) return;
+    const run = await safeFetch(`/mini/automation/status?run_id=${active.run_id}`, null);
+    if (!run) return;
+
+    for (const item of run.steps) {
+        await addToQueue(item.filename);
+        const lastIdx = automationQueue.length - 1;
+        if (lastIdx >= 0) {
+            automationQueue[lastIdx].connectedOutput = item.connectedOutput;
+            automationQueue[lastIdx].connectedInput = item.connectedInput;
         }
-    } catch(e) { console.error("History update failed", e); }
+    }
+    console.log(`[Automation] Reattached to run ${run.run_id}`);
+    followRun(run, 0);
 }
 
 function stopRun() {
-    isRunning = false;
-    fetch('/interrupt', { method: 'POST' });
-    updateUIState();
+    if (activeRunId) {
+        fetch('/mini/automation/cancel', { method: 'POST', body: JSON.stringify({ run_id: activeRunId }) });
+    }
 }
 
 function updateUIState() {
@@ -684,9 +640,19 @@ function updateUIState() {
 }
 
 function connectWS() {
-    const proto = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    socket = new WebSocket(`${proto}//${window.location.host}/ws?clientId=${clientId}`);
+    // Runs are queued with this clientId, so live previews still arrive here; progress comes over SSE
+    socket = new WebSocket(relaySocketUrl(clientId, { json: 0 }));
     socket.binaryType = "arraybuffer"; 
+    socket.onmessage = (e) => {
+        if (!(e.data instanceof ArrayBuffer) || currentStepIndex < 0) return;
+        const step = automationQueue[currentStepIndex];
+        if (!step || step.isFinished) return;
+        const url = URL.createObjectURL(new Blob([e.data.slice(8)], { type: 'image/jpeg' }));
+        if (step.outputImage && step.outputImage.startsWith('blob:')) URL.revokeObjectURL(step.outputImage);
+        step.outputImage = url;
+        const cont = document.getElementById(`result-container-${currentStepIndex}`);
+        if (cont) renderResultImage(cont, url, false);
+    };
     socket.onopen = () => { if(els.dot) els.dot.classList.replace('bg-red-500', 'bg-green-500'); };
     socket.onclose = () => { 
         if(els.dot) els.dot.classList.replace('bg-green-500', 'bg-red-500'); 
@@ -4,15 +4,19 @@ const els = {
     fileInput: document.getElementById('file-upload'),
     loading: document.getElementById('loading'),
     empty: document.getElementById('empty-msg'),
-    status: document.getElementById('status-msg')
+    status: document.getElementById('status-msg'),
+    search: document.getElementById('search-input'),
+    sort: document.getElementById('sort-select')
 };
+let searchTimer = null;
+let libraryController = null;
 
 // --- SHARED COMPONENT LOADER ---
 async function loadSharedComponents() {
     try {
         const [headerRes, footerRes] = await Promise.all([
-            fetch('/mini/shared/header.html?t=' + Date.now()),
-            fetch('/mini/shared/footer.html?t=' + Date.now())
+            fetch('/mini/shared/header.html'),
+            fetch('/mini/shared/footer.html')
         ]);
 
         if (headerRes.ok) {
@@ -48,35 +52,53 @@ async function loadSharedComponents() {
 async function init() {
     els.uploadBtn.onclick = () => els.fileInput.click();
     els.fileInput.onchange = handleUpload;
+    if (els.search) els.search.oninput = () => { clearTimeout(searchTimer); searchTimer = setTimeout(loadWorkflows, 200); };
+    if (els.sort) els.sort.onchange = loadWorkflows;
     await loadWorkflows();
     await loadSharedComponents();
 }
 
 async function loadWorkflows() {
+    // Search and sort can fire while a load is in flight: drop the older request and render only the latest
+    if (libraryController) libraryController.abort();
+    const controller = libraryController = new AbortController();
     els.loading.classList.remove('hidden');
-    els.grid.innerHTML = '';
     els.empty.classList.add('hidden');
 
     try {
-        const res = await fetch('/mini/list_workflows');
+        // One round trip: summaries, last run and latest output for every workflow
+        const [sort, order] = (els.sort?.value || 'mtime:desc').split(':');
+        const params = new URLSearchParams({ q: els.search?.value.trim() || '', sort, order });
+        const res = await fetch(`/mini/library?${params}`, { signal: controller.signal });
         const data = await res.json();
-        
+        if (controller !== libraryController) return;
+
+        els.grid.innerHTML = '';
         if (!data.workflows || data.workflows.length === 0) {
             els.empty.classList.remove('hidden');
-            els.loading.classList.add('hidden');
             return;
         }
         renderGrid(data.workflows);
     } catch (e) {
+        if (controller !== libraryController) return;
         console.error(e);
         els.status.innerText = "Error loading library";
     } finally {
-        els.loading.classList.add('hidden');
+        if (controller === libraryController) els.loading.classList.add('hidden');
     }
 }
 
-function renderGrid(files) {
-    files.forEach(filename => {
+function timeAgo(seconds) {
+    const diff = Date.now() / 1000 - seconds;
+    if (diff < 60) return 'just now';
+    if (diff < 3600) return `${Math.floor(diff / 60)}m ago`;
+    if (diff < 86400) return `${Math.floor(diff / 3600)}h ago`;
+    return `${Math.floor(diff / 86400)}d ago`;
+}
+
+function renderGrid(entries) {
+    entries.forEach(entry => {
+        const filename = entry.filename;
         const card = document.createElement('div');
         card.className = "compact-card p-3 cursor-pointer group relative flex flex-col aspect-[4/3] justify-between hover:border-blue-500/50";
         
@@ -110,16 +132,30 @@ function renderGrid(files) {
         };
         card.appendChild(delBtn);
 
-        // --- ICON ---
+        // --- ICON (latest output when there is one) ---
         const iconDiv = document.createElement('div');
-        iconDiv.className = "flex-1 flex items-center justify-center text-zinc-700 group-hover:text-zinc-500 transition-colors";
-        iconDiv.innerHTML = `<svg class="w-8 h-8" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="1.5" d="M19 11H5m14 0a2 2 0 012 2v6a2 2 0 01-2 2H5a2 2 0 01-2-2v-6a2 2 0 012-2m14 0V9a2 2 0 00-2-2M5 11V9a2 2 0 012-2m0 0V5a2 2 0 012-2h6a2 2 0 012 2v2M7 7h10"></path></svg>`;
+        iconDiv.className = "flex-1 flex items-center justify-center text-zinc-700 group-hover:text-zinc-500 transition-colors min-h-0";
+        if (entry.thumbnail) {
+            const t = entry.thumbnail;
+            const img = document.createElement('img');
+            img.loading = 'lazy';
+            img.className = "max-h-full max-w-full object-contain rounded opacity-80 group-hover:opacity-100 transition-opacity";
+            img.src = `/mini/thumb?filename=${encodeURIComponent(t.filename)}&subfolder=${encodeURIComponent(t.subfolder)}&type=${t.type}&size=sm`;
+            iconDiv.appendChild(img);
+        } else iconDiv.innerHTML = `<svg class="w-8 h-8" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="1.5" d="M19 11H5m14 0a2 2 0 012 2v6a2 2 0 01-2 2H5a2 2 0 01-2-2v-6a2 2 0 012-2m14 0V9a2 2 0 00-2-2M5 11V9a2 2 0 012-2m0 0V5a2 2 0 012-2h6a2 2 0 012 2v2M7 7h10"></path></svg>`;
         
         // --- LABEL ---
         const label = document.createElement('div');
         label.className = "text-center w-full";
         const cleanName = filename.replace('.json', '');
         label.innerHTML = `<div class="text-[10px] font-bold text-zinc-400 truncate group-hover:text-blue-400 transition-colors">${cleanName}</div>`;
+        const stats = document.createElement('div');
+        stats.className = "text-[9px] text-zinc-600 truncate mt-0.5";
+        stats.textContent = entry.error ? 'Unreadable workflow'
+            : [`${entry.nodes} nodes`, `${entry.inputs} inputs`, entry.groups ? `${entry.groups} groups` : null,
+               entry.last_run ? `ran ${timeAgo(entry.last_run)}` : 'never run'].filter(Boolean).join(' · ');
+        label.appendChild(stats);
+        card.title = entry.classes.join(', ');
 
         card.append(iconDiv, label);
         
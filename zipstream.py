@@ -0,0 +1,224 @@
+import os
+import time
+import zlib
+import struct
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+CHUNK = 256 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+MAX_ENTRIES_16 = 0xFFFF
+FLAGS = 0x08 | 0x800  # sizes/CRC in a data descriptor, UTF-8 names
+MADE_BY = (3 << 8) | 45  # unix, spec 4.5
+EXTERNAL_ATTR = 0o100644 << 16
+CRC_CACHE_MAX = 20000
+
+_crc_cache = OrderedDict()  # (path, mtime_ns, size) -> crc32
+
+
+def _dos_time(mtime_ns):
+    t = time.localtime(mtime_ns / 1e9)
+    if t.tm_year < 1980: return 0, (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def _crc_file(path):
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk: return crc
+            crc = zlib.crc32(chunk, crc)
+
+def _read_at(path, offset, length):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+def unique_names(names):
+    """Archive names with duplicates suffixed ` (2)`, ` (3)`, ... before the extension."""
+    seen, out = set(), []
+    for name in names:
+        candidate, n = name, 2
+        while candidate.lower() in seen:
+            stem, ext = os.path.splitext(name)
+            candidate, n = f"{stem} ({n}){ext}", n + 1
+        seen.add(candidate.lower())
+        out.append(candidate)
+    return out
+
+
+class Member:
+    __slots__ = ("name", "src", "mtime_ns", "src_size", "path", "size", "crc", "offset")
+
+    def __init__(self, name, src, mtime_ns, src_size):
+        self.name = name.replace("\\", "/").lstrip("/")
+        self.src = src
+        self.mtime_ns = mtime_ns
+        self.src_size = src_size
+        self.path = None  # file whose bytes are stored: the source or its conversion
+        self.size = None
+        self.crc = None
+        self.offset = None
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP64_LIMIT
+
+    def local_header(self):
+        name = self.name.encode("utf-8")
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if self.zip64 else b""
+        size = ZIP64_LIMIT if self.zip64 else 0
+        t, d = _dos_time(self.mtime_ns)
+        return struct.pack("<IHHHHHIIIHH", 0x04034b50, 45 if self.zip64 else 20, FLAGS, 0, t, d, 0, size, size,
+                           len(name), len(extra)) + name + extra
+
+    def local_header_size(self):
+        return 30 + len(self.name.encode("utf-8")) + (20 if self.zip64 else 0)
+
+    def descriptor(self):
+        if self.zip64: return struct.pack("<IIQQ", 0x08074b50, self.crc, self.size, self.size)
+        return struct.pack("<IIII", 0x08074b50, self.crc, self.size, self.size)
+
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    def central_header(self):
+        name = self.name.encode("utf-8")
+        fields = []
+        if self.zip64: fields += [self.size, self.size]
+        if self.offset >= ZIP64_LIMIT: fields.append(self.offset)
+        extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+        size = ZIP64_LIMIT if self.zip64 else self.size
+        t, d = _dos_time(self.mtime_ns)
+        return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, MADE_BY, 45 if fields else 20, FLAGS, 0, t, d,
+                           self.crc or 0, size, size, len(name), len(extra), 0, 0, 0, EXTERNAL_ATTR,
+                           min(self.offset, ZIP64_LIMIT)) + name + extra
+
+
+class ZipStream:
+    """Uncompressed ZIP built on the fly from files on disk, with no temp file and any byte range servable.
+
+    Images are already compressed, so entries are STORED and the archive layout follows from
+    names and sizes alone: offsets, Content-Length and a Range slice can be computed without
+    reading data. CRCs go in data descriptors after each entry, so a full download reads
+    every file once; a resumed one only re-reads the CRCs it skipped (cached per file
+    version). `convert(member)` may return another file to store instead of the source
+    (a re-encoded image); its size is only known once it exists, so `prepare()` must run
+    before the total size is asked for. ZIP64 records are added only when sizes or offsets
+    need them.
+    """
+
+    def __init__(self, members, convert=None):
+        self.members = members
+        self.convert = convert
+        if convert is None:
+            for m in members: m.path, m.size = m.src, m.src_size
+
+    def etag(self, *variant):
+        h = hashlib.sha1(repr(variant).encode("utf-8"))
+        for m in self.members: h.update(f"\0{m.name}\0{m.src}\0{m.mtime_ns}\0{m.src_size}".encode("utf-8"))
+        return h.hexdigest()
+
+    @property
+    def sized(self):
+        return all(m.size is not None for m in self.members)
+
+    async def _prepare(self, m):
+        if m.size is not None: return
+        path = await self.convert(m)
+        m.path, m.size = path, (await asyncio.get_running_loop().run_in_executor(None, os.stat, path)).st_size
+
+    async def prepare(self):
+        """Sizes every member; conversions run concurrently, bounded by the converter's own pool."""
+        await asyncio.gather(*(self._prepare(m) for m in self.members))
+
+    def _layout(self):
+        pos = 0
+        for m in self.members:
+            m.offset = pos
+            pos += m.local_header_size() + m.size + m.descriptor_size()
+        return pos
+
+    def _tail(self, cd_offset, cd_size):
+        count = len(self.members)
+        out = b""
+        if count >= MAX_ENTRIES_16 or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            eocd64 = cd_offset + cd_size
+            out += struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, MADE_BY, 45, 0, 0, count, count, cd_size, cd_offset)
+            out += struct.pack("<IIQI", 0x07064b50, 0, eocd64, 1)
+        return out + struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, min(count, MAX_ENTRIES_16), min(count, MAX_ENTRIES_16),
+                                 min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0)
+
+    def total_size(self):
+        """Archive length. Needs prepare()."""
+        cd_offset = self._layout()
+        cd_size = sum(len(m.central_header()) for m in self.members)
+        return cd_offset + cd_size + len(self._tail(cd_offset, cd_size))
+
+    async def _crc(self, m):
+        key = (m.path, m.mtime_ns, m.size)
+        crc = _crc_cache.get(key)
+        if crc is None:
+            crc = await asyncio.get_running_loop().run_in_executor(None, _crc_file, m.path)
+            self._remember(key, crc)
+        m.crc = crc
+
+    @staticmethod
+    def _remember(key, crc):
+        _crc_cache[key] = crc
+        _crc_cache.move_to_end(key)
+        while len(_crc_cache) > CRC_CACHE_MAX: _crc_cache.popitem(last=False)
+
+    async def _data(self, m, start, end):
+        """Yields bytes [start, end) of the member's file; computes the CRC when the whole file is read."""
+        loop = asyncio.get_running_loop()
+        whole = start == 0 and end == m.size and m.crc is None
+        crc, pos = 0, start
+        while pos < end:
+            try: chunk = await loop.run_in_executor(None, _read_at, m.path, pos, min(CHUNK, end - pos))
+            except FileNotFoundError:
+                if m.path == m.src: raise
+                m.path = await self.convert(m)  # conversion evicted from its cache; re-encoding gives the same bytes
+                continue
+            if not chunk: raise IOError(f"{m.name} shrank while being archived")
+            if whole: crc = zlib.crc32(chunk, crc)
+            pos += len(chunk)
+            yield chunk
+        if whole:
+            m.crc = crc
+            self._remember((m.path, m.mtime_ns, m.size), crc)
+
+    async def chunks(self, start=0, end=None):
+        """Yields the archive bytes [start, end) (end=None: to the end), preparing members as it reaches them."""
+        end = float("inf") if end is None else end
+        pos = 0
+
+        def window(length):
+            lo, hi = max(start - pos, 0), min(end - pos, length)
+            return (lo, hi) if lo < hi else None
+
+        for m in self.members:
+            if pos >= end: return
+            await self._prepare(m)
+            m.offset = pos
+            part = window(m.local_header_size())
+            if part: yield m.local_header()[part[0]:part[1]]
+            pos += m.local_header_size()
+            part = window(m.size)
+            if part:
+                async for chunk in self._data(m, *part): yield chunk
+            pos += m.size
+            part = window(m.descriptor_size())
+            if part:
+                if m.crc is None: await self._crc(m)
+                yield m.descriptor()[part[0]:part[1]]
+            pos += m.descriptor_size()
+
+        if pos >= end: return
+        for m in self.members:
+            if m.crc is None: await self._crc(m)
+        central = b"".join(m.central_header() for m in self.members)
+        tail = central + self._tail(pos, len(central))
+        part = window(len(tail))
+        if part: yield tail[part[0]:part[1]]